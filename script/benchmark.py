@@ -0,0 +1,1283 @@
+# 规则处理性能基准测试
+#
+# 用法：
+#     python script/benchmark.py domains --sizes 10000 100000 1000000
+#     python script/benchmark.py wildcards --ratio 0.05
+#     python script/benchmark.py cidrs --sizes 10000 50000
+#     python script/benchmark.py fetch --latency 0.05 --failure-rate 0.1
+#     python script/benchmark.py deadline --deadline 2
+#     python script/benchmark.py pipeline --categories 12 --fixtures path/to/recorded
+#     python script/benchmark.py jobs --jobs 1 2 4 8
+#     python script/benchmark.py normalize --sizes 100000 1000000
+#     python script/benchmark.py sources --sizes 200000 1000000
+#     python script/benchmark.py exclusions --sizes 100000 --blacklist 10000
+#     python script/benchmark.py payload --sizes 100000 200000
+#     python script/benchmark.py dnsmasq --sizes 100000 200000
+#     python script/benchmark.py shadowrocket --sizes 20000 200000
+#     python script/benchmark.py unified --categories 12 --sources 40
+#     python script/benchmark.py mrs --sizes 100000 500000
+#     python script/benchmark.py singbox --sizes 100000 500000
+#     python script/benchmark.py xray --sizes 100000 500000
+#     python script/benchmark.py text --sizes 100000 500000
+#
+# 每个子命令都会生成可复现的随机数据，分别运行旧实现和新实现，
+# 校验两者输出一致后打印耗时对比。旧实现的复杂度较高，超过 --legacy-max
+# 的规模只运行新实现。
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import asyncio
+import hashlib
+import json
+import tempfile
+import tracemalloc
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import domain_router  # noqa: E402
+import mrs_rule_set  # noqa: E402
+import sing_box_rule_set  # noqa: E402
+import xray_geodata  # noqa: E402
+from succinct_set import build_succinct_set  # noqa: E402
+from ip_cidr import parse_cidr  # noqa: E402
+import generate_shadowrocket_conf  # noqa: E402
+from domain_filter import DomainExclusionIndex  # noqa: E402
+from yaml_payload import iter_payload, iter_raw_lines  # noqa: E402
+from dnsmasq_conf import build_conf_lines  # noqa: E402
+
+TLDS = ["com", "net", "org", "cn", "io", "jp", "hk", "dev", "co.uk", "com.cn"]
+
+def random_label(rng):
+    """
+    生成一个随机的域名标签。
+    """
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(rng.randint(3, 10)))
+
+def generate_domains(count, seed=2024, wildcard_ratio=0.0):
+    """
+    生成与上游规则集分布相近的域名条目：大多为 '+.' 后缀，其余为完整域名、
+    '.' 后缀以及少量通配符，并且存在大量相互覆盖的子域名。
+
+    参数：
+        count (int): 条目数量。
+        seed (int): 随机种子。
+        wildcard_ratio (float): 通配符条目所占比例。
+
+    返回：
+        list: 域名条目列表。
+    """
+    rng = random.Random(seed)
+    bases = [f"{random_label(rng)}.{rng.choice(TLDS)}" for _ in range(max(1, count // 4))]
+    domains = []
+    for _ in range(count):
+        domain = rng.choice(bases)
+        for _ in range(rng.choice((0, 0, 1, 1, 2, 3))):
+            domain = f"{random_label(rng)}.{domain}"
+        roll = rng.random()
+        if roll < wildcard_ratio:
+            labels = domain.split(".")
+            labels[rng.randrange(len(labels) - 1)] = "*"
+            domains.append(".".join(labels))
+        elif roll < 0.6:
+            domains.append(f"+.{domain}")
+        elif roll < 0.65:
+            domains.append(f".{domain}")
+        else:
+            domains.append(domain)
+    return domains
+
+def generate_cidrs(count, seed=2024, ipv6_ratio=0.2):
+    """
+    生成与国家 IP 列表分布相近的 CIDR 条目：大量相邻或重叠的网段，
+    以及一定比例的 IPv6 前缀。
+
+    参数：
+        count (int): 条目数量。
+        seed (int): 随机种子。
+        ipv6_ratio (float): IPv6 条目所占比例。
+
+    返回：
+        list: CIDR 字符串列表。
+    """
+    rng = random.Random(seed)
+    cidrs = []
+    for _ in range(count):
+        if rng.random() < ipv6_ratio:
+            prefixlen = rng.randint(28, 48)
+            address = (0x2400 << 112) | (rng.getrandbits(20) << 92)
+            cidrs.append(str(ipaddress.IPv6Network((address >> (128 - prefixlen) << (128 - prefixlen), prefixlen))))
+        else:
+            prefixlen = rng.randint(14, 24)
+            address = (rng.randint(1, 223) << 24) | (rng.getrandbits(12) << 12)
+            cidrs.append(str(ipaddress.IPv4Network((address >> (32 - prefixlen) << (32 - prefixlen), prefixlen))))
+    return cidrs
+
+def generate_upstream_lines(count, seed=2024):
+    """
+    生成与上游规则源格式相近的原始行：Clash YAML payload、Surge/Quantumult 风格规则、
+    纯域名列表、IP/CIDR 以及注释。
+
+    参数：
+        count (int): 行数。
+        seed (int): 随机种子。
+
+    返回：
+        list: 原始行列表。
+    """
+    rng = random.Random(seed)
+    domains = generate_domains(max(1, count // 2), seed=seed)
+    cidrs = generate_cidrs(max(1, count // 8), seed=seed)
+    keywords = ["DOMAIN-KEYWORD,google", "PROCESS-NAME,telegram", "GEOIP,CN", "DST-PORT,443", "IP-ASN,13335"]
+    lines = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.3:
+            lines.append(f"  - '{rng.choice(domains)}'")
+        elif roll < 0.5:
+            lines.append(f"DOMAIN-SUFFIX,{rng.choice(domains).lstrip('+.*')}")
+        elif roll < 0.65:
+            lines.append(rng.choice(domains).lstrip("+.*"))
+        elif roll < 0.8:
+            lines.append(rng.choice(cidrs))
+        elif roll < 0.88:
+            lines.append(f"IP-CIDR,{rng.choice(cidrs)},no-resolve")
+        elif roll < 0.95:
+            lines.append(rng.choice(keywords))
+        else:
+            lines.append(rng.choice(["# comment", "payload:", "  - '1.1.1.1'", "  - DOMAIN,example.com"]))
+    return lines
+
+SHADOWROCKET_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config", "my.shadowrocket")
+
+def generate_shadowrocket_lines(count, seed=2024, config=SHADOWROCKET_CONFIG):
+    """
+    将 my.shadowrocket 展开为约 count 条规则：保留各分组的标头和手写规则，
+    每个上游 URL 替换为若干生成的原始行，再经过与 main() 相同的预处理、分类和合法性检查。
+
+    参数：
+        count (int): 生成的原始行总数。
+        seed (int): 随机种子。
+        config (str): my.shadowrocket 路径。
+
+    返回：
+        list: 交给 filter_elements_by_valid_prefix 的行列表。
+    """
+    with open(config, "r", encoding="utf-8") as file:
+        raw_lines = generate_shadowrocket_conf.clean_content_lines(file.read())
+    urls = sum(1 for line in raw_lines if line.startswith(("http://", "https://")))
+    upstream = iter(generate_upstream_lines(count, seed=seed))
+    per_url = max(1, count // max(1, urls))
+    lines = []
+    for line in raw_lines:
+        if line.startswith(("http://", "https://")):
+            lines.extend(item.strip() for item in (next(upstream, None) for _ in range(per_url)) if item)
+        else:
+            lines.append(line)
+    lines = generate_shadowrocket_conf.preprocess_lines(lines)
+    return generate_shadowrocket_conf.process_ip_and_domains(lines)
+
+def legacy_filter_rules(lines):
+    """
+    规则记录化之前的 filter_elements_by_valid_prefix：逐个前缀调用 startswith，
+    直接把分组和 no-resolve 拼接到规则文本上。
+    """
+    valid_lines = []
+    current_group = None
+    for line in lines:
+        if line.startswith('[') and line.endswith(']'):
+            current_group = line[1:-1]
+            valid_lines.append(line)
+        elif any(line.startswith(prefix) for prefix in generate_shadowrocket_conf.VALID_PREFIXES):
+            if current_group:
+                if line.split(',')[0] in ['IP-CIDR', 'IP-CIDR6', 'GEOIP']:
+                    line = f"{line},{current_group},no-resolve"
+                else:
+                    line = f"{line},{current_group}"
+            valid_lines.append(line)
+    return valid_lines
+
+def legacy_sort_rules(lines):
+    """
+    规则记录化之前的 sort_rules：每次求排序键都用 list.index 查找类型并重新拆分字符串，
+    IP 规则每次都用 ipaddress 解析。
+    """
+    rule_order = list(generate_shadowrocket_conf.RULE_TYPES)
+
+    def ip_to_int(ip):
+        try:
+            return int(ipaddress.ip_address(ip.split('/')[0]))
+        except ValueError:
+            return 0
+
+    def sort_key(line):
+        rule_type = line.split(',')[0] if ',' in line else ''
+        try:
+            rule_index = rule_order.index(rule_type)
+        except ValueError:
+            rule_index = len(rule_order)
+        parts = line.split(',')
+        domain_or_ip = parts[1] if len(parts) > 1 else ''
+        if rule_type in ["DOMAIN-SUFFIX", "DOMAIN", "DOMAIN-KEYWORD", "DOMAIN-REGEX"]:
+            return (rule_index, len(domain_or_ip.split('.')), domain_or_ip)
+        elif rule_type in ["IP-CIDR", "IP-CIDR6"]:
+            return (rule_index, ip_to_int(domain_or_ip))
+        return (rule_index, domain_or_ip)
+
+    sorted_sections = []
+    current_section = []
+    for line in lines:
+        if line.startswith('[') and line.endswith(']'):
+            sorted_sections.extend(sorted(current_section, key=sort_key))
+            sorted_sections.append(line)
+            current_section = []
+        else:
+            current_section.append(line)
+    sorted_sections.extend(sorted(current_section, key=sort_key))
+    return sorted_sections
+
+def legacy_optimize_rules(lines, indexed=False):
+    """
+    规则记录化之前的 optimize_rules，在规则文本上逐行拆分。indexed 为 False 时是最初的逐条比较：
+    每条规则与全部已保留的规则比较，内层循环中重复拆分字符串并用 ipaddress 解析两个网络；
+    为 True 时改用覆盖索引，但每行仍要拆分和解析。
+    """
+    def is_suffix_covered(existing_value, new_value):
+        existing_value = existing_value.lower()
+        new_value = new_value.lower()
+        return new_value == existing_value or new_value.endswith('.' + existing_value)
+
+    def is_ip_subset(sub_cidr, parent_cidr):
+        try:
+            sub_network = ipaddress.ip_network(sub_cidr, strict=False)
+            parent_network = ipaddress.ip_network(parent_cidr, strict=False)
+            return sub_network.subnet_of(parent_network)
+        except (ValueError, TypeError):
+            # 旧实现遇到 IP-CIDR 中混有 IPv6 网络时抛出 TypeError，这里按不覆盖处理以便对比
+            return False
+
+    indexes = {
+        "DOMAIN-SUFFIX": generate_shadowrocket_conf.SuffixIndex(),
+        "IP-CIDR": generate_shadowrocket_conf.CidrIndex(),
+        "IP-CIDR6": generate_shadowrocket_conf.CidrIndex(),
+    }
+    deduped_lines = list(dict.fromkeys(lines))
+    optimized_lines = []
+    for line in deduped_lines:
+        if line.startswith('[') and line.endswith(']'):
+            optimized_lines.append(line)
+            continue
+        parts = line.split(',')
+        if len(parts) < 2 or parts[0] not in indexes:
+            optimized_lines.append(line)
+            continue
+        prefix, value = parts[0], parts[1]
+        if indexed:
+            index = indexes[prefix]
+            key = value if prefix == "DOMAIN-SUFFIX" else parse_cidr(value)
+            if not index.covers(key):
+                index.add(key)
+                optimized_lines.append(line)
+            continue
+        to_remove = False
+        for prev_line in optimized_lines:
+            prev_parts = prev_line.split(',')
+            if len(prev_parts) < 2 or prev_parts[0] != prefix:
+                continue
+            if prefix == "DOMAIN-SUFFIX":
+                if is_suffix_covered(prev_parts[1], value):
+                    to_remove = True
+                    break
+            elif is_ip_subset(value, prev_parts[1]):
+                to_remove = True
+                break
+        if not to_remove:
+            optimized_lines.append(line)
+    return optimized_lines
+
+def legacy_shadowrocket_pipeline(lines, indexed=True):
+    """
+    规则记录化之前从合法性检查到生成规则行的完整流程，每个阶段都重新拆分规则文本。
+    """
+    lines = legacy_optimize_rules(legacy_sort_rules(legacy_filter_rules(lines)), indexed)
+    suffixes = generate_shadowrocket_conf.TrieNode()
+    for line in lines:
+        if line.startswith('DOMAIN-SUFFIX,'):
+            generate_shadowrocket_conf.add_domain_to_trie(suffixes, line.split(',')[1])
+    lines = [
+        line for line in lines
+        if not line.startswith('DOMAIN,') or not generate_shadowrocket_conf.is_domain_in_trie(suffixes, line.split(',')[1])
+    ]
+    valid_rules = [
+        line for line in lines
+        if not (line.startswith('[') or line.endswith(']'))
+        and line.split(',')[0] in generate_shadowrocket_conf.RULE_TYPES
+    ]
+    rule_counts = {}
+    for line in valid_rules:
+        if ',' in line:
+            rule_counts[line.split(',')[0]] = rule_counts.get(line.split(',')[0], 0) + 1
+    return valid_rules, rule_counts
+
+def shadowrocket_pipeline(lines):
+    """
+    当前从合法性检查到生成规则行的完整流程：每行只解析一次为 RuleRecord。
+    """
+    records = generate_shadowrocket_conf.filter_elements_by_valid_prefix(lines)
+    records = generate_shadowrocket_conf.optimize_rules(generate_shadowrocket_conf.sort_rules(records))
+    return generate_shadowrocket_conf.render_rules(generate_shadowrocket_conf.optimize_domain_rules(records))
+
+def legacy_filter_and_trim_values(values):
+    """
+    优化前的 filter_and_trim_values：逐行过滤和修剪，每行都重新编译正则表达式，日志输出已去掉。
+    """
+    filtered_values = []
+    domain_pattern = re.compile(r"^(?=.{1,253}$)(?!-)[A-Za-z0-9-]{1,63}(?<!-)(\.[A-Za-z]{2,6})+$")
+    for item in values:
+        item = "".join(item.split())
+        if item.startswith("#") or item.startswith("payload"):
+            continue
+        if domain_pattern.match(item):
+            filtered_values.append(f"+.{item}")
+            continue
+        item_trimmed = re.sub(r"^[^\w\u4e00-\u9fa5:+*.]+|[^\w\u4e00-\u9fa5:+*.]+$", "", item)
+        special_characters_count = len(re.findall(r"[^a-zA-Z0-9\u4e00-\u9fa5()$/\\^,:+*.-]", item_trimmed))
+        if special_characters_count > 3:
+            continue
+        filtered_values.append(item_trimmed)
+    return filtered_values
+
+def legacy_classify_values(values):
+    """
+    优化前的 classify_values：依次尝试 ip_address 和 ip_network，以异常判断是否为 IP。
+    """
+    domain_list = []
+    ipcidr_list = []
+    classical_list = []
+    for item in values:
+        item = item.strip()
+        try:
+            ip_addr = ipaddress.ip_address(item)
+            ipcidr_list.append(f"{item}/32" if ip_addr.version == 4 else f"{item}/128")
+            continue
+        except ValueError:
+            pass
+        try:
+            ipaddress.ip_network(item, strict=False)
+            ipcidr_list.append(item)
+            continue
+        except ValueError:
+            pass
+        if re.match(r"(\+\..*|\*.*|DOMAIN-SUFFIX,.*|DOMAIN,.*|^[a-zA-Z0-9\-.]+$)", item, re.IGNORECASE):
+            domain_list.append(item)
+        else:
+            parts = item.split(",")
+            if len(parts) > 1:
+                try:
+                    ipaddress.ip_network(parts[1].strip(), strict=False)
+                    ipcidr_list.append(parts[1].strip())
+                except ValueError:
+                    classical_list.append(item)
+            else:
+                classical_list.append(item)
+    return domain_list, ipcidr_list, classical_list
+
+def legacy_normalize_values(values):
+    """
+    优化前的 filter_and_trim_values + classify_values 组合，修剪后为空的经典规则在输出阶段才被丢弃，这里预先去掉。
+    """
+    domain_list, ipcidr_list, classical_list = legacy_classify_values(legacy_filter_and_trim_values(values))
+    return domain_list, ipcidr_list, [item for item in classical_list if item]
+
+def legacy_exclude_domains(domains, blacklist):
+    """
+    优化前 domain_convert_dnsmasq.conf.py 中的 is_subdomain 过滤：每个域名遍历整张排除列表。
+    """
+    def is_subdomain(domain):
+        for blacklisted_domain in blacklist:
+            if domain == blacklisted_domain or domain.endswith(f".{blacklisted_domain}"):
+                return True
+        return False
+
+    return [domain for domain in domains if not is_subdomain(domain)]
+
+def legacy_sort_ipcidr_items(items):
+    """
+    优化前的 sort_ipcidr_items 及其调用的 optimize_cidrs 实现，仅用于对比。
+    """
+    def optimize_single_cidr_list(cidrs):
+        cidr_networks = {ipaddress.ip_network(cidr, strict=False) for cidr in cidrs}
+        return [str(network) for network in ipaddress.collapse_addresses(cidr_networks)]
+
+    ipv4_cidrs = [cidr for cidr in items if ipaddress.ip_network(cidr).version == 4]
+    ipv6_cidrs = [cidr for cidr in items if ipaddress.ip_network(cidr).version == 6]
+    items = (optimize_single_cidr_list(ipv4_cidrs) if ipv4_cidrs else []) + \
+        (optimize_single_cidr_list(ipv6_cidrs) if ipv6_cidrs else [])
+
+    ipv4_items = []
+    ipv6_items = []
+    for item in items:
+        ip_net = ipaddress.ip_network(item, strict=False)
+        (ipv4_items if ip_net.version == 4 else ipv6_items).append(item)
+    ipv4_items.sort(key=lambda x: ipaddress.ip_network(x).with_prefixlen)
+    ipv6_items.sort(key=lambda x: ipaddress.ip_network(x).with_prefixlen)
+    return ipv4_items + ipv6_items
+
+def legacy_optimize_domains(domain_list):
+    """
+    优化前的 optimize_domains 实现，仅用于对比。
+    """
+    if not domain_list:
+        return []
+
+    domain_set = set(domain_router.filter_invalid_domains(domain_list))
+    sorted_domains = sorted(domain_set, key=lambda x: (-x.count('.'), x))
+
+    optimized_set = set()
+    removed_domains = set()
+
+    for domain in sorted_domains:
+        if domain in removed_domains:
+            continue
+        if domain.startswith('+'):
+            suffix = domain[1:]
+            for other_domain in sorted_domains:
+                if other_domain != domain and other_domain.endswith(suffix):
+                    removed_domains.add(other_domain)
+        elif domain.startswith('.'):
+            suffix = domain
+            for other_domain in sorted_domains:
+                if other_domain != domain and other_domain.endswith(suffix):
+                    removed_domains.add(other_domain)
+        elif '*' in domain:
+            pattern = domain.replace('.', r'\.').replace('*', r'.*')
+            regex = re.compile(f'^{pattern}$')
+            for other_domain in sorted_domains:
+                if other_domain != domain and regex.match(other_domain):
+                    removed_domains.add(other_domain)
+
+        optimized_set.add(domain)
+
+    final_domains = optimized_set - removed_domains
+    return list(final_domains)
+
+def regex_wildcard_optimize_domains(domain_list):
+    """
+    逐条通配符编译正则并扫描整张列表的实现，通配符按单标签语义翻译为 '[^.]+'，
+    用于对比并校验 WildcardDomainIndex 的结果。
+    """
+    if not domain_list:
+        return []
+
+    domain_set = set(domain_router.filter_invalid_domains(domain_list))
+    sorted_domains = sorted(domain_set, key=lambda x: (-x.count('.'), x))
+    suffix_index = domain_router.DomainSuffixIndex(sorted_domains)
+
+    removed_domains = set()
+    for domain in sorted_domains:
+        if domain in removed_domains:
+            continue
+        if domain.startswith('+') or domain.startswith('.'):
+            suffix_index.sweep(domain[2:] if domain.startswith('+') else domain[1:], domain, removed_domains)
+        elif '*' in domain.split('.'):
+            pattern = r'\.'.join('[^.]+' if label == '*' else re.escape(label) for label in domain.split('.'))
+            regex = re.compile(f'^{pattern}$')
+            for other_domain in sorted_domains:
+                if other_domain != domain and not other_domain.startswith(('+', '.')) and regex.match(other_domain):
+                    removed_domains.add(other_domain)
+
+    return list(domain_set - removed_domains)
+
+class FlakyRuleHandler(BaseHTTPRequestHandler):
+    """
+    模拟上游规则源的本地 HTTP 服务：每个请求注入固定延迟，部分路径的首次请求返回 503。
+    """
+
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive
+    latency = 0.05
+    failure_rate = 0.1
+    body_lines = 2000
+    attempts = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        with self.lock:
+            attempt = self.attempts[self.path] = self.attempts.get(self.path, 0) + 1
+        # 按路径哈希确定哪些资源会失败一次，保证新旧实现遇到相同的故障
+        digest = int(hashlib.md5(self.path.encode()).hexdigest(), 16)
+        if attempt == 1 and digest % 1000 < self.failure_rate * 1000:
+            body = b"unavailable"
+            self.send_response(503)
+        else:
+            body = "\n".join(f"+.{self.path.strip('/')}-{i}.example.com" for i in range(self.body_lines)).encode()
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_rule_server(latency, failure_rate):
+    """
+    在随机端口启动 FlakyRuleHandler，返回 (服务实例, 基础 URL)。
+    """
+    handler = type("Handler", (FlakyRuleHandler,), {"latency": latency, "failure_rate": failure_rate, "attempts": {}})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+class SlowDripHandler(BaseHTTPRequestHandler):
+    """
+    声明较大的 Content-Length 后每隔 interval 秒只发送一行的规则源，模拟截止时间内下载不完的上游。
+    """
+
+    protocol_version = "HTTP/1.1"
+    interval = 0.1
+    lines = 120
+
+    def do_GET(self):
+        lines = [f"+.drip{i}.example.com\n".encode() for i in range(self.lines)]
+        self.send_response(200)
+        self.send_header("Content-Length", str(sum(map(len, lines))))
+        self.end_headers()
+        try:
+            for line in lines:
+                self.wfile.write(line)
+                self.wfile.flush()
+                time.sleep(self.interval)
+        except OSError:
+            pass  # 客户端放弃后断开连接
+
+    def log_message(self, format, *args):
+        pass
+
+class FixtureRuleHandler(BaseHTTPRequestHandler):
+    """
+    按路径返回固定内容的本地规则源，延迟按路径在 latency 到 latency * 8 之间分布，
+    模拟上游有快有慢的情况。
+    """
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.05
+    fixtures = {}
+
+    def do_GET(self):
+        digest = int(hashlib.md5(self.path.encode()).hexdigest(), 16)
+        time.sleep(self.latency * (1 + digest % 8))
+        body = self.fixtures.get(self.path)
+        if body is None:
+            self.send_response(404)
+            body = b""
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def load_fixtures(directory, sources, lines, seed=2024):
+    """
+    读取录制的上游规则源；未提供目录时按固定种子生成域名与 CIDR 混合的内容。
+
+    参数：
+        directory (str): 录制文件所在目录，每个文件对应一个上游来源，可为 None。
+        sources (int): 生成的来源数量。
+        lines (int): 每个生成来源的行数。
+        seed (int): 随机种子。
+
+    返回：
+        dict: 路径到响应内容（bytes）的映射。
+    """
+    if directory:
+        fixtures = {}
+        for filename in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, filename), "rb") as file:
+                fixtures[f"/{filename}"] = file.read()
+        return fixtures
+    fixtures = {}
+    for i in range(sources):
+        items = generate_domains(lines, seed=seed + i, wildcard_ratio=0.01)
+        if i % 3 == 0:
+            items += generate_cidrs(lines // 2, seed=seed + i)
+        fixtures[f"/source{i}.list"] = "\n".join(items).encode()
+    return fixtures
+
+def start_fixture_server(fixtures, latency):
+    """
+    在随机端口启动 FixtureRuleHandler，返回 (服务实例, 基础 URL)。
+    """
+    handler = type("Handler", (FixtureRuleHandler,), {"latency": latency, "fixtures": fixtures})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def read_outputs(directory):
+    """
+    读取生成的规则文件，去掉随时间变化的 UPDATED 行，用于比较两次运行的输出。
+    """
+    outputs = {}
+    for folder in ("domain", "ipcidr", "classic"):
+        for filename in sorted(os.listdir(os.path.join(directory, folder))):
+            with open(os.path.join(directory, folder, filename), encoding="utf-8") as file:
+                outputs[f"{folder}/{filename}"] = [line for line in file if not line.startswith("# UPDATED:")]
+    return outputs
+
+def legacy_fetch_all_urls(data_dict, retry_wait_time=5):
+    """
+    优化前的 fetch_all_urls 实现：固定 10 线程、无会话复用、无超时，失败后固定等待。
+    """
+    def fetch_url_content(url):
+        for attempt in range(1, domain_router.MAX_RETRIES + 1):
+            try:
+                response = requests.get(url)
+                response.raise_for_status()
+                return [line.strip() for line in response.text.split("\n") if line.strip()]
+            except requests.exceptions.RequestException:
+                time.sleep(retry_wait_time)
+                if attempt == domain_router.MAX_RETRIES:
+                    return []
+
+    all_urls = set()
+    for key in data_dict:
+        all_urls.update(data_dict[key]['urls'])
+
+    fetched_contents = {}
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        future_to_url = {executor.submit(fetch_url_content, url): url for url in all_urls}
+        for future in as_completed(future_to_url):
+            fetched_contents[future_to_url[future]] = future.result()
+    return fetched_contents
+
+def staged_fetch_all_urls(data_dict):
+    """
+    流水线之前的 fetch_all_urls：以当前的异步引擎一次获取全部 URL，所有 URL 完成后才返回。
+    """
+    all_urls = set()
+    for key in data_dict:
+        all_urls.update(data_dict[key]['urls'])
+    return asyncio.run(domain_router.fetch_urls_async(all_urls))
+
+def legacy_merge_url_contents(data_dict, fetched_contents):
+    """
+    流水线之前的 merge_url_contents：把各 URL 的内容按配置中的顺序追加到分类的普通值之后。
+    """
+    for key in data_dict:
+        for url in data_dict[key]['urls']:
+            data_dict[key]['values'].extend(fetched_contents.get(url, []))
+    return data_dict
+
+def legacy_process_data(data_dict):
+    """
+    流水线之前的 process_data：全部内容就绪后依次处理各分类。
+    """
+    for key, content in data_dict.items():
+        domain_router.write_to_delete_file(domain_router.process_category(key, content))
+
+def timed(func, *args):
+    """
+    运行函数并返回 (结果, 耗时秒数)。
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def compare(name, size, legacy, current, args, legacy_max, legacy_args=None):
+    """
+    对比旧实现与新实现的耗时，并校验输出一致。
+    """
+    result, elapsed = timed(current, *args)
+    if size <= legacy_max:
+        legacy_result, legacy_elapsed = timed(legacy, *(legacy_args or args))
+        if sorted(legacy_result) != sorted(result) or (isinstance(result, dict) and legacy_result != result):
+            raise SystemExit(f"{name} 在 {size} 条数据上的输出与旧实现不一致")
+        speedup = legacy_elapsed / elapsed if elapsed else float("inf")
+        print(f"{name:<24}{size:>10}  旧实现 {legacy_elapsed:>9.3f}s  新实现 {elapsed:>9.3f}s  加速 {speedup:>8.1f}x")
+    else:
+        print(f"{name:<24}{size:>10}  旧实现 {'跳过':>8}   新实现 {elapsed:>9.3f}s")
+
+def bench_domains(args):
+    """
+    optimize_domains：反向标签排序索引与逐条 endswith 扫描的对比。
+    """
+    for size in args.sizes:
+        domains = generate_domains(size)
+        compare("optimize_domains", size, legacy_optimize_domains, domain_router.optimize_domains,
+                (domains,), args.legacy_max)
+
+def bench_wildcards(args):
+    """
+    通配符去重：单次遍历的通配前缀树与逐条正则扫描的对比。
+    """
+    for size in args.sizes:
+        domains = generate_domains(size, wildcard_ratio=args.ratio)
+        compare("wildcards", size, regex_wildcard_optimize_domains, domain_router.optimize_domains,
+                (domains,), args.legacy_max)
+
+def bench_cidrs(args):
+    """
+    sort_ipcidr_items：整数区间合并与多次 ipaddress 解析的对比。
+    """
+    for size in args.sizes:
+        cidrs = generate_cidrs(size)
+        compare("sort_ipcidr_items", size, legacy_sort_ipcidr_items, domain_router.sort_ipcidr_items,
+                (cidrs,), args.legacy_max)
+
+def bench_normalize(args):
+    """
+    行归一化与分类：单次扫描的 normalize_values 与 filter_and_trim_values + classify_values 的对比。
+    """
+    for size in args.sizes:
+        lines = generate_upstream_lines(size)
+        compare("normalize_values", size, legacy_normalize_values, domain_router.normalize_values,
+                (lines,), args.legacy_max)
+
+def bench_sources(args):
+    """
+    上游规则源解析：按格式流式解析字节块与整体解码、分行再归一化的对比，同时比较内存峰值。
+    """
+    for size in args.sizes:
+        rng = random.Random(2024)
+        lines = [f"  - '{domain}'" for domain in generate_domains(size)] + \
+            [f"  - '{cidr}'" for cidr in generate_cidrs(size // 4)]
+        rng.shuffle(lines)
+        body = ("payload:\n" + "\n".join(lines)).encode()
+        url = "https://example.com/geosite/bench.yaml"
+
+        def legacy():
+            return domain_router.normalize_values(domain_router.split_content_lines(body.decode("utf-8")))
+
+        def current():
+            chunks = (body[i:i + 65536] for i in range(0, len(body), 65536))
+            return domain_router.group_records(domain_router.source_records(url, chunks))
+
+        results = []
+        for name, func in (("旧实现", legacy), ("新实现", current)):
+            tracemalloc.start()
+            result, elapsed = timed(func)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append((name, result, elapsed, peak))
+        if results[0][1] != results[1][1]:
+            raise SystemExit(f"source_records 在 {size} 条数据上的输出与旧实现不一致")
+        print(f"{'source_records':<24}{size:>10}  " + "  ".join(
+            f"{name} {elapsed:>7.3f}s 峰值 {peak / 2 ** 20:>7.1f}MiB" for name, _, elapsed, peak in results
+        ))
+
+def bench_exclusions(args):
+    """
+    排除列表过滤：逐级父域名哈希查找与逐条 endswith 扫描的对比。
+    """
+    for size in args.sizes:
+        domains = [domain.lstrip("+.*") for domain in generate_domains(size)]
+        rng = random.Random(2024)
+        # 一半取自输入的父域名，一半为无关域名
+        blacklist = [".".join(rng.choice(domains).split(".")[-2:]) for _ in range(args.blacklist // 2)]
+        blacklist += [f"{random_label(rng)}.{rng.choice(TLDS)}" for _ in range(args.blacklist - len(blacklist))]
+        compare("exclusions", size, legacy_exclude_domains,
+                lambda domains, blacklist: DomainExclusionIndex(blacklist).filter(domains),
+                (domains, blacklist), args.legacy_max)
+
+def bench_payload(args):
+    """
+    ChinaMax payload 读取：逐行流式读取与 yaml.safe_load 整体解析的对比，同时比较内存峰值。
+    """
+    import yaml
+
+    for size in args.sizes:
+        domains = generate_domains(size)
+        body = ("# NAME: ChinaMax\n# TOTAL: %d\npayload:\n" % size + "\n".join(f"  - '{d}'" for d in domains)).encode()
+
+        def legacy():
+            return yaml.safe_load(body.decode("utf-8")).get("payload", [])
+
+        def current():
+            chunks = (body[i:i + 65536] for i in range(0, len(body), 65536))
+            return list(iter_payload(iter_raw_lines(chunks)))
+
+        results = []
+        for name, func in (("旧实现", legacy), ("新实现", current)):
+            tracemalloc.start()
+            result, elapsed = timed(func)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append((name, result, elapsed, peak))
+        if results[0][1] != results[1][1]:
+            raise SystemExit(f"iter_payload 在 {size} 条数据上的输出与 yaml.safe_load 不一致")
+        print(f"{'iter_payload':<24}{size:>10}  " + "  ".join(
+            f"{name} {elapsed:>7.3f}s 峰值 {peak / 2 ** 20:>7.1f}MiB" for name, _, elapsed, peak in results
+        ))
+
+def bench_dnsmasq(args):
+    """
+    dnsmasq 配置：每个域名一行与多个域名合并为一行的行数、文件大小和生成耗时对比。
+    """
+    for size in args.sizes:
+        domains = sorted({domain.lstrip("+.*") for domain in generate_domains(size)})
+        results = []
+        for name, aggregate in (("逐行", False), ("合并", True)):
+            lines, elapsed = timed(lambda: build_conf_lines(domains, "119.29.29.29", aggregate=aggregate))
+            packed = [domain for line in lines for domain in line.split("=", 1)[1].split("/")[1:-1]]
+            if packed != domains:
+                raise SystemExit(f"{name}输出在 {size} 条数据上丢失或打乱了域名")
+            results.append((name, len(lines), len("\n".join(lines)), elapsed))
+        print(f"{'dnsmasq':<24}{size:>10}  " + "  ".join(
+            f"{name} {count:>8} 行 {length / 2 ** 20:>6.1f}MiB {elapsed:>6.3f}s" for name, count, length, elapsed in results
+        ))
+
+def bench_mrs(args):
+    """
+    mihomo 规则集：YAML 与 .mrs 的文件大小和加载耗时对比。YAML 的加载为 yaml.safe_load 解析 payload，
+    .mrs 的加载为解压并读出位图和区间，与 mihomo 加载两种格式时的工作相对应；.mrs 须通过往返校验。
+    """
+    import yaml
+
+    for size in args.sizes:
+        rule_sets = (
+            ("domain", mrs_rule_set.BEHAVIOR_DOMAIN, domain_router.optimize_domains(generate_domains(size, wildcard_ratio=0.01))),
+            ("ipcidr", mrs_rule_set.BEHAVIOR_IPCIDR, domain_router.optimize_cidrs(generate_cidrs(size))),
+        )
+        for name, behavior, entries in rule_sets:
+            text = domain_router.render_rule_file(
+                "Bench", name, [], [f"  - '{entry}'" for entry in entries], "1970-01-01 00:00:00"
+            )
+            data, encode_elapsed = timed(mrs_rule_set.encode_mrs, entries, behavior)
+            mrs_rule_set.verify_mrs(data, entries, behavior)
+            yaml_payload, yaml_elapsed = timed(lambda: yaml.safe_load(text)["payload"])
+            if yaml_payload != entries:
+                raise SystemExit(f"{name} YAML 在 {size} 条数据上的 payload 与输入不一致")
+            _, mrs_elapsed = timed(mrs_rule_set.read_mrs, data)
+            size_text = f"{len(text.encode()) / 2 ** 10:>8.0f}KiB → {len(data) / 2 ** 10:>6.0f}KiB"
+            print(f"{'mrs ' + name:<24}{len(entries):>10}  {size_text}  加载 YAML {yaml_elapsed:>7.3f}s"
+                  f"  mrs {mrs_elapsed:>7.3f}s  加速 {yaml_elapsed / mrs_elapsed:>6.1f}x  生成 {encode_elapsed:>6.3f}s")
+
+def bench_text(args):
+    """
+    mihomo 规则集：YAML 与 text 格式的文件大小和加载耗时对比。YAML 的加载为 yaml.safe_load 解析 payload，
+    text 的加载为按行拆分并跳过注释和空行，与 mihomo 加载两种格式时的工作相对应；两者的条目须一致。
+    """
+    import yaml
+
+    for size in args.sizes:
+        rule_sets = (
+            ("domain", domain_router.optimize_domains(generate_domains(size, wildcard_ratio=0.01))),
+            ("ipcidr", domain_router.optimize_cidrs(generate_cidrs(size))),
+        )
+        for name, entries in rule_sets:
+            payload = [domain_router.format_item(entry, name) for entry in entries]
+            yaml_text = domain_router.render_rule_file("Bench", name, [], payload, "1970-01-01 00:00:00")
+            text = domain_router.render_rule_file(
+                "Bench", name, [], domain_router.text_payload(payload), "1970-01-01 00:00:00", text=True
+            )
+            yaml_entries, yaml_elapsed = timed(lambda: yaml.safe_load(yaml_text)["payload"])
+            text_entries, text_elapsed = timed(
+                lambda: [line for line in map(str.strip, text.split("\n")) if line and not line.startswith("#")]
+            )
+            if yaml_entries != text_entries:
+                raise SystemExit(f"{name} text 格式在 {size} 条数据上的条目与 YAML 不一致")
+            size_text = f"{len(yaml_text.encode()) / 2 ** 10:>8.0f}KiB → {len(text.encode()) / 2 ** 10:>6.0f}KiB"
+            print(f"{'text ' + name:<24}{len(entries):>10}  {size_text}  加载 YAML {yaml_elapsed:>7.3f}s"
+                  f"  text {text_elapsed:>7.3f}s  加速 {yaml_elapsed / text_elapsed:>6.1f}x")
+
+def bench_singbox(args):
+    """
+    sing-box 规则集：source JSON 与 .srs 的文件大小和加载耗时对比。JSON 的加载为解析后构建域名字典树，
+    .srs 的加载为解压并读出各字段，与 sing-box 加载两种格式时的工作相对应；.srs 须通过往返校验。
+    """
+    for size in args.sizes:
+        domains = domain_router.optimize_domains(generate_domains(size, wildcard_ratio=0.01))
+        cidrs = domain_router.optimize_cidrs(generate_cidrs(size // 4))
+        classic = [f"DOMAIN-KEYWORD,{random_label(random.Random(i))}" for i in range(size // 100)] + ["DST-PORT,123"]
+        rule_set, _ = sing_box_rule_set.category_rule_set(domains, cidrs, classic)
+        text = json.dumps(rule_set, ensure_ascii=False, indent=2) + "\n"
+        data, encode_elapsed = timed(sing_box_rule_set.encode_srs, rule_set)
+        sing_box_rule_set.verify_srs(data, rule_set)
+
+        def load_json():
+            rules = json.loads(text)["rules"]
+            for rule in rules:
+                if rule.get("domain") or rule.get("domain_suffix"):
+                    build_succinct_set(sing_box_rule_set.domain_matcher_keys(
+                        rule.get("domain", []), rule.get("domain_suffix", [])
+                    ))
+            return rules
+
+        _, json_elapsed = timed(load_json)
+        _, srs_elapsed = timed(sing_box_rule_set.read_srs, data)
+        size_text = f"{len(text.encode()) / 2 ** 10:>8.0f}KiB → {len(data) / 2 ** 10:>6.0f}KiB"
+        entries = len(domains) + len(cidrs) + len(classic)
+        print(f"{'sing-box':<24}{entries:>10}  {size_text}  加载 JSON {json_elapsed:>7.3f}s"
+              f"  srs {srs_elapsed:>7.3f}s  加速 {json_elapsed / srs_elapsed:>6.1f}x  生成 {encode_elapsed:>6.3f}s")
+
+def bench_xray(args):
+    """
+    Xray：把分类写成配置中内联的 domain、ip 数组与编译为 geosite.dat、geoip.dat 的文件大小对比，
+    以及 .dat 的生成耗时；.dat 须通过往返校验。两者在 Xray 中的解析分别由 Go 的 JSON 与 protobuf 完成，
+    Python 中 json 为 C 实现而这里的 protobuf 解析为纯 Python，解析耗时没有可比性，因此不做对比。
+    """
+    prefixes = {
+        xray_geodata.DOMAIN_PLAIN: "keyword:",
+        xray_geodata.DOMAIN_REGEX: "regexp:",
+        xray_geodata.DOMAIN_ROOT: "domain:",
+        xray_geodata.DOMAIN_FULL: "full:",
+    }
+    for size in args.sizes:
+        domains = domain_router.optimize_domains(generate_domains(size, wildcard_ratio=0.01))
+        cidrs = domain_router.optimize_cidrs(generate_cidrs(size // 4))
+        site, _ = xray_geodata.site_domains(domains)
+        geosite = {"BENCH": site}
+        geoip = {"BENCH": xray_geodata.site_cidrs(cidrs)}
+        rule = {"type": "field", "outboundTag": "proxy", "domain": [prefixes[t] + value for t, value in site], "ip": cidrs}
+        text = json.dumps({"routing": {"rules": [rule]}}, indent=4)
+
+        site_data, encode_elapsed = timed(xray_geodata.encode_geosite, geosite)
+        ip_data = xray_geodata.encode_geoip(geoip)
+        xray_geodata.verify_geodata(site_data, geosite, xray_geodata.read_geosite)
+        xray_geodata.verify_geodata(ip_data, geoip, xray_geodata.read_geoip)
+        dat_size = len(site_data) + len(ip_data)
+        size_text = f"{len(text.encode()) / 2 ** 10:>8.0f}KiB → {dat_size / 2 ** 10:>6.0f}KiB"
+        print(f"{'xray':<24}{len(site) + len(cidrs):>10}  {size_text}  生成 {encode_elapsed:>6.3f}s")
+
+def bench_shadowrocket(args):
+    """
+    Shadowrocket 规则处理，输出须逐行一致（包括顺序）：
+    optimize_rules 对比逐条比较的最初实现；pipeline 对比在规则文本上逐阶段拆分的旧流程与 RuleRecord 流程。
+    """
+    for size in args.sizes:
+        lines = generate_shadowrocket_lines(size)
+        (result, counts), elapsed = timed(shadowrocket_pipeline, lines)
+        if len(result) <= args.legacy_max:
+            legacy, legacy_elapsed = timed(lambda: legacy_shadowrocket_pipeline(lines, indexed=False))
+            if legacy != (result, counts):
+                raise SystemExit(f"optimize_rules 在 {len(result)} 条规则上的输出与旧实现不一致")
+            speedup = legacy_elapsed / elapsed if elapsed else float("inf")
+            print(f"{'optimize_rules':<24}{len(result):>10}  旧实现 {legacy_elapsed:>9.3f}s  新实现 {elapsed:>9.3f}s  加速 {speedup:>8.1f}x")
+        legacy, legacy_elapsed = timed(legacy_shadowrocket_pipeline, lines)
+        if legacy != (result, counts):
+            raise SystemExit(f"RuleRecord 流程在 {len(result)} 条规则上的输出与旧流程不一致")
+        speedup = legacy_elapsed / elapsed if elapsed else float("inf")
+        print(f"{'pipeline':<24}{len(result):>10}  旧实现 {legacy_elapsed:>9.3f}s  新实现 {elapsed:>9.3f}s  加速 {speedup:>8.1f}x")
+
+def bench_fetch(args):
+    """
+    获取全部 URL：按主机限流的异步获取与固定线程池的对比，使用注入延迟和故障的本地服务。
+    """
+    # 使用空的临时缓存，测量的是首次完整下载的耗时
+    domain_router.HTTP_CACHE = domain_router.HttpCache(tempfile.mkdtemp(prefix="bench-http-cache-"))
+    for size in args.sizes:
+        legacy_server, legacy_base = start_rule_server(args.latency, args.failure_rate)
+        server, base = start_rule_server(args.latency, args.failure_rate)
+        data_dict = {"Bench": {"values": [], "urls": [f"{base}/rule{i}" for i in range(size)], "errors": []}}
+        legacy_dict = {"Bench": {"values": [], "urls": [f"{legacy_base}/rule{i}" for i in range(size)], "errors": []}}
+
+        def current(data):
+            return {url.replace(base, ""): lines for url, lines in staged_fetch_all_urls(data).items()}
+
+        def legacy(data):
+            fetched = legacy_fetch_all_urls(data, args.legacy_retry_wait)
+            return {url.replace(legacy_base, ""): lines for url, lines in fetched.items()}
+
+        compare("fetch_all_urls", size, legacy, current, (data_dict,), args.legacy_max, (legacy_dict,))
+        legacy_server.shutdown()
+        server.shutdown()
+
+def bench_deadline(args):
+    """
+    fetch_urls_async 的整体截止时间：上游缓慢滴流时须在截止时间后很快返回旧副本，
+    被放弃的下载不能写入缓存。
+    """
+    directory = tempfile.mkdtemp(prefix="bench-deadline-cache-")
+    domain_router.HTTP_CACHE = domain_router.HttpCache(directory)
+    handler = type("Handler", (SlowDripHandler,), {"interval": args.interval, "lines": args.lines})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base}/drip{i}" for i in range(args.sources)]
+
+    for name, read, fallback in (
+        ("request_url_lines", None, None),
+        ("request_url_records", domain_router.request_url_records, domain_router.stale_url_records),
+    ):
+        _, elapsed = timed(lambda: asyncio.run(domain_router.fetch_urls_async(
+            urls, deadline=args.deadline, read=read, fallback=fallback
+        )))
+        time.sleep(args.interval * 2)  # 给被放弃的下载留出写入缓存的机会
+        cached = os.listdir(directory) if os.path.isdir(directory) else []
+        print(f"{name:<24}{len(urls):>10}  截止 {args.deadline:>5.1f}s  耗时 {elapsed:>7.3f}s  缓存文件 {len(cached)}")
+        if elapsed > args.deadline + 1:
+            raise SystemExit(f"{name} 超过截止时间 {elapsed - args.deadline:.1f} 秒才返回")
+        if cached:
+            raise SystemExit(f"{name} 被放弃的下载写入了缓存: {cached}")
+    server.shutdown()
+
+def bench_pipeline(args):
+    """
+    端到端构建：流水线调度与获取 → 合并 → 处理分阶段执行的对比。
+    """
+    fixtures = load_fixtures(args.fixtures, args.sources, args.lines)
+    paths = sorted(fixtures)
+    server, base = start_fixture_server(fixtures, args.latency)
+    rng = random.Random(2024)
+
+    def build_data_dict():
+        # 每个分类引用若干来源，部分来源被多个分类共享
+        return {
+            f"Category{i}": {
+                "values": [f"+.manual{i}.example.com"],
+                "urls": [f"{base}{path}" for path in rng.sample(paths, min(len(paths), args.per_category))],
+                "errors": [],
+            }
+            for i in range(args.categories)
+        }
+
+    def run_in(directory, build):
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            domain_router.HTTP_CACHE = domain_router.HttpCache(os.path.join(directory, "cache"))
+            domain_router.prepare_directories()
+            build()
+            return read_outputs(directory)
+        finally:
+            os.chdir(cwd)
+
+    def staged(data_dict):
+        def build():
+            fetched = staged_fetch_all_urls(data_dict)
+            legacy_process_data(legacy_merge_url_contents(data_dict, fetched))
+        return run_in(tempfile.mkdtemp(prefix="bench-staged-"), build)
+
+    def pipelined(data_dict):
+        return run_in(tempfile.mkdtemp(prefix="bench-pipeline-"), lambda: domain_router.run_pipeline(data_dict))
+
+    data_dict = build_data_dict()
+    legacy_dict = {key: {**content, "values": list(content["values"])} for key, content in data_dict.items()}
+    compare("pipeline", args.categories, staged, pipelined, (data_dict,), args.legacy_max, (legacy_dict,))
+    server.shutdown()
+
+def bench_unified(args):
+    """
+    Clash 规则文件与 Shadowrocket 配置：分别获取解析与同一轮获取解析的对比，
+    统计上游收到的请求数并校验 Clash 规则文件一致。
+    """
+    fixtures = load_fixtures(args.fixtures, args.sources, args.lines)
+    paths = sorted(fixtures)
+    requests_served = []
+    handler = type("Handler", (FixtureRuleHandler,), {
+        "latency": args.latency,
+        "fixtures": fixtures,
+        "do_GET": lambda self: (requests_served.append(self.path), FixtureRuleHandler.do_GET(self)),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    rng = random.Random(2024)
+    data_dict = {
+        f"Category{i}": {
+            "values": [f"+.manual{i}.example.com"],
+            "urls": [f"{base}{path}" for path in rng.sample(paths, min(len(paths), args.per_category))],
+            "errors": [],
+        }
+        for i in range(args.categories)
+    }
+    # Shadowrocket 配置引用一半的来源，与分类的来源大部分重叠
+    shared = rng.sample(paths, len(paths) // 2)
+    shadowrocket_lines = ["[DIRECT]", *(f"{base}{path}" for path in shared[::2]),
+                          "[PROXY]", *(f"{base}{path}" for path in shared[1::2])]
+
+    def run(build):
+        directory = tempfile.mkdtemp(prefix="bench-unified-")
+        cwd = os.getcwd()
+        os.chdir(directory)
+        requests_served.clear()
+        try:
+            domain_router.HTTP_CACHE = domain_router.HttpCache(os.path.join(directory, "cache"))
+            generate_shadowrocket_conf.HTTP_CACHE = domain_router.HttpCache(os.path.join(directory, "cache-sr"))
+            domain_router.prepare_directories()
+            content = {key: {**value, "values": list(value["values"])} for key, value in data_dict.items()}
+            start = time.perf_counter()
+            build(content)
+            elapsed = time.perf_counter() - start
+            return read_outputs(directory), len(requests_served), elapsed
+        finally:
+            os.chdir(cwd)
+
+    def separate(content):
+        domain_router.run_pipeline(content)
+        generate_shadowrocket_conf.build_conf(shadowrocket_lines)
+
+    def unified(content):
+        sources = domain_router.run_pipeline(
+            content, extra_urls=generate_shadowrocket_conf.config_urls(shadowrocket_lines)
+        )
+        generate_shadowrocket_conf.build_conf(shadowrocket_lines, sources)
+
+    legacy_outputs, legacy_requests, legacy_elapsed = run(separate)
+    outputs, served, elapsed = run(unified)
+    server.shutdown()
+    if outputs != legacy_outputs:
+        raise SystemExit("同一轮构建生成的 Clash 规则文件与分别构建不一致")
+    print(f"{'separate':<24}{legacy_requests:>6} 次请求  耗时 {legacy_elapsed:>9.3f}s")
+    print(f"{'unified':<24}{served:>6} 次请求  耗时 {elapsed:>9.3f}s  加速 {legacy_elapsed / elapsed:>8.1f}x")
+
+def bench_jobs(args):
+    """
+    run_pipeline 的 jobs：进程池并行处理与串行处理的对比，输出须与串行结果逐字节一致。
+    """
+    rng = random.Random(2024)
+    data_dict = {}
+    for i in range(args.categories):
+        # 分类规模差异较大，与 my.wei 中的分布相近
+        size = int(args.lines * rng.choice((0.05, 0.1, 0.25, 0.5, 1, 2)))
+        values = generate_domains(size, seed=2024 + i, wildcard_ratio=0.01)
+        if i % 3 == 0:
+            values += generate_cidrs(size // 2, seed=2024 + i)
+        data_dict[f"Category{i}"] = {"values": values, "urls": [], "errors": []}
+
+    def run(jobs):
+        directory = tempfile.mkdtemp(prefix=f"bench-jobs{jobs}-")
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            domain_router.prepare_directories()
+            start = time.perf_counter()
+            domain_router.run_pipeline(data_dict, jobs=jobs)
+            elapsed = time.perf_counter() - start
+            return read_outputs(directory), elapsed
+        finally:
+            os.chdir(cwd)
+
+    baseline, serial_elapsed = run(1)
+    print(f"{'run_pipeline':<24}{'jobs=1':>10}  耗时 {serial_elapsed:>9.3f}s")
+    for jobs in args.jobs:
+        if jobs <= 1:
+            continue
+        result, elapsed = run(jobs)
+        if result != baseline:
+            raise SystemExit(f"run_pipeline 在 jobs={jobs} 时的输出与串行处理不一致")
+        print(f"{'run_pipeline':<24}{f'jobs={jobs}':>10}  耗时 {elapsed:>9.3f}s  加速 {serial_elapsed / elapsed:>8.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="规则处理性能基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    domains_parser = subparsers.add_parser("domains", help="optimize_domains 后缀去重")
+    domains_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    domains_parser.add_argument("--legacy-max", type=int, default=10000)
+    domains_parser.set_defaults(func=bench_domains)
+
+    wildcards_parser = subparsers.add_parser("wildcards", help="通配符规则去重")
+    wildcards_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    wildcards_parser.add_argument("--ratio", type=float, default=0.05, help="通配符条目所占比例")
+    wildcards_parser.add_argument("--legacy-max", type=int, default=100000)
+    wildcards_parser.set_defaults(func=bench_wildcards)
+
+    cidrs_parser = subparsers.add_parser("cidrs", help="IP/CIDR 合并与排序")
+    cidrs_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 200000])
+    cidrs_parser.add_argument("--legacy-max", type=int, default=200000)
+    cidrs_parser.set_defaults(func=bench_cidrs)
+
+    normalize_parser = subparsers.add_parser("normalize", help="原始行过滤、修剪与分类")
+    normalize_parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    normalize_parser.add_argument("--legacy-max", type=int, default=1000000)
+    normalize_parser.set_defaults(func=bench_normalize)
+
+    sources_parser = subparsers.add_parser("sources", help="按格式流式解析上游规则源")
+    sources_parser.add_argument("--sizes", type=int, nargs="+", default=[200000, 1000000])
+    sources_parser.set_defaults(func=bench_sources)
+
+    exclusions_parser = subparsers.add_parser("exclusions", help="排除列表过滤")
+    exclusions_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    exclusions_parser.add_argument("--blacklist", type=int, default=10000, help="排除列表的条目数")
+    exclusions_parser.add_argument("--legacy-max", type=int, default=100000)
+    exclusions_parser.set_defaults(func=bench_exclusions)
+
+    payload_parser = subparsers.add_parser("payload", help="流式读取 YAML payload")
+    payload_parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 200000])
+    payload_parser.set_defaults(func=bench_payload)
+
+    dnsmasq_parser = subparsers.add_parser("dnsmasq", help="dnsmasq 配置的合并输出")
+    dnsmasq_parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 200000])
+    dnsmasq_parser.set_defaults(func=bench_dnsmasq)
+
+    mrs_parser = subparsers.add_parser("mrs", help="mihomo .mrs 规则集与 YAML 的大小和加载耗时")
+    mrs_parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 500000])
+    mrs_parser.set_defaults(func=bench_mrs)
+
+    text_parser = subparsers.add_parser("text", help="mihomo text 格式规则集与 YAML 的大小和加载耗时")
+    text_parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 500000])
+    text_parser.set_defaults(func=bench_text)
+
+    singbox_parser = subparsers.add_parser("singbox", help="sing-box .srs 规则集与 source JSON 的大小和加载耗时")
+    singbox_parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 500000])
+    singbox_parser.set_defaults(func=bench_singbox)
+
+    xray_parser = subparsers.add_parser("xray", help="Xray geosite.dat、geoip.dat 与内联配置的大小")
+    xray_parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 500000])
+    xray_parser.set_defaults(func=bench_xray)
+
+    shadowrocket_parser = subparsers.add_parser("shadowrocket", help="Shadowrocket 规则排序与优化")
+    shadowrocket_parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 200000])
+    shadowrocket_parser.add_argument("--legacy-max", type=int, default=20000)
+    shadowrocket_parser.set_defaults(func=bench_shadowrocket)
+
+    fetch_parser = subparsers.add_parser("fetch", help="并发获取上游规则源")
+    fetch_parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200])
+    fetch_parser.add_argument("--latency", type=float, default=0.05, help="每个请求注入的延迟（秒）")
+    fetch_parser.add_argument("--failure-rate", type=float, default=0.1, help="首次请求失败的资源比例")
+    fetch_parser.add_argument("--legacy-retry-wait", type=float, default=5, help="旧实现失败后的固定等待时间（秒）")
+    fetch_parser.add_argument("--legacy-max", type=int, default=1000)
+    fetch_parser.set_defaults(func=bench_fetch)
+
+    deadline_parser = subparsers.add_parser("deadline", help="上游缓慢滴流时整体截止时间是否生效")
+    deadline_parser.add_argument("--sources", type=int, default=8)
+    deadline_parser.add_argument("--deadline", type=float, default=2, help="整体截止时间（秒）")
+    deadline_parser.add_argument("--interval", type=float, default=0.1, help="每行的发送间隔（秒）")
+    deadline_parser.add_argument("--lines", type=int, default=120, help="每个来源的行数")
+    deadline_parser.set_defaults(func=bench_deadline)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="端到端获取与处理")
+    pipeline_parser.add_argument("--categories", type=int, default=12)
+    pipeline_parser.add_argument("--sources", type=int, default=40, help="未指定 --fixtures 时生成的来源数量")
+    pipeline_parser.add_argument("--lines", type=int, default=20000, help="每个生成来源的行数")
+    pipeline_parser.add_argument("--per-category", type=int, default=4, help="每个分类引用的来源数量")
+    pipeline_parser.add_argument("--latency", type=float, default=0.1, help="每个请求的基础延迟（秒）")
+    pipeline_parser.add_argument("--fixtures", help="录制的上游规则源目录，每个文件对应一个来源")
+    pipeline_parser.add_argument("--legacy-max", type=int, default=1000)
+    pipeline_parser.set_defaults(func=bench_pipeline)
+
+    unified_parser = subparsers.add_parser("unified", help="Clash 规则文件与 Shadowrocket 配置同一轮构建")
+    unified_parser.add_argument("--categories", type=int, default=12)
+    unified_parser.add_argument("--sources", type=int, default=40, help="未指定 --fixtures 时生成的来源数量")
+    unified_parser.add_argument("--lines", type=int, default=20000, help="每个生成来源的行数")
+    unified_parser.add_argument("--per-category", type=int, default=4, help="每个分类引用的来源数量")
+    unified_parser.add_argument("--latency", type=float, default=0.1, help="每个请求的基础延迟（秒）")
+    unified_parser.add_argument("--fixtures", help="录制的上游规则源目录，每个文件对应一个来源")
+    unified_parser.set_defaults(func=bench_unified)
+
+    jobs_parser = subparsers.add_parser("jobs", help="按分类并行处理")
+    jobs_parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    jobs_parser.add_argument("--categories", type=int, default=24)
+    jobs_parser.add_argument("--lines", type=int, default=40000, help="典型分类的行数")
+    jobs_parser.set_defaults(func=bench_jobs)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# 增量构建的分类指纹记录
+#
+# 每个分类的指纹由 my.wei 中的普通值、各上游 URL 内容的哈希以及优化器版本组成。
+# 指纹与上次构建相同、且上次生成的文件仍然存在时，该分类直接沿用已有文件，
+# 不再重新过滤、优化和写入。
+import os
+import json
+import time
+import hashlib
+import logging
+
+# 指纹文件路径，可通过环境变量覆盖，GitHub Actions 中由 actions/cache 在多次运行之间保留
+STATE_PATH = os.environ.get("DOMAINROUTER_BUILD_STATE", os.path.join(".cache", "build", "state.json"))
+
+def content_hash(text):
+    """
+    计算内容的 sha256 摘要。
+
+    参数：
+        text (str): 内容文本。
+
+    返回：
+        str: 十六进制摘要。
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class BuildState:
+    """
+    分类名到 {指纹, 生成的文件} 的映射，构建结束后整体写回磁盘。
+    """
+
+    def __init__(self, version, path=STATE_PATH):
+        self.version = version
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+            if state.get("version") == version:
+                self.entries = state.get("categories", {})
+            else:
+                logging.info(f"优化器版本已变化，全部分类将重新构建: {state.get('version')} -> {version}")
+        except (OSError, ValueError):
+            pass
+
+    def fingerprint(self, values, url_hashes):
+        """
+        计算分类的指纹。
+
+        参数：
+            values (list): 分类在 my.wei 中的普通值。
+            url_hashes (list): 按配置顺序排列的 (URL, 内容哈希)。
+
+        返回：
+            str: 十六进制指纹。
+        """
+        digest = hashlib.sha256(str(self.version).encode("utf-8"))
+        for value in values:
+            digest.update(b"\0v")
+            digest.update(value.encode("utf-8"))
+        for url, url_hash in url_hashes:
+            digest.update(b"\0u")
+            digest.update(url.encode("utf-8"))
+            digest.update(url_hash.encode("ascii"))
+        return digest.hexdigest()
+
+    def is_fresh(self, key, fingerprint):
+        """
+        判断分类能否沿用上次的输出：指纹一致且上次生成的文件都还在。
+        """
+        entry = self.entries.get(key)
+        return (
+            entry is not None
+            and entry["fingerprint"] == fingerprint
+            and all(os.path.isfile(path) for path in entry["outputs"])
+        )
+
+    def outputs(self, key):
+        """
+        返回分类上次生成的文件列表。
+        """
+        entry = self.entries.get(key)
+        return list(entry["outputs"]) if entry else []
+
+    def record(self, key, fingerprint, outputs):
+        """
+        记录分类本次构建的指纹和生成的文件。
+        """
+        self.entries[key] = {"fingerprint": fingerprint, "outputs": sorted(outputs), "built_at": time.time()}
+
+    def retain(self, keys):
+        """
+        只保留给定分类的记录，返回被移除分类的旧文件，由调用方删除。
+        """
+        removed = []
+        for key in list(self.entries):
+            if key not in keys:
+                removed.extend(self.entries.pop(key)["outputs"])
+        return removed
+
+    def save(self):
+        """
+        先写入临时文件再替换，中断时不会留下损坏的指纹文件。
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"version": self.version, "categories": self.entries}, file, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,115 @@
+# dnsmasq 配置行的生成
+#
+# dnsmasq 的 server=、ipset=、nftset= 指令都可以在一行中以 /a/b/c/ 的形式列出多个域名。
+# 把大量域名合并到少量长行中，可以显著减小配置文件并加快 dnsmasq 在路由器上的启动和重载。
+# dnsmasq 读取配置时每行的缓冲区约为 1025 字节，这里留出余量。
+
+DNSMASQ_MAX_LINE_LENGTH = 1000  # 合并后每行的最大长度
+
+def format_directive(directive, domains, target):
+    """
+    生成一条 dnsmasq 指令，例如 server=/a.com/b.com/119.29.29.29。
+
+    参数：
+        directive (str): 指令名称，如 'server'、'ipset'、'nftset'。
+        domains (list): 域名列表。
+        target (str): 指令的目标，如上游 DNS 地址或集合名称。
+
+    返回：
+        str: 配置行。
+    """
+    return f"{directive}=/{'/'.join(domains)}/{target}"
+
+def pack_directives(directive, domains, target, max_length=DNSMASQ_MAX_LINE_LENGTH):
+    """
+    按顺序把域名合并为若干条指令，每行不超过 max_length 个字符；
+    单个域名本身就超过限制时单独占一行。
+
+    参数：
+        directive (str): 指令名称。
+        domains (iterable): 域名。
+        target (str): 指令的目标。
+        max_length (int): 每行的最大长度。
+
+    生成：
+        str: 配置行。
+    """
+    # 除域名外的固定长度：'指令=/' 以及 '/目标'
+    overhead = len(directive) + 2 + 1 + len(target)
+    batch = []
+    length = overhead
+    for domain in domains:
+        added = len(domain) + (1 if batch else 0)
+        if batch and length + added > max_length:
+            yield format_directive(directive, batch, target)
+            batch = []
+            added = len(domain)
+            length = overhead
+        batch.append(domain)
+        length += added
+    if batch:
+        yield format_directive(directive, batch, target)
+
+def build_conf_lines(domains, server, aggregate=False, ipset=None, nftset=None,
+                     max_length=DNSMASQ_MAX_LINE_LENGTH):
+    """
+    生成把给定域名交给指定上游解析的 dnsmasq 配置，可同时把解析结果加入内核集合。
+
+    参数：
+        domains (list): 已排序的域名列表。
+        server (str): 上游 DNS 地址，如 '119.29.29.29' 或 '119.29.29.29#53'。
+        aggregate (bool): 是否把多个域名合并到同一行。
+        ipset (str): 可选的 ipset 集合名称，多个集合以 ',' 分隔。
+        nftset (str): 可选的 nftset 描述，如 '4#inet#fw4#china_v4,6#inet#fw4#china_v6'。
+        max_length (int): 合并时每行的最大长度。
+
+    返回：
+        list: 配置行。
+    """
+    directives = [("server", server)]
+    if ipset:
+        directives.append(("ipset", ipset))
+    if nftset:
+        directives.append(("nftset", nftset))
+
+    lines = []
+    for directive, target in directives:
+        if aggregate:
+            lines.extend(pack_directives(directive, domains, target, max_length))
+        else:
+            lines.extend(format_directive(directive, [domain], target) for domain in domains)
+    return lines
+
+def rule_set_domains(entries):
+    """
+    把 Clash domain 规则集中的条目转换为 dnsmasq 的域名。
+
+    dnsmasq 的 /example.com/ 同时匹配域名本身及其全部子域名，因此 '+.'、'.' 前缀直接去掉，
+    不带前缀的条目也按后缀处理；'*' 通配符无法在 dnsmasq 中表达，予以跳过。
+    父域名已存在时子域名是冗余的，一并去除。
+
+    参数：
+        entries (iterable): 规则集 payload 中的条目。
+
+    返回：
+        list: 按标签反转后的字典序排列的域名，同一后缀下的域名相邻。
+    """
+    domains = set()
+    for entry in entries:
+        entry = entry.strip().lower()
+        if entry.startswith("+."):
+            entry = entry[2:]
+        elif entry.startswith("."):
+            entry = entry[1:]
+        if entry and "*" not in entry:
+            domains.add(entry)
+
+    result = []
+    for domain in domains:
+        index = domain.find(".")
+        while index != -1 and domain[index + 1:] not in domains:
+            index = domain.find(".", index + 1)
+        if index == -1:
+            result.append(domain)
+    result.sort(key=lambda domain: domain.split(".")[::-1])
+    return result
@@ -1,5 +1,16 @@
+import argparse
 import requests
 import yaml
+from http_cache import HttpCache
+from domain_filter import DomainExclusionIndex
+from yaml_payload import PayloadFormatError, iter_payload, iter_raw_lines
+from dnsmasq_conf import DNSMASQ_MAX_LINE_LENGTH, build_conf_lines
+
+# 上游规则源的条件请求缓存，未修改的内容直接从磁盘读取
+http_cache = HttpCache()
+
+CHINA_DNS_SERVER = "119.29.29.29"  # 国内域名使用的上游 DNS
+OUTPUT_FILE = "dnsmasq/china-domains.conf"  # 默认输出文件
 
 def get_second_level_domain(domain):
     parts = domain.split('.')
@@ -11,35 +22,67 @@ def remove_wildcard(domain):
     # 去掉通配符，只保留域名的主要部分
     return domain.replace('*.', '').replace('+.', '')
 
-def is_subdomain(domain, blacklist):
-    for blacklisted_domain in blacklist:
-        if domain == blacklisted_domain or domain.endswith(f".{blacklisted_domain}"):
-            return True
-    return False
+def fetch_text(url):
+    # 通过缓存发送条件请求，上游不可用时回退到缓存副本
+    try:
+        return http_cache.fetch(url, timeout=30)
+    except requests.RequestException:
+        text = http_cache.stale(url)
+        if text is None:
+            raise
+        return text
+
+def read_payload(url):
+    # 通过缓存流式逐行读取 payload，上游不可用时回退到缓存副本；
+    # 遇到流式读取不支持的写法时回退到完整的 YAML 解析
+    try:
+        try:
+            return list(iter_payload(iter_raw_lines(http_cache.stream(url, timeout=30))))
+        except requests.RequestException:
+            chunks = http_cache.stale_stream(url)
+            if chunks is None:
+                raise
+            return list(iter_payload(iter_raw_lines(chunks)))
+    except PayloadFormatError as e:
+        print(f"{e}，改用完整的 YAML 解析")
+        return (yaml.safe_load(fetch_text(url)) or {}).get('payload', [])
+
+parser = argparse.ArgumentParser(description="生成国内域名的 dnsmasq 配置")
+parser.add_argument("--server", default=CHINA_DNS_SERVER, help=f"上游 DNS 地址，默认为 {CHINA_DNS_SERVER}")
+parser.add_argument("--aggregate", action="store_true", help="把多个域名合并到同一条 server= 行中")
+parser.add_argument("--max-line-length", type=int, default=DNSMASQ_MAX_LINE_LENGTH,
+                    help=f"合并时每行的最大长度，默认为 {DNSMASQ_MAX_LINE_LENGTH}")
+parser.add_argument("--ipset", help="同时生成 ipset= 指令，把解析结果加入给定的集合，多个集合以 ',' 分隔")
+parser.add_argument("--nftset", help="同时生成 nftset= 指令，如 '4#inet#fw4#china_v4,6#inet#fw4#china_v6'")
+parser.add_argument("--output", default=OUTPUT_FILE, help=f"输出文件，默认为 {OUTPUT_FILE}")
+args = parser.parse_args()
 
 # 下载 ChinaMax_Domain.yaml 文件
 china_max_url = "https://raw.githubusercontent.com/blackmatrix7/ios_rule_script/master/rule/Clash/ChinaMax/ChinaMax_Domain.yaml"
-china_max_response = requests.get(china_max_url)
-china_max_data = yaml.safe_load(china_max_response.text)
+payload = read_payload(china_max_url)
 
 # 下载 global_domains.txt 文件
 global_domains_url = "https://raw.githubusercontent.com/angwz/DomainRouter/main/dnsmasq/global_domains.txt"
-global_domains_response = requests.get(global_domains_url)
-global_domains_list = global_domains_response.text.splitlines()
+global_domains_index = DomainExclusionIndex(fetch_text(global_domains_url).splitlines())
+http_cache.prune()
 
-# 提取 payload 部分并处理
-payload = china_max_data.get('payload', [])
 # 去掉通配符并去重
 processed_payload = list(set(remove_wildcard(domain) for domain in payload))
 # 排除 global_domains.txt 中的域名及其子域名
-filtered_payload = [domain for domain in processed_payload if not is_subdomain(domain, global_domains_list)]
+filtered_payload = global_domains_index.filter(processed_payload)
 # 按二级域名排序
 sorted_payload = sorted(filtered_payload, key=get_second_level_domain)
 
 # 转换格式
-transformed_lines = [f"server=/{domain}/119.29.29.29" for domain in sorted_payload]
+transformed_lines = build_conf_lines(
+    sorted_payload,
+    args.server,
+    aggregate=args.aggregate,
+    ipset=args.ipset,
+    nftset=args.nftset,
+    max_length=args.max_line_length,
+)
 
 # 保存到文件
-output_file = "dnsmasq/china-domains.conf"
-with open(output_file, 'w') as f:
+with open(args.output, 'w') as f:
     f.write("\n".join(transformed_lines))
@@ -0,0 +1,75 @@
+# 域名排除索引
+#
+# 将排除列表中的每个域名存入哈希集合，判断时依次查找待测域名自身及其每一级父域名，
+# 查找次数只与标签数量有关，与排除列表的规模无关。可作为任意分类的反向过滤器使用。
+
+def normalize_excluded_domain(entry):
+    """
+    规范化排除列表中的一行：去除空白、注释以及 '+.'、'*.'、'.' 前缀。
+
+    参数：
+        entry (str): 排除列表中的一行。
+
+    返回：
+        str: 规范化后的域名，空行或注释返回空字符串。
+    """
+    entry = entry.strip()
+    if not entry or entry.startswith("#"):
+        return ""
+    for prefix in ("+.", "*.", "."):
+        if entry.startswith(prefix):
+            return entry[len(prefix):]
+    return entry
+
+class DomainExclusionIndex:
+    """
+    排除列表中的域名及其全部子域名都会被匹配，与逐条检查
+    domain == excluded or domain.endswith("." + excluded) 的结果一致。
+    """
+
+    def __init__(self, domains=()):
+        self.domains = set()
+        self.update(domains)
+
+    def update(self, domains):
+        """
+        向索引中加入更多排除域名。
+
+        参数：
+            domains (iterable): 排除列表中的行。
+        """
+        for entry in domains:
+            domain = normalize_excluded_domain(entry)
+            if domain:
+                self.domains.add(domain)
+
+    def __len__(self):
+        return len(self.domains)
+
+    def __contains__(self, domain):
+        """
+        判断域名本身或其任一父域名是否在排除列表中。
+        """
+        domains = self.domains
+        if domain in domains:
+            return True
+        index = domain.find(".")
+        while index != -1:
+            if domain[index + 1:] in domains:
+                return True
+            index = domain.find(".", index + 1)
+        return False
+
+    def filter(self, domains):
+        """
+        移除被排除的域名，保持原有顺序。
+
+        参数：
+            domains (iterable): 待过滤的域名。
+
+        返回：
+            list: 未被排除的域名。
+        """
+        if not self.domains:
+            return list(domains)
+        return [domain for domain in domains if domain not in self]
@@ -1,12 +1,36 @@
 # 导入所需的模块
 import os
 import re
+import string
+import codecs
+import json
+import hashlib
 import time
 import logging
 import requests
+import bisect
+import random
+import socket
+import asyncio
 import ipaddress
+from array import array
+from urllib.parse import urlsplit
 from datetime import datetime, timedelta, timezone
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from http_cache import CancelToken, HttpCache
+from build_state import BuildState, content_hash
+from dnsmasq_conf import build_conf_lines, rule_set_domains
+from domain_filter import DomainExclusionIndex
+from yaml_payload import iter_payload
+import mrs_rule_set
+import sing_box_rule_set
+import xray_geodata
+import xray_routing
+import generate_rulesets
+from ip_cidr import IPV4_CIDR_PATTERN, parse_cidr
+import generate_shadowrocket_conf as shadowrocket
 
 # 配置日志记录，设置日志文件名、级别和格式
 log_file = "py_log.txt"
@@ -27,6 +51,44 @@ CONFIG_URL = "https://raw.githubusercontent.com/angwz/DomainRouter/main/my.wei"
 MAX_RETRIES = 3  # 最大重试次数
 RETRY_WAIT_TIME = 5  # 重试等待时间（秒）
 
+# 子内容请求的超时、并发和退避设置
+REQUEST_TIMEOUT = 30  # 单次请求超时时间（秒）
+FETCH_DEADLINE = 600  # 获取全部子内容的整体截止时间（秒）
+MAX_CONCURRENCY = 16  # 全局最大并发请求数
+MAX_CONNECTIONS_PER_HOST = 6  # 单个主机的最大并发请求数
+RETRY_BACKOFF_BASE = 1  # 首次重试前的基础等待时间（秒）
+RETRY_BACKOFF_MAX = 30  # 单次重试等待时间上限（秒）
+
+# 上游规则源的条件请求缓存，未修改的内容直接从磁盘读取
+HTTP_CACHE = HttpCache()
+
+# 优化器版本，计入增量构建的指纹；修改过滤、分类、优化或输出格式的逻辑时需要递增
+OPTIMIZER_VERSION = 2
+
+# 生成的规则文件所在的文件夹
+OUTPUT_FOLDERS = ["domain", "classic", "ipcidr"]
+
+# 与每个 YAML 规则文件同时生成的 text 格式规则文件（mihomo rule-provider 的 format: text）的扩展名
+TEXT_EXTENSION = ".list"
+
+# 规则文件清单，记录每个文件的 sha256、大小和条目数
+MANIFEST_PATH = "manifest.json"
+
+# 由分类生成的 dnsmasq 配置所在的文件夹
+DNSMASQ_FOLDER = "dnsmasq"
+
+# 由 domain 和 ipcidr 规则文件生成的 mihomo 二进制规则集所在的文件夹
+MRS_FOLDER = "mrs"
+
+# 由分类的全部规则文件生成的 sing-box 规则集（source JSON 和 .srs）所在的文件夹
+SING_BOX_FOLDER = "sing-box"
+
+# 由全部分类生成的 Xray 资源文件（geosite.dat 和 geoip.dat）及路由规则所在的文件夹
+XRAY_FOLDER = "xray-geodata"
+
+# 由 [Rules] 段落生成的 Xray 路由规则
+XRAY_ROUTING_PATH = os.path.join(XRAY_FOLDER, "routing.json")
+
 def fetch_config(url):
     """
     获取核心配置文件内容。
@@ -104,81 +166,308 @@ def parse_config(content):
 
     return data_dict  # 返回解析后的数据字典
 
-def fetch_url_content(url):
+def retry_delay(attempt):
+    """
+    计算第 attempt 次失败后的等待时间：指数退避并加入随机抖动，
+    避免大量请求在同一时刻重试。
+
+    参数：
+        attempt (int): 已失败的次数，从 1 开始。
+
+    返回：
+        float: 等待的秒数。
+    """
+    delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def create_session(pool_size=MAX_CONNECTIONS_PER_HOST):
+    """
+    创建复用连接的 requests 会话，每个主机保持一个 keep-alive 连接池。
+
+    参数：
+        pool_size (int): 每个主机连接池的大小。
+
+    返回：
+        requests.Session: 配置好的会话。
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def split_content_lines(text):
+    """
+    将内容分割为行，并去除空白行。
+
+    参数：
+        text (str): 响应内容。
+
+    返回：
+        list: 去除首尾空白后的非空行列表。
+    """
+    return [line.strip() for line in text.split("\n") if line.strip()]
+
+def request_url_lines(session, url, timeout=REQUEST_TIMEOUT, cancel=None):
+    """
+    通过磁盘缓存发送一次条件 GET 请求，返回去除空白行后的内容。
+
+    参数：
+        session (requests.Session): 复用连接的会话。
+        url (str): 要请求的 URL。
+        timeout (float): 单次请求的超时时间（秒）。
+        cancel (CancelToken): 可选的取消标记。
+
+    返回：
+        list: 请求到的内容列表。
+    """
+    return split_content_lines(HTTP_CACHE.fetch(url, session, timeout, cancel=cancel))
+
+def stale_url_lines(url):
+    """
+    上游多次请求失败后回退到缓存中的旧副本。
+
+    参数：
+        url (str): 要请求的 URL。
+
+    返回：
+        list: 旧副本的内容列表，没有缓存时返回空列表。
+    """
+    text = HTTP_CACHE.stale(url)
+    return split_content_lines(text) if text is not None else []
+
+def request_url_records(session, url, timeout=REQUEST_TIMEOUT, cancel=None):
+    """
+    通过磁盘缓存流式请求 URL，按规则源格式直接解析为分好组的条目。
+
+    参数：
+        session (requests.Session): 复用连接的会话。
+        url (str): 要请求的 URL。
+        timeout (float): 单次请求的超时时间（秒）。
+        cancel (CancelToken): 可选的取消标记。
+
+    返回：
+        tuple: (域名列表, IP/CIDR 列表, 经典规则列表)。
     """
-    获取给定 URL 的内容，支持重试。
+    return group_records(source_records(url, HTTP_CACHE.stream(url, session, timeout, cancel=cancel)))
+
+def stale_url_records(url):
+    """
+    上游多次请求失败后回退到缓存中的旧副本，按规则源格式解析。
 
     参数：
         url (str): 要请求的 URL。
 
     返回：
-        list: 请求到的内容列表，如果获取失败则返回空列表。
+        tuple: (域名列表, IP/CIDR 列表, 经典规则列表)，没有缓存时三组均为空。
+    """
+    chunks = HTTP_CACHE.stale_stream(url)
+    return group_records(source_records(url, chunks) if chunks is not None else ())
+
+async def fetch_url_content_async(session, url, executor, global_limit, host_limits, deadline,
+                                  read=None, fallback=None, cancel=None):
     """
-    # 循环尝试获取 URL 内容，最多重试 MAX_RETRIES 次
+    在事件循环中获取单个 URL 的内容，受全局和单主机并发数限制。
+
+    请求本身在线程池中执行以复用 requests 的连接池；退避等待期间会释放并发名额，
+    且不会超过整体截止时间。
+
+    参数：
+        session (requests.Session): 复用连接的会话。
+        url (str): 要请求的 URL。
+        executor (ThreadPoolExecutor): 执行阻塞请求的线程池。
+        global_limit (asyncio.Semaphore): 全局并发限制。
+        host_limits (dict): 主机名到 asyncio.Semaphore 的映射。
+        deadline (float): 整体截止时间（loop.time() 时间戳）。
+        read (callable): 以 (会话, URL, 超时, 取消标记) 调用的读取函数，默认为 request_url_lines。
+        fallback (callable): 多次失败后以 URL 调用的回退函数，默认为 stale_url_lines。
+        cancel (CancelToken): 可选的取消标记，传给读取函数。
+
+    返回：
+        list: 请求到的内容列表，如果获取失败则返回缓存副本或空列表。
+    """
+    read = read or request_url_lines
+    fallback = fallback or stale_url_lines
+    loop = asyncio.get_running_loop()
+    host_limit = host_limits[urlsplit(url).netloc]
     for attempt in range(1, MAX_RETRIES + 1):
+        remaining = deadline - loop.time()
         try:
-            logging.info(f"请求子内容: {url}")
-            # 发送 GET 请求获取内容
-            response = requests.get(url)
-            response.raise_for_status()  # 检查请求是否成功
-            logging.info(f"成功获取子内容: {url}")
-            # 分割内容为行，并去除空白行
-            return [line.strip() for line in response.text.split("\n") if line.strip()]
+            # 先占用主机名额再占用全局名额，避免排队中的同主机请求占满全局名额
+            async with host_limit, global_limit:
+                logging.info(f"请求子内容: {url}")
+                timeout = max(0.1, min(REQUEST_TIMEOUT, remaining))
+                lines = await loop.run_in_executor(executor, read, session, url, timeout, cancel)
+                logging.info(f"成功获取子内容: {url}")
+                return lines
         except requests.exceptions.RequestException as e:
-            # 如果请求失败，记录警告并等待一段时间后重试
             logging.warning(f"重试 {url} 由于错误: {e} (尝试次数: {attempt})")
-            time.sleep(RETRY_WAIT_TIME)  # 等待指定的秒数
-            if attempt == MAX_RETRIES:
-                logging.error(f"资源 {url} 不存在，已重试 {MAX_RETRIES} 次")
-                return []  # 返回空列表表示获取失败
+            delay = retry_delay(attempt)
+            if attempt < MAX_RETRIES and loop.time() + delay < deadline:
+                await asyncio.sleep(delay)
+            else:
+                break
+    logging.error(f"资源 {url} 获取失败，已尝试 {attempt} 次")
+    return fallback(url)
 
-def fetch_all_urls(data_dict):
+async def fetch_urls_async(urls, max_concurrency=MAX_CONCURRENCY,
+                           max_per_host=MAX_CONNECTIONS_PER_HOST, deadline=FETCH_DEADLINE, on_result=None,
+                           read=None, fallback=None):
     """
-    并行获取所有需要请求的 URL 内容。
+    并发获取一组 URL 的内容。
 
     参数：
-        data_dict (dict): 数据字典。
+        urls (iterable): 要请求的 URL。
+        max_concurrency (int): 全局最大并发请求数。
+        max_per_host (int): 单个主机的最大并发请求数，同时也是该主机的连接池大小。
+        deadline (float): 整体截止时间（秒），超时未完成的 URL 视为获取失败。
+        on_result (callable): 可选回调，每个 URL 得到最终内容后立即以 (url, 内容列表) 调用。
+        read (callable): 读取函数，默认为 request_url_lines。
+        fallback (callable): 回退函数，默认为 stale_url_lines。
 
     返回：
-        dict: 所有 URL 对应的内容，键为 URL，值为内容列表。
+        dict: URL 到内容列表的映射。
+    """
+    urls = list(urls)
+    if not urls:
+        return {}
+
+    loop = asyncio.get_running_loop()
+    end_time = loop.time() + deadline
+    global_limit = asyncio.Semaphore(max_concurrency)
+    host_limits = {host: asyncio.Semaphore(max_per_host) for host in {urlsplit(url).netloc for url in urls}}
+
+    # 线程池和会话不使用 with：退出时会等待仍在下载的请求，截止时间就不再起作用
+    session = create_session(max_per_host)
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    cancel = CancelToken()
+    try:
+        async def fetch_one(url):
+            lines = await fetch_url_content_async(
+                session, url, executor, global_limit, host_limits, end_time, read, fallback, cancel
+            )
+            if on_result is not None:
+                on_result(url, lines)
+            return lines
+
+        tasks = {asyncio.ensure_future(fetch_one(url)): url for url in urls}
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+        if pending:
+            cancel.cancel()  # 中断仍在读取的响应，被放弃的下载不再写入缓存
+        results = {}
+        for task, url in tasks.items():
+            if task in done:
+                results[url] = task.result()
+                continue
+            task.cancel()
+            logging.error(f"资源 {url} 超过整体截止时间 {deadline} 秒，已放弃")
+            results[url] = (fallback or stale_url_lines)(url)
+            if on_result is not None:
+                on_result(url, results[url])
+        return results
+    finally:
+        cancel.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+        session.close()
+
+async def run_pipeline_async(data_dict, process, jobs=1, state=None, extra_urls=()):
     """
-    all_urls = set()
-    # 收集所有需要请求的 URL
-    for key in data_dict:
-        all_urls.update(data_dict[key]['urls'])
+    流水线调度：按 URL 记录依赖它的分类，某个分类的最后一个 URL 完成后立即把该分类
+    交给处理线程或进程，网络请求与过滤、分类、优化和写文件的计算相互重叠。
 
-    fetched_contents = {}  # 初始化存储获取内容的字典
-    # 使用线程池并行请求所有 URL
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        # 提交所有请求任务
-        future_to_url = {executor.submit(fetch_url_content, url): url for url in all_urls}
-        # 等待所有请求完成
-        for future in as_completed(future_to_url):
-            url = future_to_url[future]
-            fetched_contents[url] = future.result()  # 获取请求结果
+    jobs 为 1 时只有一个处理线程，各分类依次处理；大于 1 时分类分发到进程池。
+    提供 state 时为增量构建：指纹未变化的分类沿用上次的文件，不再处理。
 
-    return fetched_contents  # 返回所有获取的内容
+    参数：
+        data_dict (dict): parse_config 返回的数据字典。
+        process (callable): 以 (键, 打包后的分组条目, 错误列表) 调用、返回打包后被删除条目的处理函数。
+        jobs (int): 并行处理的进程数。
+        state (BuildState): 可选的增量构建指纹记录，会被原地更新。
+        extra_urls (iterable): 不属于任何分类、但需要在同一轮中一并获取的 URL，如 Shadowrocket 配置引用的规则源。
 
-def merge_url_contents(data_dict, fetched_contents):
+    返回：
+        dict: URL 到 (域名列表, IP/CIDR 列表, 经典规则列表) 的映射，包含全部分类和 extra_urls 的规则源。
     """
-    将获取的 URL 内容合并回数据字典。
+    loop = asyncio.get_running_loop()
+    fetched_contents = {}
+    url_hashes = {}  # URL -> 内容哈希，仅增量构建时计算
+    remaining = {}  # 分类 -> 尚未完成的 URL 数量
+    dependents = {}  # URL -> 依赖它的分类
+    for key, content in data_dict.items():
+        urls = set(content["urls"])
+        remaining[key] = len(urls)
+        for url in urls:
+            dependents.setdefault(url, []).append(key)
+    for url in extra_urls:
+        dependents.setdefault(url, [])
+
+    if jobs > 1:
+        process_executor = ProcessPoolExecutor(max_workers=jobs)
+    else:
+        process_executor = ThreadPoolExecutor(max_workers=1)
+    with process_executor:
+        processing = []
+        built = []  # (分类, 指纹)，与 processing 一一对应
+
+        def dispatch(key):
+            content = data_dict[key]
+            fingerprint = None
+            if state is not None:
+                fingerprint = state.fingerprint(content["values"], [(url, url_hashes[url]) for url in content["urls"]])
+                if state.is_fresh(key, fingerprint):
+                    logging.info(f"分类 {key} 的输入未变化，沿用上次生成的文件")
+                    return
+            built.append((key, fingerprint))
+
+            # 按配置中的顺序把各 URL 的条目追加到普通值之后
+            groups = normalize_values(content["values"])
+            for url in content["urls"]:
+                for group, records in zip(groups, fetched_contents.get(url, ((), (), ()))):
+                    group.extend(records)
+            logging.info(f"分类 {key} 的全部来源已就绪，开始处理")
+            processing.append(loop.run_in_executor(
+                process_executor, process, key, tuple(pack_lines(group) for group in groups), content["errors"]
+            ))
+
+        def on_result(url, groups):
+            fetched_contents[url] = groups
+            if state is not None:
+                url_hashes[url] = content_hash("\0".join(pack_lines(group) for group in groups))
+            for key in dependents.get(url, []):
+                remaining[key] -= 1
+                if remaining[key] == 0:
+                    dispatch(key)
+
+        # 不依赖任何 URL 的分类无需等待网络
+        for key, count in remaining.items():
+            if count == 0:
+                dispatch(key)
+
+        await fetch_urls_async(dependents, on_result=on_result, read=request_url_records, fallback=stale_url_records)
+        for removed_items in await asyncio.gather(*processing):
+            write_to_delete_file(unpack_lines(removed_items))
+
+    if state is not None:
+        for key, fingerprint in built:
+            state.record(key, fingerprint, [path for path in rule_file_paths(key) if os.path.isfile(path)])
+        logging.info(f"增量构建：重新生成 {len(built)} 个分类，沿用 {len(data_dict) - len(built)} 个分类")
+    return fetched_contents
+
+def run_pipeline(data_dict, process=None, jobs=1, state=None, extra_urls=()):
+    """
+    以流水线方式获取并处理所有分类。
 
     参数：
-        data_dict (dict): 数据字典。
-        fetched_contents (dict): 所有 URL 对应的内容。
+        data_dict (dict): parse_config 返回的数据字典。
+        process (callable): 分类处理函数，默认为 process_packed_category。
+        jobs (int): 并行处理的进程数。
+        state (BuildState): 可选的增量构建指纹记录，提供时只重新生成输入变化的分类。
+        extra_urls (iterable): 需要一并获取和解析的其他 URL。
 
     返回：
-        dict: 更新后的数据字典。
+        dict: URL 到解析后分组条目的映射，供 Shadowrocket 配置复用。
     """
-    # 遍历数据字典，将获取的内容合并回去
-    for key in data_dict:
-        values = data_dict[key]['values']
-        urls = data_dict[key]['urls']
-        for url in urls:
-            # 将 URL 对应的内容添加到 values 列表
-            values.extend(fetched_contents.get(url, []))
-        data_dict[key]['values'] = values  # 更新 values 列表
-    return data_dict  # 返回更新后的数据字典
+    return asyncio.run(run_pipeline_async(data_dict, process or process_packed_category, jobs, state, extra_urls))
 
 def write_to_delete_file(items):
     """
@@ -187,6 +476,8 @@ def write_to_delete_file(items):
     参数：
         items (list): 要写入文件的列表。
     """
+    if not items:
+        return
     # 以追加模式打开文件，编码为 utf-8
     with open('delete_data.txt', 'a', encoding='utf-8') as file:
         for item in items:
@@ -239,10 +530,124 @@ def filter_invalid_domains(domain_list):
 
     return filtered_list  # 返回过滤后的域名列表
 
+def reverse_domain_labels(domain):
+    """
+    按标签反转域名，例如 'www.example.com' -> 'com.example.www'。
+
+    反转后同一后缀下的所有域名在字典序中是连续的一段。
+
+    参数：
+        domain (str): 域名条目。
+
+    返回：
+        str: 反转后的域名。
+    """
+    return ".".join(reversed(domain.split(".")))
+
+class DomainSuffixIndex:
+    """
+    按反向标签排序的域名索引，用于一次性找出某个后缀覆盖的全部条目。
+    """
+
+    def __init__(self, domains):
+        self.domains = {reverse_domain_labels(domain): domain for domain in domains}
+        self.keys = sorted(self.domains)
+        self.swept = {}  # 已扫描区间的起点 -> (终点, 发起扫描的条目)
+
+    def sweep(self, suffix, keep, removed_domains):
+        """
+        移除所有以 '.' + suffix 结尾的条目，等价于对整张列表执行 endswith 检查。
+
+        嵌套后缀的区间已被扫过时直接跳过，只补上发起那次扫描的条目，
+        因此整体仍是线性复杂度。
+
+        参数：
+            suffix (str): 后缀，不含开头的 '.'。
+            keep (str): 发起移除的条目本身，不会被移除。
+            removed_domains (set): 被移除的域名集合，会被原地更新。
+        """
+        prefix = reverse_domain_labels(suffix) + "."
+        keys = self.keys
+        start = index = bisect.bisect_left(keys, prefix)
+        while index < len(keys) and keys[index].startswith(prefix):
+            if index in self.swept:
+                index, inner_keep = self.swept[index]
+                if inner_keep != keep:
+                    removed_domains.add(inner_keep)
+                continue
+            domain = self.domains[keys[index]]
+            if domain != keep:
+                removed_domains.add(domain)
+            index += 1
+        if index > start:
+            self.swept[start] = (index, keep)
+
+class WildcardDomainIndex:
+    """
+    以反向标签组织的通配符前缀树，'*' 标签作为可匹配任意单个标签的通配边。
+
+    与 mihomo 一致，'*' 只匹配一个完整的标签：'*.example.com' 匹配
+    'www.example.com'，但不匹配 'example.com' 或 'a.www.example.com'。
+    标签中夹带的 '*'（如 'cdn*.example.com'）按普通字符处理。
+    """
+
+    def __init__(self, patterns):
+        self.root = {}
+        self.size = 0
+        for pattern in patterns:
+            labels = pattern.split(".")
+            if pattern.startswith(("+", ".")) or "*" not in labels:
+                continue  # 后缀规则和不含整标签通配符的条目不参与通配匹配
+            node = self.root
+            for label in reversed(labels):
+                node = node.setdefault(label, {})
+            node[None] = pattern  # None 键存放在此结束的通配规则
+            self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    def covers(self, domain):
+        """
+        判断条目是否被除自身以外的某条通配规则完全覆盖。
+
+        条目本身也可以是通配规则：'*.example.com' 只有在对应位置同样为 '*'
+        时才会被覆盖，例如 '*.*.com'。
+
+        参数：
+            domain (str): 不带 '+.' 或 '.' 前缀的域名条目。
+
+        返回：
+            bool: 是否被覆盖。
+        """
+        labels = domain.split(".")
+        labels.reverse()
+        depth = len(labels)
+        stack = [(self.root, 0)]
+        while stack:
+            node, index = stack.pop()
+            if index == depth:
+                pattern = node.get(None)
+                if pattern is not None and pattern != domain:
+                    return True
+                continue
+            label = labels[index]
+            if label != "*":
+                child = node.get(label)
+                if child is not None:
+                    stack.append((child, index + 1))
+            child = node.get("*")
+            if child is not None:
+                stack.append((child, index + 1))
+        return False
+
 def optimize_domains(domain_list):
     """
     优化域名列表，去除冗余的域名。
 
+    '+.' 和 '.' 开头的后缀规则通过反向标签排序索引一次性找到其覆盖的条目，
+    不再对整张列表逐一比较。通配符按 Clash 的语义处理，'*' 只匹配单个标签。
+
     参数：
         domain_list (list): 域名列表。
 
@@ -255,6 +660,7 @@ def optimize_domains(domain_list):
     domain_set = set(filter_invalid_domains(domain_list))  # 过滤无效域名并去重
     # 按照后缀长度从长到短排序
     sorted_domains = sorted(domain_set, key=lambda x: (-x.count('.'), x))
+    suffix_index = DomainSuffixIndex(sorted_domains)
 
     optimized_set = set()
     removed_domains = set()
@@ -263,69 +669,117 @@ def optimize_domains(domain_list):
     for domain in sorted_domains:
         if domain in removed_domains:
             continue
-        if domain.startswith('+'):
-            # 如果域名以 '+' 开头，移除其余相同后缀的域名
-            suffix = domain[1:]
-            for other_domain in sorted_domains:
-                if other_domain != domain and other_domain.endswith(suffix):
-                    removed_domains.add(other_domain)
-        elif domain.startswith('.'):
-            # 如果域名以 '.' 开头，移除其余以该后缀结尾的域名
-            suffix = domain
-            for other_domain in sorted_domains:
-                if other_domain != domain and other_domain.endswith(suffix):
-                    removed_domains.add(other_domain)
-        elif '*' in domain:
-            # 处理包含 '*' 的通配符域名
-            pattern = domain.replace('.', r'\.').replace('*', r'.*')
-            regex = re.compile(f'^{pattern}$')
-            for other_domain in sorted_domains:
-                if other_domain != domain and regex.match(other_domain):
-                    removed_domains.add(other_domain)
+        if domain.startswith('+') or domain.startswith('.'):
+            # 后缀规则：'+.example.com' 与 '.example.com' 都移除以 '.example.com' 结尾的其他域名
+            suffix_index.sweep(domain[2:] if domain.startswith('+') else domain[1:], domain, removed_domains)
 
         optimized_set.add(domain)  # 将域名添加到优化集合
 
+    # 所有未被后缀规则移除的通配符规则在一次遍历中统一匹配
+    wildcard_index = WildcardDomainIndex(
+        domain for domain in domain_set if '*' in domain and domain not in removed_domains
+    )
+    if wildcard_index:
+        removed_domains.update(
+            domain for domain in domain_set
+            if not domain.startswith(('+', '.')) and wildcard_index.covers(domain)
+        )
+
     final_domains = optimized_set - removed_domains  # 去除被移除的域名
     return list(final_domains)  # 返回优化后的域名列表
 
-def optimize_cidrs(cidrs):
+def merge_ranges(ranges):
     """
-    优化 CIDR 列表，合并重叠的网络。
+    合并已按起始地址排序的整数区间，重叠或首尾相接的区间合并为一个。
 
     参数：
-        cidrs (list): CIDR 列表。
+        ranges (iterable): 按起始地址排序的 (起始地址, 结束地址) 序列。
 
     返回：
-        list: 优化后的 CIDR 列表。
+        list: 合并后的区间列表。
     """
-    if not cidrs:
-        return []
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
 
-    # 分别处理 IPv4 和 IPv6 的 CIDR
-    ipv4_cidrs = [cidr for cidr in cidrs if ipaddress.ip_network(cidr).version == 4]
-    ipv6_cidrs = [cidr for cidr in cidrs if ipaddress.ip_network(cidr).version == 6]
+def range_to_cidrs(start, end, max_prefixlen):
+    """
+    将整数区间拆分为数量最少的 CIDR。
 
-    optimized_ipv4 = optimize_single_cidr_list(ipv4_cidrs) if ipv4_cidrs else []
-    optimized_ipv6 = optimize_single_cidr_list(ipv6_cidrs) if ipv6_cidrs else []
+    参数：
+        start (int): 起始地址。
+        end (int): 结束地址。
+        max_prefixlen (int): 地址位数，IPv4 为 32，IPv6 为 128。
 
-    return optimized_ipv4 + optimized_ipv6  # 返回优化后的 CIDR 列表
+    返回：
+        list: (网络地址, 前缀长度) 列表，按地址升序排列。
+    """
+    cidrs = []
+    while start <= end:
+        # 起始地址能对齐的最大块，再缩小到不超过区间剩余长度
+        size = start & -start if start else 1 << max_prefixlen
+        while size > end - start + 1:
+            size >>= 1
+        cidrs.append((start, max_prefixlen - size.bit_length() + 1))
+        start += size
+    return cidrs
+
+def format_cidr(version, address, prefixlen):
+    """
+    将整数地址和前缀长度转换回 CIDR 字符串，格式与 str(ip_network) 相同。
 
-def optimize_single_cidr_list(cidrs):
+    参数：
+        version (int): IP 版本。
+        address (int): 网络地址。
+        prefixlen (int): 前缀长度。
+
+    返回：
+        str: CIDR 字符串。
+    """
+    if version == 4:
+        return f"{address >> 24}.{address >> 16 & 255}.{address >> 8 & 255}.{address & 255}/{prefixlen}"
+    return f"{ipaddress.IPv6Address(address)}/{prefixlen}"
+
+def optimize_cidrs(cidrs):
     """
-    优化单一类型的 CIDR 列表（IPv4 或 IPv6）。
+    优化 CIDR 列表，合并重叠和相邻的网络，并按地址数值排序。
+
+    每个条目只解析一次：IPv4 区间以 (起始地址 << 32 | 结束地址) 打包存入 array，
+    一次整数排序即可按起始地址排好序；IPv6 区间以整数对保存。合并后再拆回最少的 CIDR。
 
     参数：
         cidrs (list): CIDR 列表。
 
     返回：
-        list: 优化后的 CIDR 列表。
+        list: 优化后的 CIDR 列表，IPv4 在前，IPv6 在后。
     """
-    # 将字符串转换为 ip_network 对象并去重
-    cidr_networks = {ipaddress.ip_network(cidr, strict=False) for cidr in cidrs}
-    # 合并重叠和连续的网络
-    optimized_networks = ipaddress.collapse_addresses(cidr_networks)
-    # 将 ip_network 对象转换回字符串
-    return [str(network) for network in optimized_networks]
+    if not cidrs:
+        return []
+
+    ipv4_ranges = array("Q")
+    ipv6_ranges = []
+    for cidr in cidrs:
+        parsed = parse_cidr(cidr)
+        if parsed is None:
+            continue
+        version, start, end = parsed
+        if version == 4:
+            ipv4_ranges.append(start << 32 | end)
+        else:
+            ipv6_ranges.append((start, end))
+
+    optimized = []
+    for start, end in merge_ranges((key >> 32, key & 0xFFFFFFFF) for key in sorted(ipv4_ranges)):
+        optimized.extend(format_cidr(4, address, prefixlen) for address, prefixlen in range_to_cidrs(start, end, 32))
+    for start, end in merge_ranges(sorted(ipv6_ranges)):
+        optimized.extend(format_cidr(6, address, prefixlen) for address, prefixlen in range_to_cidrs(start, end, 128))
+
+    return optimized  # 返回优化后的 CIDR 列表
 
 def optimize_list(input_list):
     """
@@ -344,51 +798,134 @@ def optimize_list(input_list):
     except ValueError:
         return optimize_domains(input_list)  # 调用域名优化函数
 
-def filter_and_trim_values(values):
+# 过滤、修剪和分类上游条目使用的模式
+BARE_DOMAIN_PATTERN = re.compile(r"^(?=.{1,253}$)(?!-)[A-Za-z0-9-]{1,63}(?<!-)(\.[A-Za-z]{2,6})+$")
+TRIM_PATTERN = re.compile(r"^[^\w\u4e00-\u9fa5:+*.]+|[^\w\u4e00-\u9fa5:+*.]+$")
+SPECIAL_CHARACTER_PATTERN = re.compile(r"[^a-zA-Z0-9\u4e00-\u9fa5()$/\\^,:+*.-]")
+DOMAIN_LINE_PATTERN = re.compile(r"(\+\..*|\*.*|DOMAIN-SUFFIX,.*|DOMAIN,.*|^[a-zA-Z0-9\-.]+$)", re.IGNORECASE)
+
+# 首尾除单词字符外允许保留的字符
+TRIM_KEEP_CHARACTERS = frozenset("_:+*.")
+# 删除 ASCII 中的合法字符，剩下的长度即为特殊字符数量
+ALLOWED_ASCII_TABLE = str.maketrans("", "", string.ascii_letters + string.digits + "()$/\\^,:+*.-")
+
+def classify_ip_literal(text):
     """
-    过滤和修剪值，剔除无效或非法的内容。
+    判断字符串是否为 IP 地址或网段，结果与依次尝试 ip_address、ip_network(strict=False) 一致。
+
+    常见的 IPv4 写法由正则直接判断，IPv6 由 inet_pton 判断；既不含 ':' 也不含 '/'
+    又不符合 IPv4 写法的字符串不可能被 ipaddress 接受，直接返回，其余情况交给 ipaddress 处理。
 
     参数：
-        values (list): 原始值列表。
+        text (str): 待判断的字符串。
 
     返回：
-        list: 过滤和修剪后的值列表。
+        tuple: (版本, 是否为网段)，不是 IP 时返回 None。
     """
-    filtered_values = []
-    # 域名的正则表达式模式
-    domain_pattern = re.compile(r"^(?=.{1,253}$)(?!-)[A-Za-z0-9-]{1,63}(?<!-)(\.[A-Za-z]{2,6})+$")
+    match = IPV4_CIDR_PATTERN.fullmatch(text)
+    if match:
+        a, b, c, d, prefix = match.groups()
+        if int(a) <= 255 and int(b) <= 255 and int(c) <= 255 and int(d) <= 255 \
+                and (prefix is None or int(prefix) <= 32):
+            return 4, prefix is not None
+        return None
+    if ":" in text:
+        # 与 parse_cidr 相同，IPv6 先交给 inet_pton，失败时再由 ipaddress 兜底
+        address, slash, prefix = text.partition("/")
+        if not slash or (prefix.isascii() and prefix.isdigit() and int(prefix) <= 128):
+            try:
+                socket.inet_pton(socket.AF_INET6, address)
+            except (OSError, ValueError):
+                pass
+            else:
+                return 6, bool(slash)
+    elif "/" not in text:
+        return None
+    try:
+        return ipaddress.ip_address(text).version, False
+    except ValueError:
+        pass
+    try:
+        return ipaddress.ip_network(text, strict=False).version, True
+    except ValueError:
+        return None
 
-    for item in values:
-        item = "".join(item.split())  # 去除所有空白字符
+def normalize_records(values):
+    """
+    单次扫描完成过滤、修剪和分类：跳过注释和 payload 行，裸域名添加 '+.' 前缀，
+    其余条目修剪首尾的非法字符，特殊字符超过 3 个的条目予以剔除。
 
-        if item.startswith("#") or item.startswith("payload"):
-            logging.info(f"跳过行: {item}")
-            continue
+    每行只做必要的检查：首尾字符合法时跳过修剪，纯 ASCII 的行用 translate 统计特殊字符，
+    IP 判断走 classify_ip_literal 的快速路径，不再依赖异常。
 
-        if domain_pattern.match(item):
-            # 如果是有效的域名，添加 '+.' 前缀
-            filtered_values.append(f"+.{item}")
-            logging.info(f"添加域名: +.{item}")
+    参数：
+        values (iterable): 原始行。
+
+    生成：
+        tuple: (类型, 值)，类型为 'suffix'、'wildcard'、'domain'、'ipv4'、'ipv6' 或 'classic'。
+    """
+    bare_domain = BARE_DOMAIN_PATTERN.match
+    domain_line = DOMAIN_LINE_PATTERN.match
+    keep = TRIM_KEEP_CHARACTERS
+    for line in values:
+        item = "".join(line.split())  # 去除所有空白字符
+        if not item or item[0] == "#" or item.startswith("payload"):
+            continue
+        if bare_domain(item):
+            yield "suffix", f"+.{item}"
             continue
 
-        # 修剪字符串，去除非法字符
-        item_trimmed = re.sub(r"^[^\w\u4e00-\u9fa5:+*.]+|[^\w\u4e00-\u9fa5:+*.]+$", "", item)
-        # 统计特殊字符的数量
-        special_characters_count = len(re.findall(r"[^a-zA-Z0-9\u4e00-\u9fa5()$/\\^,:+*.-]", item_trimmed))
+        first, last = item[0], item[-1]
+        if not ((first.isalnum() or first in keep) and (last.isalnum() or last in keep)):
+            item = TRIM_PATTERN.sub("", item)
+            if not item:
+                continue  # 修剪后为空的行最终也不会输出
+        if item.isascii():
+            special_characters_count = len(item.translate(ALLOWED_ASCII_TABLE))
+        else:
+            special_characters_count = len(SPECIAL_CHARACTER_PATTERN.findall(item))
         if special_characters_count > 3:
-            logging.info(f"剔除非法内容: {item_trimmed}")
             continue
 
-        filtered_values.append(item_trimmed)  # 添加修剪后的内容
-        logging.info(f"添加修剪后的内容: {item_trimmed}")
-    return filtered_values  # 返回过滤后的值列表
+        yield classify_item(item)
+
+def classify_item(item):
+    """
+    对已去除空白、修剪过的条目分类，依次判断：
+    IP 或网段、域名、第二个字段为网段的规则，其余为经典规则。
+
+    参数：
+        item (str): 非空条目。
 
-def classify_values(values):
+    返回：
+        tuple: (类型, 值)。
+    """
+    ip = classify_ip_literal(item)
+    if ip is not None:
+        version, is_network = ip
+        if is_network:
+            return ("ipv4" if version == 4 else "ipv6"), item
+        return ("ipv4", f"{item}/32") if version == 4 else ("ipv6", f"{item}/128")
+    if DOMAIN_LINE_PATTERN.match(item):
+        if item.startswith("+.") or item[:14].upper() == "DOMAIN-SUFFIX,":
+            return "suffix", item
+        if item[0] == "*":
+            return "wildcard", item
+        return "domain", item
+    parts = item.split(",")
+    if len(parts) > 1:
+        candidate = parts[1].strip()
+        ip = classify_ip_literal(candidate)
+        if ip is not None:
+            return ("ipv4" if ip[0] == 4 else "ipv6"), candidate
+    return "classic", item
+
+def group_records(records):
     """
-    将值分类为域名、IP/CIDR 和经典规则。
+    将类型化的条目按输出文件分为域名、IP/CIDR 和经典规则三组，保持各组内的原有顺序。
 
     参数：
-        values (list): 值列表。
+        records (iterable): (类型, 值) 序列。
 
     返回：
         tuple: (域名列表, IP/CIDR 列表, 经典规则列表)。
@@ -396,77 +933,174 @@ def classify_values(values):
     domain_list = []
     ipcidr_list = []
     classical_list = []
+    targets = {
+        "suffix": domain_list.append,
+        "wildcard": domain_list.append,
+        "domain": domain_list.append,
+        "ipv4": ipcidr_list.append,
+        "ipv6": ipcidr_list.append,
+        "classic": classical_list.append,
+    }
+    for kind, value in records:
+        targets[kind](value)
+    return domain_list, ipcidr_list, classical_list
+
+# 经典规则列表（blackmatrix7 .list、Surge/Clash classical）中出现的规则类型
+CLASSIC_RULE_TYPES = frozenset([
+    "DOMAIN", "DOMAIN-SUFFIX", "DOMAIN-KEYWORD", "DOMAIN-REGEX", "DOMAIN-WILDCARD", "GEOSITE",
+    "IP-CIDR", "IP-CIDR6", "IP-SUFFIX", "IP-ASN", "GEOIP", "SRC-GEOIP", "SRC-IP-ASN", "SRC-IP-CIDR",
+    "SRC-IP-SUFFIX", "DST-PORT", "SRC-PORT", "IN-PORT", "IN-TYPE", "IN-USER", "IN-NAME",
+    "PROCESS-PATH", "PROCESS-PATH-REGEX", "PROCESS-NAME", "PROCESS-NAME-REGEX", "UID", "NETWORK",
+    "DSCP", "RULE-SET", "AND", "OR", "NOT", "SUB-RULE", "USER-AGENT", "URL-REGEX",
+])
+
+# dnsmasq 中以 /域名/ 指定匹配范围的指令
+DNSMASQ_DIRECTIVES = frozenset(["server", "local", "address", "ipset", "nftset"])
+
+def iter_text_lines(chunks):
+    """
+    将字节块流式解码为行，去除首尾空白并跳过空行，与 split_content_lines 的结果一致。
 
-    for item in values:
-        item = item.strip()
-        try:
-            # 尝试将项解析为 IP 地址
-            ip_addr = ipaddress.ip_address(item)
-            if ip_addr.version == 4:
-                ipcidr_list.append(f"{item}/32")  # 添加 IPv4 地址
-            else:
-                ipcidr_list.append(f"{item}/128")  # 添加 IPv6 地址
-            continue
-        except ValueError:
-            pass
+    参数：
+        chunks (iterable): 字节块。
 
-        try:
-            # 尝试将项解析为网络地址
-            ip_net = ipaddress.ip_network(item, strict=False)
-            ipcidr_list.append(item)  # 添加 CIDR
+    生成：
+        str: 非空行。
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line
+    pending = (pending + decoder.decode(b"", final=True)).strip()
+    if pending:
+        yield pending
+
+def detect_source_format(url, first_line):
+    """
+    根据 URL 后缀和第一行非注释内容判断上游规则源的格式。
+
+    参数：
+        url (str): 规则源 URL。
+        first_line (str): 第一行非注释内容，没有内容时为空字符串。
+
+    返回：
+        str: 'clash-yaml'、'dnsmasq'、'classic-list' 或 'plain'。
+    """
+    path = urlsplit(url).path.lower()
+    if path.endswith((".yaml", ".yml")) or first_line.startswith("payload:"):
+        return "clash-yaml"
+    directive, _, rest = first_line.partition("=")
+    if directive in DNSMASQ_DIRECTIVES and rest.startswith("/"):
+        return "dnsmasq"
+    if path.endswith(".list") or first_line.partition(",")[0].strip().upper() in CLASSIC_RULE_TYPES:
+        return "classic-list"
+    return "plain"
+
+def clash_yaml_records(lines):
+    """
+    解析 Clash 规则集 YAML（MetaCubeX geosite/geoip 等）的 payload 列表项，
+    去掉 '- ' 和引号后直接分类，不再经过通用的修剪和特殊字符过滤。
+    """
+    for line in lines:
+        if line[0] == "-":
+            item = "".join(line[1:].split()).strip("'\"")
+            if item:
+                yield classify_item(item)
+        elif line[0] != "#" and not line.startswith("payload"):
+            yield from normalize_records((line,))
+
+def classic_list_records(lines):
+    """
+    解析 '类型,值[,参数]' 形式的经典规则列表（blackmatrix7 .list、Surge 规则集等），
+    已知类型的行直接分类，其余行交给通用归一化。
+    """
+    for line in lines:
+        if line[0] == "#":
             continue
-        except ValueError:
-            pass
+        item = "".join(line.split())
+        if item.partition(",")[0].upper() in CLASSIC_RULE_TYPES:
+            yield classify_item(item)
+        else:
+            yield from normalize_records((line,))
 
-        # 使用正则表达式判断是否为域名
-        if re.match(r"(\+\..*|\*.*|DOMAIN-SUFFIX,.*|DOMAIN,.*|^[a-zA-Z0-9\-.]+$)", item, re.IGNORECASE):
-            domain_list.append(item)
+def dnsmasq_records(lines):
+    """
+    解析 dnsmasq 的 server=/a.com/b.com/上游 等指令，每个域名都覆盖其子域名，
+    因此输出为 '+.' 后缀规则。
+    """
+    for line in lines:
+        if line[0] == "#":
+            continue
+        directive, _, rest = line.partition("=")
+        if directive.strip() in DNSMASQ_DIRECTIVES and rest.startswith("/"):
+            for domain in rest.split("/")[1:-1]:
+                domain = domain.strip().strip(".")
+                if domain and domain != "#":
+                    yield "suffix", f"+.{domain}"
         else:
-            # 其他情况视为经典规则
-            parts = item.split(",")
-            if len(parts) > 1:
-                try:
-                    ip_net = ipaddress.ip_network(parts[1].strip(), strict=False)
-                    ipcidr_list.append(parts[1].strip())
-                except ValueError:
-                    classical_list.append(item)
-            else:
-                classical_list.append(item)
+            yield from normalize_records((line,))
 
-    return domain_list, ipcidr_list, classical_list  # 返回分类后的列表
+# 各格式对应的解析函数，plain 使用通用的归一化
+SOURCE_ADAPTERS = {
+    "clash-yaml": clash_yaml_records,
+    "dnsmasq": dnsmasq_records,
+    "classic-list": classic_list_records,
+    "plain": normalize_records,
+}
 
-def sort_ipcidr_items(items):
+def source_records(url, chunks):
     """
-    排序 IP/CIDR 项目，先优化再排序。
+    流式解析上游规则源：先缓存开头的注释行以读到第一行内容并判断格式，
+    之后逐行交给对应格式的解析函数，整个过程不保留完整的响应内容。
 
     参数：
-        items (list): IP/CIDR 列表。
+        url (str): 规则源 URL。
+        chunks (iterable): 响应内容的字节块。
 
-    返回：
-        list: 排序后的 IP/CIDR 列表。
+    生成：
+        tuple: (类型, 值)。
+    """
+    lines = iter_text_lines(chunks)
+    head = []
+    first_line = ""
+    for line in lines:
+        head.append(line)
+        if line[0] != "#":
+            first_line = line
+            break
+    source_format = detect_source_format(url, first_line)
+    logging.info(f"规则源格式 {source_format}: {url}")
+    yield from SOURCE_ADAPTERS[source_format](chain(head, lines))
+
+def normalize_values(values):
     """
-    if items:
-        items = optimize_list(items)  # 先优化列表
+    将原始行归一化并分为域名、IP/CIDR 和经典规则三类。
 
-    ipv4_items = []
-    ipv6_items = []
+    参数：
+        values (iterable): 原始行。
 
-    # 分别收集 IPv4 和 IPv6 的 CIDR
-    for item in items:
-        try:
-            ip_net = ipaddress.ip_network(item, strict=False)
-            if ip_net.version == 4:
-                ipv4_items.append(item)
-            else:
-                ipv6_items.append(item)
-        except ValueError:
-            pass
+    返回：
+        tuple: (域名列表, IP/CIDR 列表, 经典规则列表)。
+    """
+    return group_records(normalize_records(values))
+
+def sort_ipcidr_items(items):
+    """
+    排序 IP/CIDR 项目，先优化再按地址数值排序。
 
-    # 分别对 IPv4 和 IPv6 列表进行排序
-    ipv4_items.sort(key=lambda x: ipaddress.ip_network(x).with_prefixlen)
-    ipv6_items.sort(key=lambda x: ipaddress.ip_network(x).with_prefixlen)
+    参数：
+        items (list): IP/CIDR 列表。
 
-    return ipv4_items + ipv6_items  # 返回排序后的列表
+    返回：
+        list: 排序后的 IP/CIDR 列表，IPv4 在前，IPv6 在后。
+    """
+    # optimize_cidrs 的输出已按地址数值排好序，无需再次解析
+    return optimize_cidrs(items)
 
 def sort_classical_items(items):
     """
@@ -537,17 +1171,18 @@ def preprocess_for_sorting(item):
     返回：
         str: 预处理后的域名。
     """
-    # 去除前缀 "  - '" 和后缀 "'"
+    # 去除前缀 "  - '" 和后缀 "'"，还原 quote_item 转义的单引号
     if item.startswith("  - '") and item.endswith("'"):
-        item = item[5:-1]
+        item = item[5:-1].replace("''", "'")
     return item
 
-def sort_formatted_domain_items(items):
+def sort_formatted_domain_items(items, removed=None):
     """
     排序格式化后的域名项目，并处理被删除的项。
 
     参数：
         items (list): 域名列表。
+        removed (list): 可选，提供时被删除的项追加到此列表，不直接写入 delete_data.txt。
 
     返回：
         list: 排序并去重后的域名列表。
@@ -587,11 +1222,25 @@ def sort_formatted_domain_items(items):
     removed_items = list(set(original_list) - set(domains_list))  # 找出被移除的域名
 
     # 把被删除的项写入文件记录
-    if removed_items:
+    if removed is not None:
+        removed.extend(removed_items)
+    elif removed_items:
         write_to_delete_file(removed_items)
 
     return domains_list  # 返回排序后的域名列表
 
+def quote_item(item):
+    """
+    生成单引号包裹的 payload 行，条目中的单引号按 YAML 写为 ''。
+
+    参数：
+        item (str): 条目内容。
+
+    返回：
+        str: "  - '条目'" 形式的行。
+    """
+    return "  - '" + item.replace("'", "''") + "'"
+
 def format_item(item, item_type):
     """
     格式化项目，根据类型添加适当的前缀和后缀。
@@ -606,14 +1255,14 @@ def format_item(item, item_type):
     if item_type == "domain":
         if item.lower().startswith("domain,"):
             item = item[len("domain,"):]
-            return f"  - '{item}'"
+            return quote_item(item)
         elif item.lower().startswith("domain-suffix,"):
             item = item[len("domain-suffix,"):]
-            return f"  - '+.{item}'"
+            return quote_item(f"+.{item}")
         else:
-            return f"  - '{item}'"
+            return quote_item(item)
     elif item_type == "ipcidr":
-        return f"  - '{item}'"
+        return quote_item(item)
     else:
         parts = item.split(",")
         # 定义有效的前缀列表
@@ -703,25 +1352,85 @@ def count_ipcidr_items(items):
     ipv4_count = 0
     ipv6_count = 0
     for item in items:
-        item_cleaned = item[5:-1]  # 去除前缀和后缀
+        # 条目均由 optimize_cidrs 生成，含 ':' 的即为 IPv6，无需再次解析
+        if ":" in item:
+            ipv6_count += 1
+        else:
+            ipv4_count += 1
+    return ipv4_count, ipv6_count  # 返回统计结果
+
+def output_paths(key):
+    """
+    返回分类可能生成的全部文件路径。
+
+    参数：
+        key (str): 分类名称。
+
+    返回：
+        list: domain、ipcidr 和 classic 文件的路径。
+    """
+    return [f"domain/{key}.yaml", f"ipcidr/{key}-ipcidr.yaml", f"classic/{key}-classic.yaml"]
+
+def text_output_path(path):
+    """
+    返回 YAML 规则文件对应的 text 格式规则文件路径。
+    """
+    return os.path.splitext(path)[0] + TEXT_EXTENSION
+
+def rule_file_paths(key):
+    """
+    返回分类可能生成的全部 YAML 和 text 格式规则文件路径。
+    """
+    paths = output_paths(key)
+    return paths + [text_output_path(path) for path in paths]
+
+def remove_files(paths):
+    """
+    删除给定的文件，文件不存在时忽略。
+
+    参数：
+        paths (iterable): 文件路径。
+    """
+    for path in paths:
         try:
-            ip_net = ipaddress.ip_network(item_cleaned, strict=False)
-            if ip_net.version == 4:
-                ipv4_count += 1
-            else:
-                ipv6_count += 1
-        except ValueError:
+            os.unlink(path)
+        except FileNotFoundError:
             pass
-    return ipv4_count, ipv6_count  # 返回统计结果
+        except OSError as e:
+            logging.error(f"删除 {path} 失败。原因: {e}")
 
-def prepare_directories():
+def remove_stale_outputs(keys, state=None):
+    """
+    构建结束后清理过期文件：已从 my.wei 中移除的分类的文件，
+    以及输出文件夹中不属于任何分类的文件。
+
+    参数：
+        keys (iterable): 本次配置中的全部分类。
+        state (BuildState): 可选的增量构建指纹记录，会被原地更新。
+    """
+    keys = set(keys)
+    if state is not None:
+        remove_files(state.retain(keys))
+    tracked = {os.path.normpath(path) for key in keys for path in rule_file_paths(key)}
+    for folder in OUTPUT_FOLDERS:
+        for filename in os.listdir(folder):
+            path = os.path.normpath(os.path.join(folder, filename))
+            if path not in tracked and os.path.isfile(path):
+                remove_files([path])
+
+def prepare_directories(clean=True):
     """
     创建并清空 'domain', 'classic' 和 'ipcidr' 文件夹。
 
     如果文件夹不存在，则创建；如果存在，则清空其中的文件。
+
+    参数：
+        clean (bool): 是否清空已有文件，增量构建时为 False 以便沿用上次的输出。
     """
-    for folder in ["domain", "classic", "ipcidr"]:
+    for folder in OUTPUT_FOLDERS:
         os.makedirs(folder, exist_ok=True)  # 创建文件夹
+        if not clean:
+            continue
         folder_path = os.path.join(os.getcwd(), folder)
         # 遍历文件夹中的文件并删除
         for filename in os.listdir(folder_path):
@@ -732,141 +1441,730 @@ def prepare_directories():
             except Exception as e:
                 logging.error(f"删除 {file_path} 失败。原因: {e}")
 
-def process_data(data_dict):
+def render_rule_file(key, rule_type, totals, payload, updated, text=False):
     """
-    处理数据字典，生成相应的文件。
+    生成规则文件的完整内容。
 
     参数：
-        data_dict (dict): 数据字典。
+        key (str): 分类名称。
+        rule_type (str): 规则类型，'domain'、'ipcidr' 或 'classic'。
+        totals (list): TYPE 之后的统计行。
+        payload (list): payload 中的每一行，最后一行之后不添加换行符。
+        updated (str): UPDATED 行中的时间。
+        text (bool): 是否为 text 格式，text 格式没有 'payload:' 行，payload 为 text_payload 的结果。
+
+    返回：
+        str: 文件内容。
     """
-    filtered_dict = {}
-    # 过滤和修剪每个键对应的值
-    for key, content in data_dict.items():
-        logging.info(f"过滤和修剪值: {key}")
-        filtered_values = filter_and_trim_values(content["values"])
-        filtered_dict[key] = {"values": filtered_values, "errors": content["errors"]}
+    header = [
+        f"# NAME: {key}",
+        "# AUTHOR: Angwz",
+        "# REPO: https://github.com/angwz/DomainRouter",
+        f"# UPDATED: {updated} (UTC+8)",
+        f"# TYPE: {rule_type}",
+        *totals,
+    ]
+    if not text:
+        header.append("payload:")
+    return "\n".join(header) + "\n" + "\n".join(payload)
+
+def text_payload(payload):
+    """
+    把 YAML payload 中的行转换为 text 格式：每行一个条目，去掉 '  - ' 前缀和单引号，
+    classic 规则中不同类型之间的空行予以保留。
+
+    参数：
+        payload (list): format_item 生成的 payload 行。
+
+    返回：
+        list: text 格式的行。
+    """
+    lines = []
+    for line in payload:
+        entry = line[4:] if line.startswith("  - ") else line
+        if len(entry) >= 2 and entry[0] == entry[-1] == "'":
+            entry = entry[1:-1].replace("''", "'")
+        lines.append(entry)
+    return lines
+
+def strip_updated_line(text):
+    """
+    去掉 UPDATED 行，用于比较两份规则文件除时间外的内容。
+    """
+    return [line for line in text.split("\n") if not line.startswith("# UPDATED:")]
+
+def write_rule_file(path, key, rule_type, totals, payload, text_format=False):
+    """
+    写入规则文件。除 UPDATED 时间外内容与已有文件相同时不改动文件，
+    因此只有内容变化的文件才会更新时间并被重新提交和上传。
+
+    参数：
+        path (str): 文件路径。
+        key (str): 分类名称。
+        rule_type (str): 规则类型。
+        totals (list): TYPE 之后的统计行。
+        payload (list): payload 中的每一行。
+        text_format (bool): 是否为 text 格式，见 render_rule_file。
+
+    返回：
+        bool: 是否写入了文件。
+    """
+    # 获取当前时间，时区为 UTC+8
+    current_time = datetime.now(timezone.utc) + timedelta(hours=8)
+    text = render_rule_file(
+        key, rule_type, totals, payload, current_time.strftime("%Y-%m-%d %H:%M:%S"), text=text_format
+    )
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as file:
+            existing = file.read()
+    except FileNotFoundError:
+        existing = None
+    if existing is not None and strip_updated_line(existing) == strip_updated_line(text):
+        logging.info(f"内容未变化，保留原文件: {path}")
+        return False
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        file.write(text)
+    return True
+
+def write_rule_files(path, key, rule_type, totals, payload):
+    """
+    在同一次处理中写入 YAML 规则文件和对应的 text 格式规则文件，参数见 write_rule_file。
+    """
+    write_rule_file(path, key, rule_type, totals, payload)
+    write_rule_file(text_output_path(path), key, rule_type, totals, text_payload(payload), text_format=True)
 
-    # 处理每个键对应的内容
-    for key, content in filtered_dict.items():
-        values = content["values"]
+def remove_rule_files(paths):
+    """
+    删除 YAML 规则文件及对应的 text 格式规则文件。
+    """
+    remove_files([*paths, *(text_output_path(path) for path in paths)])
 
-        # 分类值为域名、IP/CIDR 和经典规则
-        domain_list, ipcidr_list, classical_list = classify_values(values)
-        original_ipcidr_list = ipcidr_list.copy()  # 备份原始的 IP/CIDR 列表
+def write_manifest(path=MANIFEST_PATH):
+    """
+    为输出文件夹中的全部规则文件生成清单，记录每个文件的 sha256、大小、条目数和更新时间，
+    下游镜像和客户端可据此只同步变化的文件。清单内容不变时不改动文件。
 
-        if ipcidr_list:
-            ipcidr_list = sort_ipcidr_items(ipcidr_list)  # 排序 IP/CIDR 列表
+    参数：
+        path (str): 清单文件路径。
 
-        classical_list, _ = sort_classical_items(classical_list)  # 排序经典规则列表
+    返回：
+        dict: 清单内容。
+    """
+    files = {}
+    for folder in OUTPUT_FOLDERS:
+        for filename in sorted(os.listdir(folder)):
+            file_path = os.path.join(folder, filename)
+            if not os.path.isfile(file_path):
+                continue
+            with open(file_path, "rb") as file:
+                data = file.read()
+            updated = None
+            entries = 0
+            text_format = filename.endswith(TEXT_EXTENSION)
+            for line in data.decode("utf-8").split("\n"):
+                if line.startswith("# UPDATED:"):
+                    updated = line[len("# UPDATED:"):].strip()
+                elif line.startswith("  - ") or (text_format and line and not line.startswith("#")):
+                    entries += 1
+            files[f"{folder}/{filename}"] = {
+                "sha256": hashlib.sha256(data).hexdigest(),
+                "size": len(data),
+                "entries": entries,
+                "updated": updated,
+            }
+
+    manifest = {"files": files}
+    text = json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True) + "\n"
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            if file.read() == text:
+                return manifest
+    except FileNotFoundError:
+        pass
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+    return manifest
+
+def dnsmasq_conf_path(key):
+    """
+    返回分类对应的 dnsmasq 配置文件路径。
+    """
+    return os.path.join(DNSMASQ_FOLDER, f"{key}.conf")
+
+def read_rule_set_payload(path):
+    """
+    逐行读取已生成的规则文件中的 payload。
+
+    参数：
+        path (str): 规则文件路径。
+
+    返回：
+        list: payload 中的条目。
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        return list(iter_payload(line.rstrip("\n") for line in file))
+
+def read_classic_payload(path):
+    """
+    读取已生成的 classic 规则文件中的 payload。classic 条目写入时不加引号（见 format_item），
+    不能按 YAML 标量读取，直接去掉 '  - ' 前缀。
+
+    参数：
+        path (str): 规则文件路径。
+
+    返回：
+        list: payload 中的条目。
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        return [line[4:].rstrip("\n") for line in file if line.startswith("  - ")]
 
-        if domain_list:
-            # 格式化域名列表
-            formatted_domain_list = [format_item(item, "domain") for item in domain_list]
-            # 排序格式化后的域名列表
-            sorted_formatted_domain_list = sort_formatted_domain_items(formatted_domain_list)
+def write_dnsmasq_confs(servers, excludes=None, ipsets=None, nftsets=None):
+    """
+    直接读取本次构建已生成的 domain 规则文件，为每个分类生成指定上游 DNS 的 dnsmasq 配置，
+    多个域名合并到同一行。内容不变时不改动文件。
+
+    参数：
+        servers (dict): 分类名到上游 DNS 的映射，如 {'China': '119.29.29.29'}。
+        excludes (dict): 可选的分类名到排除列表文件的映射，列表中的域名及其子域名不写入该分类的配置。
+        ipsets (dict): 可选的分类名到 ipset 集合名称的映射，解析结果同时加入这些集合。
+        nftsets (dict): 可选的分类名到 nftset 描述的映射，如 {'China': '4#inet#fw4#china_v4'}。
+
+    返回：
+        list: 写入或保留的配置文件路径。
+    """
+    excludes = excludes or {}
+    ipsets = ipsets or {}
+    nftsets = nftsets or {}
+    os.makedirs(DNSMASQ_FOLDER, exist_ok=True)
+    paths = []
+    for key, server in servers.items():
+        domain_path = output_paths(key)[0]
+        conf_path = dnsmasq_conf_path(key)
+        if not os.path.isfile(domain_path):
+            logging.warning(f"分类 {key} 没有生成 domain 文件，跳过 dnsmasq 配置")
+            remove_files([conf_path])
+            continue
+
+        domains = rule_set_domains(read_rule_set_payload(domain_path))
+        if key in excludes:
+            with open(excludes[key], "r", encoding="utf-8") as file:
+                domains = DomainExclusionIndex(file.read().splitlines()).filter(domains)
+        text = "\n".join(build_conf_lines(
+            domains, server, aggregate=True, ipset=ipsets.get(key), nftset=nftsets.get(key)
+        ))
+
+        try:
+            with open(conf_path, "r", encoding="utf-8", newline="") as file:
+                unchanged = file.read() == text
+        except FileNotFoundError:
+            unchanged = False
+        if unchanged:
+            logging.info(f"内容未变化，保留原文件: {conf_path}")
         else:
-            sorted_formatted_domain_list = []
+            with open(conf_path, "w", encoding="utf-8", newline="") as file:
+                file.write(text)
+        logging.info(f"{key} - dnsmasq 域名数: {len(domains)}，上游: {server}")
+        paths.append(conf_path)
+    return paths
+
+def mrs_outputs(key):
+    """
+    返回分类的 (规则文件路径, .mrs 文件路径, 行为) 列表，classic 规则集不支持 mrs 格式。
+    """
+    domain_path, ipcidr_path, _ = output_paths(key)
+    return [
+        (domain_path, os.path.join(MRS_FOLDER, f"{key}.mrs"), mrs_rule_set.BEHAVIOR_DOMAIN),
+        (ipcidr_path, os.path.join(MRS_FOLDER, f"{key}-ipcidr.mrs"), mrs_rule_set.BEHAVIOR_IPCIDR),
+    ]
 
-        # 找出被删除的 IP/CIDR 项
-        removed_ipcidrs = list(set(original_ipcidr_list) - set(ipcidr_list))
-        if removed_ipcidrs:
-            write_to_delete_file(removed_ipcidrs)  # 写入删除记录
+def write_mrs_files(keys):
+    """
+    读取本次构建已生成的 domain 和 ipcidr 规则文件，为每个分类生成 mihomo 可直接加载的 .mrs 规则集。
+    写入前解析生成的内容做往返校验，校验失败的文件不会写出；内容不变时不改动文件。
 
-        # 去重各个列表
-        deduped_domain_list = deduplicate(
-            [format_item(item, "domain") for item in sorted_formatted_domain_list if item]
-        )
-        deduped_ipcidr_list = deduplicate(
-            [format_item(item, "ipcidr") for item in ipcidr_list if item]
-        )
-        deduped_classical_list = deduplicate(
-            [format_item(item, "classic") for item in classical_list if item]
-        )
+    参数：
+        keys (iterable): 本次配置中的全部分类。
+
+    返回：
+        list: 写入或保留的 .mrs 文件路径。
+    """
+    os.makedirs(MRS_FOLDER, exist_ok=True)
+    paths = []
+    for key in keys:
+        for rule_path, mrs_path, behavior in mrs_outputs(key):
+            if not os.path.isfile(rule_path):
+                remove_files([mrs_path])
+                continue
+            entries = read_rule_set_payload(rule_path)
+            data = mrs_rule_set.encode_mrs(entries, behavior)
+            if data is None:
+                remove_files([mrs_path])
+                continue
+            try:
+                mrs_rule_set.verify_mrs(data, entries, behavior)
+            except ValueError as e:
+                logging.error(f"{mrs_path} 往返校验失败，未写入: {e}")
+                remove_files([mrs_path])
+                continue
+
+            write_bytes_if_changed(mrs_path, data)
+            paths.append(mrs_path)
+
+    remove_untracked_files(MRS_FOLDER, paths)  # 清理已从 my.wei 中移除的分类的 .mrs 文件
+    return paths
 
-        # 如果所有列表都为空，跳过当前键
-        if not deduped_domain_list and not deduped_ipcidr_list and not deduped_classical_list:
+def sing_box_paths(key):
+    """
+    返回分类对应的 sing-box source JSON 和 .srs 文件路径。
+    """
+    return os.path.join(SING_BOX_FOLDER, f"{key}.json"), os.path.join(SING_BOX_FOLDER, f"{key}.srs")
+
+def write_sing_box_rule_sets(keys):
+    """
+    读取本次构建已生成的 domain、ipcidr 和 classic 规则文件，为每个分类生成一个 sing-box headless 规则集，
+    同时写出 source JSON 和编译后的 .srs。.srs 写入前做往返校验，校验失败时两个文件都不写出；
+    内容不变时不改动文件。
+
+    参数：
+        keys (iterable): 本次配置中的全部分类。
+
+    返回：
+        list: 写入或保留的文件路径。
+    """
+    os.makedirs(SING_BOX_FOLDER, exist_ok=True)
+    paths = []
+    for key in keys:
+        domain_path, ipcidr_path, classic_path = output_paths(key)
+        payloads = [
+            read_rule_set_payload(domain_path) if os.path.isfile(domain_path) else [],
+            read_rule_set_payload(ipcidr_path) if os.path.isfile(ipcidr_path) else [],
+            read_classic_payload(classic_path) if os.path.isfile(classic_path) else [],
+        ]
+        json_path, srs_path = sing_box_paths(key)
+        rule_set, skipped = sing_box_rule_set.category_rule_set(*payloads)
+        if skipped:
+            logging.info(f"{key} - sing-box 规则集跳过了 {skipped} 条无法转换的经典规则")
+        if rule_set is None:
+            remove_files([json_path, srs_path])
             continue
+        data = sing_box_rule_set.encode_srs(rule_set)
+        try:
+            sing_box_rule_set.verify_srs(data, rule_set)
+        except ValueError as e:
+            logging.error(f"{srs_path} 往返校验失败，未写入: {e}")
+            remove_files([json_path, srs_path])
+            continue
+
+        text = json.dumps(rule_set, ensure_ascii=False, indent=2) + "\n"
+        write_bytes_if_changed(json_path, text.encode("utf-8"))
+        write_bytes_if_changed(srs_path, data)
+        paths.extend([json_path, srs_path])
 
-        # 统计各个列表的数量
-        domain_total = len(deduped_domain_list)
-        ipcidr_total = len(deduped_ipcidr_list)
-        classic_total = len(deduped_classical_list)
-        classic_counts = count_classical_items(deduped_classical_list)
-        ipv4_count, ipv6_count = count_ipcidr_items(deduped_ipcidr_list)
-
-        logging.info(f"{key} - domain_list count: {domain_total}")
-        logging.info(f"{key} - ipcidr_list count: {ipcidr_total}, ipv4_total: {ipv4_count}, ipv6_total: {ipv6_count}")
-        logging.info(f"{key} - classical_list count: {classic_total}, classic_counts: {classic_counts}")
-
-        # 获取当前时间，时区为 UTC+8
-        current_time = datetime.now(timezone.utc) + timedelta(hours=8)
-        current_time_str = current_time.strftime("%Y-%m-%d %H:%M:%S")
-
-        # 生成 domain 文件
-        if domain_total > 0:
-            with open(f"domain/{key}.yaml", "w", encoding="utf-8") as file:
-                file.write(f"# NAME: {key}\n")
-                file.write("# AUTHOR: Angwz\n")
-                file.write("# REPO: https://github.com/angwz/DomainRouter\n")
-                file.write(f"# UPDATED: {current_time_str} (UTC+8)\n")
-                file.write("# TYPE: domain\n")
-                file.write(f"# TOTAL: {domain_total}\n")
-                file.write("payload:\n")
-                for i, item in enumerate(deduped_domain_list):
-                    # 写入每一项，最后一项不添加换行符
-                    file.write(f"{item}\n" if i < domain_total - 1 else f"{item}")
-
-        # 生成 ipcidr 文件
-        if ipcidr_total > 0:
-            with open(f"ipcidr/{key}-ipcidr.yaml", "w", encoding="utf-8") as file:
-                file.write(f"# NAME: {key}\n")
-                file.write("# AUTHOR: Angwz\n")
-                file.write("# REPO: https://github.com/angwz/DomainRouter\n")
-                file.write(f"# UPDATED: {current_time_str} (UTC+8)\n")
-                file.write("# TYPE: ipcidr\n")
-                file.write(f"# TOTAL: {ipcidr_total}\n")
-                if ipv4_count > 0:
-                    file.write(f"# IP-CIDR TOTAL: {ipv4_count}\n")
-                if ipv6_count > 0:
-                    file.write(f"# IP-CIDR6 TOTAL: {ipv6_count}\n")
-                file.write("payload:\n")
-                for i, item in enumerate(deduped_ipcidr_list):
-                    file.write(f"{item}\n" if i < ipcidr_total - 1 else f"{item}")
-
-        # 生成 classic 文件
-        if classic_total > 0:
-            with open(f"classic/{key}-classic.yaml", "w", encoding="utf-8") as file:
-                file.write(f"# NAME: {key}\n")
-                file.write("# AUTHOR: Angwz\n")
-                file.write("# REPO: https://github.com/angwz/DomainRouter\n")
-                file.write(f"# UPDATED: {current_time_str} (UTC+8)\n")
-                file.write("# TYPE: classic\n")
-                file.write(f"# TOTAL: {classic_total}\n")
-                for k, v in classic_counts.items():
-                    if v > 0:
-                        file.write(f"# {k} TOTAL: {v}\n")
-                file.write("payload:\n")
-                previous_prefix = None
-                for i, item in enumerate(deduped_classical_list):
-                    current_prefix = item.split(",")[0].upper()
-                    if previous_prefix and previous_prefix != current_prefix:
-                        file.write("\n")  # 不同类型之间添加空行
-                    file.write(f"{item}\n" if i < classic_total - 1 else f"{item}")
-                    previous_prefix = current_prefix
-
-def main():
+    remove_untracked_files(SING_BOX_FOLDER, paths)  # 清理已从 my.wei 中移除的分类的规则集
+    return paths
+
+def load_xray_sites(keys):
+    """
+    读取本次构建已生成的规则文件，转换为 Xray 资源文件中各分类的域名规则和网段，
+    分类代码为 my.wei 中的分组名，没有域名或网段的分类不出现在对应的映射中。
+
+    参数：
+        keys (iterable): 本次配置中的全部分类。
+
+    返回：
+        tuple: (分类代码到域名规则的映射, 分类代码到网段的映射)。
+    """
+    geosite = {}
+    geoip = {}
+    for key in keys:
+        domain_path, ipcidr_path, classic_path = output_paths(key)
+        domains = read_rule_set_payload(domain_path) if os.path.isfile(domain_path) else []
+        cidrs = read_rule_set_payload(ipcidr_path) if os.path.isfile(ipcidr_path) else []
+        classic = read_classic_payload(classic_path) if os.path.isfile(classic_path) else []
+        code = xray_geodata.category_code(key)
+        site, skipped = xray_geodata.site_domains(domains, classic)
+        if skipped:
+            logging.info(f"{key} - Xray geosite 跳过了 {skipped} 条无法转换的经典规则")
+        if site:
+            geosite[code] = site
+        site_cidrs = xray_geodata.site_cidrs(cidrs, classic)
+        if site_cidrs:
+            geoip[code] = site_cidrs
+    return geosite, geoip
+
+def write_xray_geodata(geosite, geoip):
+    """
+    把 load_xray_sites 的结果编译为 Xray 的 geosite 和 geoip 资源文件。
+    写入前做往返校验，校验失败的文件不会写出；内容不变时不改动文件。
+
+    参数：
+        geosite (dict): 分类代码到域名规则的映射。
+        geoip (dict): 分类代码到网段的映射。
+
+    返回：
+        list: 写入或保留的文件路径。
+    """
+    os.makedirs(XRAY_FOLDER, exist_ok=True)
+    paths = []
+    for filename, sites, encode, read in (
+        (xray_geodata.GEOSITE_FILE, geosite, xray_geodata.encode_geosite, xray_geodata.read_geosite),
+        (xray_geodata.GEOIP_FILE, geoip, xray_geodata.encode_geoip, xray_geodata.read_geoip),
+    ):
+        path = os.path.join(XRAY_FOLDER, filename)
+        if not sites:
+            remove_files([path])
+            continue
+        data = encode(sites)
+        try:
+            xray_geodata.verify_geodata(data, sites, read)
+        except ValueError as e:
+            logging.error(f"{path} 往返校验失败，未写入: {e}")
+            remove_files([path])
+            continue
+        write_bytes_if_changed(path, data)
+        logging.info(f"{path} - 分类数: {len(sites)}，规则数: {sum(len(items) for items in sites.values())}")
+        paths.append(path)
+    return paths
+
+def write_xray_routing(content, geosite, geoip, outbounds=None):
+    """
+    按 my.wei 中 [Rules] 段落的顺序生成 Xray 路由规则，引用本次生成的资源文件。内容不变时不改动文件。
+
+    参数：
+        content (str): my.wei 的内容。
+        geosite (dict): 分类代码到域名规则的映射，与资源文件的内容一致。
+        geoip (dict): 分类代码到网段的映射，与资源文件的内容一致。
+        outbounds (dict): 可选的策略名到出站标签的映射。
+
+    返回：
+        str: 路由规则文件路径。
+    """
+    rules, matches = generate_rulesets.parse_rules(content)
+    routing, skipped = xray_routing.build_routing(rules, matches, geosite, geoip, outbounds)
+    if skipped:
+        logging.info(f"Xray 路由规则跳过了 {len(skipped)} 条无法转换或没有内容的规则: {', '.join(skipped)}")
+    os.makedirs(XRAY_FOLDER, exist_ok=True)
+    text = json.dumps(routing, ensure_ascii=False, indent=2) + "\n"
+    write_bytes_if_changed(XRAY_ROUTING_PATH, text.encode("utf-8"))
+    logging.info(f"{XRAY_ROUTING_PATH} - 规则数: {len(routing['routing']['rules'])}")
+    return XRAY_ROUTING_PATH
+
+def write_bytes_if_changed(path, data):
+    """
+    写入二进制内容，与已有文件相同时不改动文件。
+
+    参数：
+        path (str): 文件路径。
+        data (bytes): 文件内容。
+
+    返回：
+        bool: 是否写入了文件。
+    """
+    try:
+        with open(path, "rb") as file:
+            if file.read() == data:
+                logging.info(f"内容未变化，保留原文件: {path}")
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "wb") as file:
+        file.write(data)
+    return True
+
+def remove_untracked_files(folder, paths):
+    """
+    删除文件夹中不在 paths 中的文件。
+
+    参数：
+        folder (str): 文件夹。
+        paths (iterable): 需要保留的文件路径。
+    """
+    tracked = {os.path.normpath(path) for path in paths}
+    for filename in os.listdir(folder):
+        path = os.path.normpath(os.path.join(folder, filename))
+        if path not in tracked and os.path.isfile(path):
+            remove_files([path])
+
+def pack_lines(lines):
+    """
+    将行列表打包为单个字符串，跨进程传递时只需序列化一个对象。
+
+    参数：
+        lines (list): 不含换行符的行列表。
+
+    返回：
+        str: 以换行符连接的字符串。
+    """
+    return "\n".join(lines)
+
+def unpack_lines(text):
+    """
+    将 pack_lines 打包的字符串还原为行列表。
+
+    参数：
+        text (str): 打包后的字符串。
+
+    返回：
+        list: 行列表。
+    """
+    return text.split("\n") if text else []
+
+def process_packed_category(key, packed, errors):
+    """
+    进程池中执行的分类处理入口，输入和输出均为打包后的字符串。
+
+    参数：
+        key (str): 分类名称。
+        packed (tuple): 已分好组的 (域名, IP/CIDR, 经典规则) 三个打包字符串。
+        errors (list): 分类的错误列表。
+
+    返回：
+        str: pack_lines 打包的被删除条目，由主进程统一写入 delete_data.txt。
+    """
+    content = {"groups": tuple(unpack_lines(group) for group in packed), "errors": errors}
+    return pack_lines(process_category(key, content))
+
+def process_category(key, content):
+    """
+    过滤、分类并优化单个分类的内容，生成对应的 domain、ipcidr 和 classic 文件，每个文件同时写出 text 格式。
+
+    参数：
+        key (str): 分类名称。
+        content (dict): 分类内容，含 "errors" 以及已合并 URL 内容的原始值 "values"，
+            或由格式适配器分好组的 "groups"。
+
+    返回：
+        list: 被优化掉的域名和 IP/CIDR 条目，由调用方写入 delete_data.txt。
+    """
+    if "groups" in content:
+        domain_list, ipcidr_list, classical_list = content["groups"]
+    else:
+        # 单次扫描过滤、修剪并分类为域名、IP/CIDR 和经典规则
+        logging.info(f"过滤、修剪和分类值: {key}")
+        domain_list, ipcidr_list, classical_list = normalize_values(content["values"])
+    original_ipcidr_list = ipcidr_list.copy()  # 备份原始的 IP/CIDR 列表
+
+    if ipcidr_list:
+        ipcidr_list = sort_ipcidr_items(ipcidr_list)  # 排序 IP/CIDR 列表
+
+    classical_list, _ = sort_classical_items(classical_list)  # 排序经典规则列表
+
+    removed_items = []
+    if domain_list:
+        # 格式化域名列表
+        formatted_domain_list = [format_item(item, "domain") for item in domain_list]
+        # 排序格式化后的域名列表
+        sorted_formatted_domain_list = sort_formatted_domain_items(formatted_domain_list, removed_items)
+    else:
+        sorted_formatted_domain_list = []
+
+    # 找出被删除的 IP/CIDR 项，与域名一起交给调用方写入删除记录
+    removed_items.extend(set(original_ipcidr_list) - set(ipcidr_list))
+
+    # 去重各个列表
+    deduped_domain_list = deduplicate(
+        [format_item(item, "domain") for item in sorted_formatted_domain_list if item]
+    )
+    deduped_ipcidr_list = deduplicate(
+        [format_item(item, "ipcidr") for item in ipcidr_list if item]
+    )
+    deduped_classical_list = deduplicate(
+        [format_item(item, "classic") for item in classical_list if item]
+    )
+
+    # 如果所有列表都为空，不生成文件，并删除上次可能留下的文件
+    domain_path, ipcidr_path, classic_path = output_paths(key)
+    if not deduped_domain_list and not deduped_ipcidr_list and not deduped_classical_list:
+        remove_rule_files([domain_path, ipcidr_path, classic_path])
+        return removed_items
+
+    # 统计各个列表的数量
+    domain_total = len(deduped_domain_list)
+    ipcidr_total = len(deduped_ipcidr_list)
+    classic_total = len(deduped_classical_list)
+    classic_counts = count_classical_items(deduped_classical_list)
+    ipv4_count, ipv6_count = count_ipcidr_items(deduped_ipcidr_list)
+
+    logging.info(f"{key} - domain_list count: {domain_total}")
+    logging.info(f"{key} - ipcidr_list count: {ipcidr_total}, ipv4_total: {ipv4_count}, ipv6_total: {ipv6_count}")
+    logging.info(f"{key} - classical_list count: {classic_total}, classic_counts: {classic_counts}")
+
+    # 生成 domain 文件
+    if domain_total > 0:
+        write_rule_files(domain_path, key, "domain", [f"# TOTAL: {domain_total}"], deduped_domain_list)
+    else:
+        remove_rule_files([domain_path])
+
+    # 生成 ipcidr 文件
+    if ipcidr_total > 0:
+        totals = [f"# TOTAL: {ipcidr_total}"]
+        if ipv4_count > 0:
+            totals.append(f"# IP-CIDR TOTAL: {ipv4_count}")
+        if ipv6_count > 0:
+            totals.append(f"# IP-CIDR6 TOTAL: {ipv6_count}")
+        write_rule_files(ipcidr_path, key, "ipcidr", totals, deduped_ipcidr_list)
+    else:
+        remove_rule_files([ipcidr_path])
+
+    # 生成 classic 文件
+    if classic_total > 0:
+        totals = [f"# TOTAL: {classic_total}"]
+        totals.extend(f"# {k} TOTAL: {v}" for k, v in classic_counts.items() if v > 0)
+        payload = []
+        previous_prefix = None
+        for item in deduped_classical_list:
+            current_prefix = item.split(",")[0].upper()
+            if previous_prefix and previous_prefix != current_prefix:
+                payload.append("")  # 不同类型之间添加空行
+            payload.append(item)
+            previous_prefix = current_prefix
+        write_rule_files(classic_path, key, "classic", totals, payload)
+    else:
+        remove_rule_files([classic_path])
+
+    return removed_items
+
+def parse_mapping(text):
+    """
+    解析 'KEY=VALUE' 形式的命令行参数。
+
+    参数：
+        text (str): 参数值。
+
+    返回：
+        tuple: (KEY, VALUE)。
+
+    异常：
+        argparse.ArgumentTypeError: 格式不正确。
+    """
+    key, separator, value = text.partition("=")
+    if not separator or not key.strip() or not value.strip():
+        raise argparse.ArgumentTypeError(f"应为 KEY=VALUE 形式: {text}")
+    return key.strip(), value.strip()
+
+def parse_args(argv=None):
+    """
+    解析命令行参数。
+
+    参数：
+        argv (list): 命令行参数，默认为 sys.argv[1:]。
+
+    返回：
+        argparse.Namespace: 解析结果。
+    """
+    parser = argparse.ArgumentParser(description="生成 domain、ipcidr 和 classic 规则文件")
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=1,
+        help="并行处理分类的进程数，0 表示使用全部 CPU 核心，默认 1 即串行处理",
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="增量构建：输入指纹未变化的分类沿用上次生成的文件",
+    )
+    parser.add_argument(
+        "--dnsmasq", metavar="CATEGORY=SERVER", type=parse_mapping, action="append", default=[],
+        help="为分类生成 dnsmasq 配置并交给指定的上游 DNS 解析，如 China=119.29.29.29，可重复指定",
+    )
+    parser.add_argument(
+        "--dnsmasq-exclude", metavar="CATEGORY=PATH", type=parse_mapping, action="append", default=[],
+        help="生成分类的 dnsmasq 配置时排除文件中的域名及其子域名，可重复指定",
+    )
+    parser.add_argument(
+        "--dnsmasq-ipset", metavar="CATEGORY=SETS", type=parse_mapping, action="append", default=[],
+        help="分类的 dnsmasq 配置同时写入 ipset=，把解析结果加入集合，多个集合以 ',' 分隔，可重复指定",
+    )
+    parser.add_argument(
+        "--dnsmasq-nftset", metavar="CATEGORY=SETS", type=parse_mapping, action="append", default=[],
+        help="分类的 dnsmasq 配置同时写入 nftset=，如 China=4#inet#fw4#china_v4，可重复指定",
+    )
+    parser.add_argument(
+        "--mrs", action="store_true",
+        help=f"同时为 domain 和 ipcidr 规则文件生成 mihomo 的 .mrs 二进制规则集，写入 {MRS_FOLDER} 文件夹，需要 zstandard",
+    )
+    parser.add_argument(
+        "--sing-box", action="store_true",
+        help=f"同时为每个分类生成 sing-box 规则集的 source JSON 和 .srs，写入 {SING_BOX_FOLDER} 文件夹",
+    )
+    parser.add_argument(
+        "--xray", action="store_true",
+        help=f"同时把全部分类编译为 Xray 的 geosite 和 geoip 资源文件，并按 [Rules] 生成路由规则，写入 {XRAY_FOLDER} 文件夹",
+    )
+    parser.add_argument(
+        "--xray-outbound", metavar="POLICY=TAG", type=parse_mapping, action="append", default=[],
+        help="Xray 路由规则中策略对应的出站标签，默认 DIRECT 为 direct、REJECT 为 blocked，其余为策略名，可重复指定",
+    )
+    parser.add_argument(
+        "--shadowrocket", metavar="CONFIG", nargs="?", const=shadowrocket.CONFIG_URL,
+        help="同时由同一轮获取的规则源生成 Shadowrocket 配置，CONFIG 为 my.shadowrocket 的本地路径或 URL",
+    )
+    parser.add_argument(
+        "--shadowrocket-split", action="store_true",
+        help="生成 Shadowrocket 配置时同时写入按分组拆分的规则列表及引用它们的配置",
+    )
+    parser.add_argument(
+        "--rulesets", action="store_true",
+        help=f"同时依据本次生成的清单写入 {generate_rulesets.OUTPUT_FILE}，无需请求 release 分支",
+    )
+    parser.add_argument(
+        "--rulesets-format", choices=generate_rulesets.RULESET_FORMATS, default="yaml",
+        help="rulesets.toml 引用的规则文件格式，text 时 classic 规则引用与 YAML 同时生成的 .list 文件，"
+        "domain 与 ipcidr 仍引用 YAML，默认 yaml",
+    )
+    args = parser.parse_args(argv)
+    if args.mrs and mrs_rule_set.zstandard is None:
+        parser.error("--mrs 需要安装 zstandard：pip install zstandard")
+    args.dnsmasq = dict(args.dnsmasq)
+    args.dnsmasq_exclude = dict(args.dnsmasq_exclude)
+    args.dnsmasq_ipset = dict(args.dnsmasq_ipset)
+    args.dnsmasq_nftset = dict(args.dnsmasq_nftset)
+    for option, mapping in (("--dnsmasq-ipset", args.dnsmasq_ipset), ("--dnsmasq-nftset", args.dnsmasq_nftset)):
+        missing = sorted(set(mapping) - set(args.dnsmasq))
+        if missing:
+            parser.error(f"{option} 中的分类没有通过 --dnsmasq 指定上游: {', '.join(missing)}")
+    args.xray_outbound = dict(args.xray_outbound)
+    if args.jobs <= 0:
+        args.jobs = os.cpu_count() or 1
+    return args
+
+def main(argv=None):
     """
     主函数，执行脚本的主要流程。
     """
+    args = parse_args(argv)
     content = fetch_config(CONFIG_URL)  # 获取配置文件内容
     if not content:
         return
 
     data_dict = parse_config(content)  # 解析配置文件
-    fetched_contents = fetch_all_urls(data_dict)  # 获取所有 URL 内容
-    data_dict = merge_url_contents(data_dict, fetched_contents)  # 合并内容
-    prepare_directories()  # 准备目录
-    process_data(data_dict)  # 处理数据并生成文件
+    # Shadowrocket 配置引用的规则源与分类的规则源在同一轮中获取，每个 URL 只请求和解析一次
+    shadowrocket_lines = shadowrocket.load_config(args.shadowrocket) if args.shadowrocket else []
+    state = BuildState(OPTIMIZER_VERSION) if args.incremental else None
+    prepare_directories(clean=False)  # 准备目录，保留上次的文件以便跳过内容未变化的文件
+    sources = run_pipeline(  # 边获取边处理，分类的来源全部就绪后立即生成文件
+        data_dict, jobs=args.jobs, state=state, extra_urls=shadowrocket.config_urls(shadowrocket_lines)
+    )
+    remove_stale_outputs(data_dict, state)
+    if state is not None:
+        state.save()
+    write_manifest()  # 生成规则文件清单
+    write_dnsmasq_confs(args.dnsmasq, args.dnsmasq_exclude, args.dnsmasq_ipset, args.dnsmasq_nftset)  # 由已生成的 domain 文件直接生成 dnsmasq 配置
+    if args.mrs:
+        write_mrs_files(data_dict)  # 由已生成的 domain 和 ipcidr 文件生成 .mrs 规则集
+    if args.sing_box:
+        write_sing_box_rule_sets(data_dict)  # 由已生成的规则文件生成 sing-box 规则集
+    if args.xray:
+        geosite, geoip = load_xray_sites(data_dict)  # 由已生成的规则文件生成 Xray 资源文件和路由规则
+        paths = write_xray_geodata(geosite, geoip)
+        paths.append(write_xray_routing(content, geosite, geoip, args.xray_outbound))
+        remove_untracked_files(XRAY_FOLDER, paths)
+    if shadowrocket_lines:
+        shadowrocket.build_conf(shadowrocket_lines, sources, split=args.shadowrocket_split)
+    if args.rulesets:
+        # 清单刚刚生成，规则文件是否存在无需再请求 release 分支
+        generate_rulesets.write_rulesets(
+            content, generate_rulesets.load_release_files(MANIFEST_PATH), ruleset_format=args.rulesets_format
+        )
+    HTTP_CACHE.prune()  # 按大小和时长清理缓存
 
     print("处理完成，生成的文件在 'domain'、'ipcidr' 和 'classic' 文件夹中。")
     logging.info("处理完成，生成的文件在 'domain'、'ipcidr' 和 'classic' 文件夹中。")
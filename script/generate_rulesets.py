@@ -2,9 +2,30 @@ import requests
 import time
 import toml
 import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+CONFIG_URL = "https://raw.githubusercontent.com/angwz/DomainRouter/main/my.wei"
+RELEASE_URL = "https://raw.githubusercontent.com/angwz/DomainRouter/release/"
+MANIFEST_URL = f"{RELEASE_URL}clash-manifest.json"  # domain_router.py 生成的清单在 release 分支中的副本
+LOCAL_MANIFEST = "manifest.json"  # domain_router.py 在本地生成的清单
+# 本地输出文件夹与 release 分支文件夹的对应关系
+RELEASE_FOLDERS = {"domain": "clash-domain", "ipcidr": "clash-ipcidr", "classic": "clash-classic"}
+PROBE_WORKERS = 16  # 远程探测的并发数
+PROBE_TIMEOUT = 15  # 单次探测的超时时间（秒）
+OUTPUT_FILE = "toml/rulesets.toml"  # 生成的文件
+# 规则文件格式与扩展名，text 为 domain_router.py 与 YAML 同时生成的 mihomo text 格式
+RULESET_FORMATS = {"yaml": ".yaml", "text": ".list"}
+# subconverter 只凭 payload 行识别 clash-domain 与 clash-ipcidr，没有该行的 .list 无法转换；
+# classic 的 .list 每行为 'DOMAIN-SUFFIX,example.com'，与 Surge 规则集一致，可以按 surge-ruleset 读取
+TEXT_RULESET_TYPE = "surge-ruleset"
 
 def fetch_rules(url):
-    # 获取远程文件内容
+    # 获取远程文件内容，本地文件直接读取
+    if os.path.isfile(url):
+        with open(url, 'r', encoding='utf-8') as f:
+            return f.read()
     response = requests.get(url)
     response.raise_for_status()  # 如果请求失败，抛出异常
     content = response.text
@@ -39,46 +60,106 @@ def parse_rules(content):
     return rules, matches
 
 def is_url_valid(url):
-    # 检查URL的有效性，最多尝试3次，每次间隔5秒
-    attempt = 0
-    while attempt < 3:
+    # 用 HEAD 请求检查URL的有效性，最多尝试3次，不下载文件内容
+    for attempt in range(3):
         try:
-            response = requests.get(url)
+            response = requests.head(url, allow_redirects=True, timeout=PROBE_TIMEOUT)
             if response.status_code == 200:
                 return True
             elif response.status_code == 404:
                 return False
         except requests.RequestException:
             pass
-        attempt += 1
-        time.sleep(5)
+        time.sleep(attempt + 1)
     return False
 
-def generate_rulesets(rules, matches):
-    # 定义基础URL和时间间隔
-    base_url_domain = "https://raw.githubusercontent.com/angwz/DomainRouter/release/clash-domain/"
-    base_url_ipcidr = "https://raw.githubusercontent.com/angwz/DomainRouter/release/clash-ipcidr/"
-    base_url_classic = "https://raw.githubusercontent.com/angwz/DomainRouter/release/clash-classic/"
+def release_files_from_manifest(manifest):
+    # 将清单中的 domain/China.yaml 等路径转换为 release 分支中的 clash-domain/China.yaml
+    files = set()
+    for path in manifest.get("files", {}):
+        folder, _, filename = path.partition('/')
+        if folder in RELEASE_FOLDERS:
+            files.add(f"{RELEASE_FOLDERS[folder]}/{filename}")
+    return files
+
+def release_files_from_folders(root='.'):
+    # 直接扫描本地输出文件夹
+    files = set()
+    for folder, release_folder in RELEASE_FOLDERS.items():
+        path = os.path.join(root, folder)
+        if os.path.isdir(path):
+            files.update(
+                f"{release_folder}/{filename}" for filename in os.listdir(path)
+                if filename.endswith(tuple(RULESET_FORMATS.values()))
+            )
+    return files
+
+def load_release_files(manifest=None):
+    # 依次尝试指定的清单、本地清单、本地输出文件夹和 release 分支中的清单，全部不可用时返回 None
+    if manifest:
+        if os.path.isfile(manifest):
+            with open(manifest, 'r', encoding='utf-8') as f:
+                return release_files_from_manifest(json.load(f))
+        response = requests.get(manifest, timeout=PROBE_TIMEOUT)
+        response.raise_for_status()
+        return release_files_from_manifest(response.json())
+    if os.path.isfile(LOCAL_MANIFEST):
+        with open(LOCAL_MANIFEST, 'r', encoding='utf-8') as f:
+            return release_files_from_manifest(json.load(f))
+    files = release_files_from_folders()
+    if files:
+        return files
+    try:
+        response = requests.get(MANIFEST_URL, timeout=PROBE_TIMEOUT)
+        response.raise_for_status()
+        return release_files_from_manifest(response.json())
+    except (requests.RequestException, ValueError) as e:
+        print(f"无法获取清单 {MANIFEST_URL}，改为逐个探测: {e}")
+        return None
+
+def probe_urls(urls):
+    # 并发探测远程文件，返回存在的URL集合
+    urls = list(dict.fromkeys(urls))
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+        return {url for url, valid in zip(urls, executor.map(is_url_valid, urls)) if valid}
+
+def candidate_urls(rules, ruleset_format="yaml"):
+    # 列出生成规则集时需要确认是否存在的全部URL
+    urls = []
+    for key, value, has_comma in rules:
+        if not has_comma:
+            urls.extend(url for url, _ in ruleset_urls(key, ruleset_format))
+    return urls
+
+def ruleset_urls(key, ruleset_format="yaml"):
+    # 为没有逗号的规则生成三个类型的URL，ruleset_format 为 RULESET_FORMATS 中的格式
+    # text 格式只用于 classic，domain 与 ipcidr 仍引用带 payload 行的 YAML
+    yaml_extension = RULESET_FORMATS["yaml"]
+    if ruleset_format == "text":
+        classic = (f"{RELEASE_URL}clash-classic/{key}-classic{RULESET_FORMATS['text']}", TEXT_RULESET_TYPE)
+    else:
+        classic = (f"{RELEASE_URL}clash-classic/{key}-classic{yaml_extension}", "clash-classic")
+    return [
+        (f"{RELEASE_URL}clash-domain/{key}{yaml_extension}", "clash-domain"),
+        (f"{RELEASE_URL}clash-ipcidr/{key}-ipcidr{yaml_extension}", "clash-ipcidr"),
+        classic
+    ]
+
+def generate_rulesets(rules, matches, available, ruleset_format="yaml"):
+    # available 为存在的URL集合，由清单或远程探测得到
     interval = 21600
     rulesets = []
 
     for key, value, has_comma in rules:
         if not has_comma:
-            # 为没有逗号的规则生成三个类型的URL
-            urls = [
-                (f"{base_url_domain}{key}.yaml", "clash-domain"),
-                (f"{base_url_ipcidr}{key}-ipcidr.yaml", "clash-ipcidr"),
-                (f"{base_url_classic}{key}-classic.yaml", "clash-classic")
-            ]
-            for url, url_type in urls:
-                if is_url_valid(url):
+            for url, url_type in ruleset_urls(key, ruleset_format):
+                if url in available:
                     rulesets.append({
                         "group": value,
                         "ruleset": url,
                         "type": url_type,
                         "interval": interval
                     })
-                time.sleep(0.2)  # 每次请求间隔0.2秒
         else:
             # 处理包含逗号的规则
             value_parts = value.split(',', 1)
@@ -87,12 +168,11 @@ def generate_rulesets(rules, matches):
             no_resolve = ',no-resolve' if key.lower().startswith('geoip') and len(value_parts) > 1 and 'no-resolve' in value_parts[1].strip() else ''
             ruleset = f"[]{key}{no_resolve}"
             if ruleset.startswith('https'):
-                if is_url_valid(ruleset):
+                if ruleset in available:
                     rulesets.append({
                         "group": group,
                         "ruleset": ruleset
                     })
-                time.sleep(0.2)
             else:
                 rulesets.append({
                     "group": group,
@@ -108,13 +188,15 @@ def generate_rulesets(rules, matches):
 
     return rulesets
 
-def main():
-    # 主函数，负责整体流程控制
-    url = "https://raw.githubusercontent.com/angwz/DomainRouter/main/my.wei"
-    content = fetch_rules(url)
+def write_rulesets(content, release_files=None, output_file=OUTPUT_FILE, ruleset_format="yaml"):
+    # 由 my.wei 的内容生成 rulesets.toml，release_files 为 None 时逐个探测URL
     rules, matches = parse_rules(content)
-    rulesets = generate_rulesets(rules, matches)
-    output_file = "toml/rulesets.toml"  # 修改文件路径
+    urls = candidate_urls(rules, ruleset_format)
+    if release_files is None:
+        available = probe_urls(urls)
+    else:
+        available = {url for url in urls if url[len(RELEASE_URL):] in release_files}
+    rulesets = generate_rulesets(rules, matches, available, ruleset_format)
 
     # 确保 toml 目录存在
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
@@ -130,5 +212,18 @@ def main():
 
     print(f"规则集已生成并保存到 {output_file}")
 
+def main(argv=None):
+    # 主函数，负责整体流程控制；与 Clash 规则文件一起构建时使用 domain_router.py --rulesets
+    parser = argparse.ArgumentParser(description="生成 subconverter 使用的 rulesets.toml")
+    parser.add_argument("--config", default=CONFIG_URL, help="my.wei 的本地路径或URL")
+    parser.add_argument("--manifest", help="domain_router.py 生成的清单的本地路径或URL，默认依次尝试本地清单、本地输出文件夹和 release 分支中的清单")
+    parser.add_argument("--probe", action="store_true", help="不使用清单，对每个URL并发发送 HEAD 请求确认是否存在")
+    parser.add_argument("--format", choices=RULESET_FORMATS, default="yaml", help="引用的规则文件格式，text 只作用于 classic 规则，以 surge-ruleset 类型引用 .list，默认 yaml")
+    args = parser.parse_args(argv)
+
+    content = fetch_rules(args.config)
+    release_files = None if args.probe else load_release_files(args.manifest)
+    write_rulesets(content, release_files, ruleset_format=args.format)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,9 +1,31 @@
 import re
+import bisect
+import hashlib
+import argparse
+import shutil
 import requests
 import time
 import ipaddress
 import os
 from datetime import datetime, timedelta
+from http_cache import HttpCache
+from ip_cidr import parse_cidr
+
+# 单次请求超时时间（秒）
+REQUEST_TIMEOUT = 30
+
+# 上游规则源的条件请求缓存，未修改的内容直接从磁盘读取
+HTTP_CACHE = HttpCache()
+
+# 配置文件的地址
+CONFIG_URL = 'https://raw.githubusercontent.com/angwz/DomainRouter/refs/heads/main/config/my.shadowrocket'
+
+# 生成的文件
+CONF_PATH = 'conf/和好可以吗.conf'  # 内联全部规则的配置
+RULESET_CONF_PATH = 'conf/和好可以吗-ruleset.conf'  # 通过 RULE-SET 引用规则列表的配置
+RULESET_FOLDER = 'conf/rules'  # 每个分组一个规则列表文件
+# 规则列表发布后的地址前缀，GitHub Actions 将 RULESET_FOLDER 复制到 release 分支的 shadowrocket-rules 文件夹
+RULESET_BASE_URL = 'https://raw.githubusercontent.com/angwz/DomainRouter/release/shadowrocket-rules/'
 
 
 def fetch_url_content_with_retries(url, max_retries=3, delay_between_retries=5):
@@ -20,14 +42,9 @@ def fetch_url_content_with_retries(url, max_retries=3, delay_between_retries=5):
     """
     for attempt in range(max_retries):
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-
-            # 处理获取到的响应内容，去掉空白行和以 # 开头的行
-            lines = response.text.splitlines()
-            non_empty_lines = [line.strip() for line in lines if line.strip(
-            ) and not line.strip().startswith('#')]
-            return non_empty_lines
+            # 通过磁盘缓存发送条件请求，上游未修改时直接读取缓存
+            text = HTTP_CACHE.fetch(url, timeout=REQUEST_TIMEOUT)
+            return clean_content_lines(text)
 
         except requests.RequestException as error:
             print(f"第 {attempt + 1} 次请求失败，URL: {url}, 错误信息: {error}")
@@ -36,9 +53,44 @@ def fetch_url_content_with_retries(url, max_retries=3, delay_between_retries=5):
                 time.sleep(delay_between_retries)
 
     print(f"请求 URL 失败: {url}，重试了 {max_retries} 次。")
+    # 回退到缓存中的旧副本
+    stale_text = HTTP_CACHE.stale(url)
+    if stale_text is not None:
+        print(f"使用缓存副本: {url}")
+        return clean_content_lines(stale_text)
     return []
 
 
+def clean_content_lines(text):
+    """
+    处理获取到的响应内容，去掉空白行和以 # 开头的行
+
+    参数:
+    text (str): 响应内容
+
+    返回:
+    list: 处理后的非空行列表
+    """
+    lines = text.splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+
+
+def load_config(source=CONFIG_URL):
+    """
+    读取配置，本地文件直接读取，否则作为URL请求
+
+    参数:
+    source (str): 配置文件的本地路径或URL
+
+    返回:
+    list: 处理后的非空行列表
+    """
+    if os.path.isfile(source):
+        with open(source, 'r', encoding='utf-8') as f:
+            return clean_content_lines(f.read())
+    return fetch_url_content_with_retries(source)
+
+
 def clean_single_line(line):
     """
     对单行进行清理和格式化
@@ -90,12 +142,67 @@ def clean_single_line(line):
     return cleaned_line
 
 
-def preprocess_lines(lines):
+def is_url_line(line):
+    """
+    检查配置行是否为规则源URL
+
+    参数:
+    line (str): 配置行
+
+    返回:
+    bool: 是否以 http:// 或 https:// 开头
+    """
+    return line.startswith('http://') or line.startswith('https://')
+
+
+def config_urls(lines):
+    """
+    列出配置中引用的全部规则源URL，保持首次出现的顺序
+
+    参数:
+    lines (list): 配置行列表
+
+    返回:
+    list: 去重后的URL列表
+    """
+    return list(dict.fromkeys(line for line in lines if is_url_line(line)))
+
+
+def source_lines(groups):
+    """
+    将 domain_router.py 解析好的规则源条目转换为 Shadowrocket 规则行
+
+    '+.' 后缀转换为 DOMAIN-SUFFIX，不带前缀的条目在 Clash 域名规则集中只匹配域名本身，
+    转换为 DOMAIN；'.' 前缀（只匹配子域名）和 '*' 通配符无法表达，予以跳过
+
+    参数:
+    groups (tuple): (域名列表, IP/CIDR 列表, 经典规则列表)
+
+    返回:
+    list: 规则行列表
+    """
+    domain_list, ipcidr_list, classical_list = groups
+    lines = []
+    for item in domain_list:
+        if item.startswith('+.'):
+            lines.append(f"DOMAIN-SUFFIX,{item[2:]}")
+        elif item.startswith(('DOMAIN-SUFFIX,', 'DOMAIN,')):
+            lines.append(item)
+        elif not item.startswith('.') and '*' not in item and ',' not in item:
+            lines.append(f"DOMAIN,{item}")
+    for item in ipcidr_list:
+        lines.append(f"IP-CIDR6,{item}" if ':' in item else f"IP-CIDR,{item}")
+    lines.extend(classical_list)
+    return lines
+
+
+def preprocess_lines(lines, sources=None):
     """
     对列表中的每一行进行预处理
 
     参数:
     lines (list): 要处理的行列表
+    sources (dict): 可选的 URL 到 domain_router.py 解析结果的映射，提供时直接使用，不再请求
 
     返回:
     list: 处理后的行列表
@@ -104,10 +211,12 @@ def preprocess_lines(lines):
 
     for line in lines:
         # 处理以 http:// 或 https:// 开头的行
-        if line.startswith('http://') or line.startswith('https://'):
-            preprocessed_lines.extend(fetch_url_content_with_retries(line))
-        else:
+        if not is_url_line(line):
             preprocessed_lines.append(line)
+        elif sources is not None and line in sources:
+            preprocessed_lines.extend(source_lines(sources[line]))
+        else:
+            preprocessed_lines.extend(fetch_url_content_with_retries(line))
 
     # 清理所有行并过滤掉包含 'payload' 的行
     final_processed_lines = [clean_single_line(
@@ -184,6 +293,16 @@ def process_ip_and_domains(lines):
     return processed_lines
 
 
+# 合法的规则前缀，str.startswith 可直接接受元组
+VALID_PREFIXES = (
+    "DOMAIN", "DOMAIN-SUFFIX", "DOMAIN-KEYWORD", "DOMAIN-REGEX", "GEOSITE",
+    "IP-CIDR", "IP-CIDR6", "GEOIP",
+    "DST-PORT", "SRC-PORT",
+    "PROCESS-PATH", "PROCESS-PATH-REGEX",
+    "PROCESS-NAME", "PROCESS-NAME-REGEX"
+)
+
+
 def is_valid_prefix(element):
     """
     检查元素是否以合法的前缀开始
@@ -194,117 +313,271 @@ def is_valid_prefix(element):
     返回:
     bool: 元素是否有合法前缀
     """
-    valid_prefixes = [
-        "DOMAIN", "DOMAIN-SUFFIX", "DOMAIN-KEYWORD", "DOMAIN-REGEX", "GEOSITE",
-        "IP-CIDR", "IP-CIDR6", "GEOIP",
-        "DST-PORT", "SRC-PORT",
-        "PROCESS-PATH", "PROCESS-PATH-REGEX",
-        "PROCESS-NAME", "PROCESS-NAME-REGEX"
-    ]
+    return element.startswith(VALID_PREFIXES)
 
-    return any(element.startswith(prefix) for prefix in valid_prefixes)
+
+# 规则类型，顺序即排序时的先后顺序
+RULE_TYPES = (
+    "DOMAIN-SUFFIX", "DOMAIN-KEYWORD", "DOMAIN-REGEX", "DOMAIN",
+    "IP-CIDR", "IP-CIDR6", "GEOIP", "GEOSITE",
+    "DST-PORT", "SRC-PORT",
+    "PROCESS-PATH", "PROCESS-PATH-REGEX",
+    "PROCESS-NAME", "PROCESS-NAME-REGEX"
+)
+RULE_TYPE_IDS = {rule_type: index for index, rule_type in enumerate(RULE_TYPES)}
+UNKNOWN_TYPE_ID = len(RULE_TYPES)  # 未知类型排在最后，生成 conf 时被删除
+GROUP_TYPE_ID = -1  # [group] 分组标头
+DOMAIN_SUFFIX_TYPE_ID = RULE_TYPE_IDS["DOMAIN-SUFFIX"]
+DOMAIN_TYPE_ID = RULE_TYPE_IDS["DOMAIN"]
+DOMAIN_TYPE_IDS = frozenset(RULE_TYPE_IDS[t] for t in ("DOMAIN-SUFFIX", "DOMAIN", "DOMAIN-KEYWORD", "DOMAIN-REGEX"))
+IP_TYPE_IDS = frozenset(RULE_TYPE_IDS[t] for t in ("IP-CIDR", "IP-CIDR6"))
+NO_RESOLVE_TYPE_IDS = frozenset(RULE_TYPE_IDS[t] for t in ("IP-CIDR", "IP-CIDR6", "GEOIP"))
+
+
+class RuleRecord:
+    """
+    解析后的规则。每行只解析一次，排序、优化和统计都直接使用这些字段，
+    只有 generate_conf_file 才会拼接出规则文本
+
+    type_id: RULE_TYPES 中的下标，分组标头为 GROUP_TYPE_ID
+    rule_type: 规则类型文本
+    value: 规则行中逗号后的第一个字段，没有时为 None；分组标头为分组名称
+    group: 所属分组的序号，每个 [group] 标头依次编号，第一个标头之前的规则为 None
+    ip_key: IP-CIDR 规则地址部分的整数值，用于排序，无法解析时为 0
+    network: IP-CIDR 规则的 (版本, 起始地址, 结束地址)，无法解析时为 None
+    body: 原始规则文本，不含分组和 no-resolve
+    """
+
+    __slots__ = ("type_id", "rule_type", "value", "group", "ip_key", "network", "body")
+
+    def __init__(self, type_id, rule_type, value, group, body, ip_key=0, network=None):
+        self.type_id = type_id
+        self.rule_type = rule_type
+        self.value = value
+        self.group = group
+        self.ip_key = ip_key
+        self.network = network
+        self.body = body
+
+
+def parse_ip_rule_value(value):
+    """
+    解析 IP-CIDR 规则的值
+
+    参数:
+    value (str): CIDR 文本
+
+    返回:
+    tuple: (地址部分的整数值, parse_cidr 的结果)，地址无法解析时整数值为 0
+    """
+    address = parse_cidr(value.split('/')[0])
+    return (address[1] if address else 0), parse_cidr(value)
+
+
+def parse_rule(body, group, group_name):
+    """
+    将一条规则解析为 RuleRecord
+
+    参数:
+    body (str): 规则文本
+    group (int): 所属分组的序号
+    group_name (str): 所属分组的名称
+
+    返回:
+    RuleRecord: 解析后的规则
+    """
+    rule_type, separator, rest = body.partition(',')
+    if separator:
+        value = rest.split(',', 1)[0]
+    elif group_name:
+        # 规则本身没有逗号时，规则行中逗号后的第一个字段是分组名称
+        value = group_name.split(',', 1)[0]
+    else:
+        value = None
+
+    type_id = RULE_TYPE_IDS.get(rule_type, UNKNOWN_TYPE_ID)
+    if type_id in IP_TYPE_IDS:
+        ip_key, network = parse_ip_rule_value(value or '')
+        return RuleRecord(type_id, rule_type, value, group, body, ip_key, network)
+    return RuleRecord(type_id, rule_type, value, group, body)
 
 
 def filter_elements_by_valid_prefix(lines):
     """
-    对列表进行合法性检查，保留以有效前缀开始的元素或以 [ ] 包裹的行
-    同时处理 current_group 和 no-resolve 的拼接
+    对列表进行合法性检查，保留以有效前缀开始的元素或以 [ ] 包裹的行，
+    并将每一行解析为 RuleRecord；current_group 和 no-resolve 在生成 conf 时才拼接
 
     参数:
     lines (list): 要过滤的行列表
 
     返回:
-    list: 过滤后的行列表
+    list: RuleRecord 列表
     """
-    valid_lines = []
-    current_group = None
+    records = []
+    group = None
+    group_name = None
 
     for line in lines:
         if line.startswith('[') and line.endswith(']'):
-            current_group = line[1:-1]  # 更新当前组
-            valid_lines.append(line)
+            group = 0 if group is None else group + 1
+            group_name = line[1:-1]  # 更新当前组
+            records.append(RuleRecord(GROUP_TYPE_ID, None, group_name, group, line))
         elif is_valid_prefix(line):
-            parts = line.split(',')
-            rule_type = parts[0]
+            records.append(parse_rule(line, group, group_name))
 
-            # 处理 current_group 和 no-resolve 的拼接
-            if current_group:
-                if rule_type in ['IP-CIDR', 'IP-CIDR6', 'GEOIP']:
-                    line = f"{line},{current_group},no-resolve"
-                else:
-                    line = f"{line},{current_group}"
+    return records
 
-            valid_lines.append(line)
 
-    return valid_lines
+def group_names_of(records):
+    """
+    收集分组序号到分组名称的映射
+    """
+    return {record.group: record.value for record in records if record.type_id == GROUP_TYPE_ID}
 
 
-def optimize_rules(lines):
+def render_rule(record, group_names):
     """
-    优化规则列表：去重和覆盖范围优化
+    生成规则行，拼接 current_group 和 no-resolve
 
     参数:
-    lines (list): 要优化的规则列表
+    record (RuleRecord): 规则
+    group_names (dict): 分组序号到分组名称的映射
 
     返回:
-    list: 优化后的规则列表
+    str: 规则行，分组标头返回原始的 [group] 行
     """
-    # 去重，保留第一个出现的元素
-    seen = set()
-    deduped_lines = []
-    for line in lines:
-        if line not in seen:
-            deduped_lines.append(line)
-            seen.add(line)
-
-    # 按照原始顺序优化规则
-    optimized_lines = []
-    for idx, line in enumerate(deduped_lines):
-        # 忽略以 [ 开头和 ] 结尾的行
-        if line.startswith('[') and line.endswith(']'):
-            optimized_lines.append(line)
-            continue
+    if record.type_id == GROUP_TYPE_ID:
+        return record.body
+    group_name = group_names.get(record.group)
+    if not group_name:
+        return record.body
+    if record.type_id in NO_RESOLVE_TYPE_IDS:
+        return f"{record.body},{group_name},no-resolve"
+    return f"{record.body},{group_name}"
 
-        parts = line.split(',')
-        if len(parts) < 2:
-            optimized_lines.append(line)
-            continue
 
-        prefix = parts[0]
-        value = parts[1]
+class SuffixIndex:
+    """
+    DOMAIN-SUFFIX 覆盖索引：已保留的后缀存入集合，判断时依次查找域名自身及其每一级父域名，
+    查找次数只与标签数量有关
+    """
+
+    def __init__(self):
+        self.suffixes = set()
 
-        # 只对指定类型进行优化
-        if prefix not in ["DOMAIN-SUFFIX", "IP-CIDR", "IP-CIDR6"]:
-            optimized_lines.append(line)
-            continue
+    def covers(self, value):
+        """
+        检查 value 是否被已保留的某个后缀覆盖
+
+        参数:
+        value (str): DOMAIN-SUFFIX 的值
+
+        返回:
+        bool: 是否被覆盖
+        """
+        value = value.lower()
+        suffixes = self.suffixes
+        if value in suffixes:
+            return True
+        index = value.find('.')
+        while index != -1:
+            if value[index + 1:] in suffixes:
+                return True
+            index = value.find('.', index + 1)
+        return False
+
+    def add(self, value):
+        self.suffixes.add(value.lower())
+
+
+class CidrIndex:
+    """
+    IP-CIDR 覆盖索引：按 IP 版本保存按起始地址排序、互不重叠的地址区间。
+    CIDR 之间只有包含和不相交两种关系，加入新网络时移除被它包含的区间，
+    因此覆盖检查只需二分查找起始地址不大于目标的最后一个区间
+    """
+
+    def __init__(self):
+        self.starts = {4: [], 6: []}
+        self.ends = {4: [], 6: []}
+
+    def covers(self, network):
+        """
+        检查网络是否是已保留的某个网络的子集
+
+        参数:
+        network (tuple): parse_cidr 的结果，None 表示无法解析
+
+        返回:
+        bool: 是否被覆盖
+        """
+        if network is None:
+            return False
+        version, start, end = network
+        index = bisect.bisect_right(self.starts[version], start) - 1
+        return index >= 0 and self.ends[version][index] >= end
+
+    def add(self, network):
+        if network is None:
+            return
+        version, start, end = network
+        starts, ends = self.starts[version], self.ends[version]
+        low = bisect.bisect_left(starts, start)
+        high = bisect.bisect_right(starts, end)
+        # 区间 [low, high) 中的网络都被新网络包含
+        starts[low:high] = [start]
+        ends[low:high] = [end]
 
-        to_remove = False
 
-        # 与之前的规则比较
-        for prev_line in optimized_lines:
-            prev_parts = prev_line.split(',')
-            if len(prev_parts) < 2:
-                continue
+def optimize_rules(records):
+    """
+    优化规则列表：去重和覆盖范围优化
 
-            prev_prefix = prev_parts[0]
-            prev_value = prev_parts[1]
+    按原始顺序处理，只有被之前已保留的同类型规则覆盖的规则才会被移除，
+    跨 [group] 时同样保持先匹配先生效的语义
 
-            if prefix != prev_prefix:
-                continue
+    参数:
+    records (list): 要优化的 RuleRecord 列表
 
-            if prefix == "DOMAIN-SUFFIX":
-                if is_suffix_covered(prev_value, value):
-                    to_remove = True
-                    break
-            elif prefix in ["IP-CIDR", "IP-CIDR6"]:
-                if is_ip_subset(value, prev_value):
-                    to_remove = True
-                    break
+    返回:
+    list: 优化后的 RuleRecord 列表
+    """
+    # 每种可优化的规则类型各有一个覆盖索引，只收录已保留的规则
+    suffix_index = SuffixIndex()
+    cidr_indexes = {RULE_TYPE_IDS["IP-CIDR"]: CidrIndex(), RULE_TYPE_IDS["IP-CIDR6"]: CidrIndex()}
 
-        if not to_remove:
-            optimized_lines.append(line)
+    # 按照原始顺序优化规则，规则去重以生成的规则行为准，保留第一个出现的元素；
+    # 分组标头全部保留，生成 conf 时据此查找分组名称
+    seen = set()
+    group_names = {}
+    optimized_records = []
+    for record in records:
+        type_id = record.type_id
+        if type_id == GROUP_TYPE_ID:
+            group_names[record.group] = record.value or None
+            optimized_records.append(record)
+            continue
+        key = (record.body, group_names.get(record.group))
+        if key in seen:
+            continue
+        seen.add(key)
+
+        # 没有值的规则直接保留，只对指定类型进行优化
+        if record.value is None:
+            optimized_records.append(record)
+        elif type_id == DOMAIN_SUFFIX_TYPE_ID:
+            if not suffix_index.covers(record.value):
+                suffix_index.add(record.value)
+                optimized_records.append(record)
+        elif type_id in cidr_indexes:
+            cidr_index = cidr_indexes[type_id]
+            if not cidr_index.covers(record.network):
+                cidr_index.add(record.network)
+                optimized_records.append(record)
+        else:
+            optimized_records.append(record)
 
-    return optimized_lines
+    return optimized_records
 
 
 class TrieNode:
@@ -354,206 +627,201 @@ def is_domain_in_trie(root, domain):
     return node.is_end
 
 
-def optimize_domain_rules(lines):
+def optimize_domain_rules(records):
     """
     优化规则列表中的 DOMAIN 类型规则
 
     参数:
-    lines (list): 要优化的规则列表
+    records (list): 要优化的 RuleRecord 列表
 
     返回:
-    list: 优化后的规则列表
+    list: 优化后的 RuleRecord 列表
     """
     # 创建前缀树的根节点
     trie_root = TrieNode()
 
     # 第一次遍历：添加所有 DOMAIN-SUFFIX 规则到前缀树
-    for line in lines:
-        if line.startswith('DOMAIN-SUFFIX,'):
-            domain = line.split(',')[1]
-            add_domain_to_trie(trie_root, domain)
+    for record in records:
+        if record.type_id == DOMAIN_SUFFIX_TYPE_ID and record.value is not None:
+            add_domain_to_trie(trie_root, record.value)
 
     # 第二次遍历：处理 DOMAIN 规则
-    optimized_lines = []
-    for line in lines:
-        if line.startswith('DOMAIN,'):
-            domain = line.split(',')[1]
-            if not is_domain_in_trie(trie_root, domain):
+    optimized_records = []
+    for record in records:
+        if record.type_id == DOMAIN_TYPE_ID and record.value is not None:
+            if not is_domain_in_trie(trie_root, record.value):
                 # 如果域名没有被更广泛的规则覆盖，则保留这条规则
-                optimized_lines.append(line)
+                optimized_records.append(record)
         else:
             # 非 DOMAIN 规则直接保留
-            optimized_lines.append(line)
+            optimized_records.append(record)
 
-    return optimized_lines
+    return optimized_records
 
 
-def is_suffix_covered(existing_value, new_value):
+def count_rule_types(records):
     """
-    检查 existing_value 是否覆盖 new_value
+    统计各类规则的数量
 
     参数:
-    existing_value (str): 现有的值
-    new_value (str): 新的值
+    records (list): RuleRecord 列表
 
     返回:
-    bool: existing_value 是否覆盖 new_value
+    dict: 各类规则的数量统计
+    """
+    rule_counts = {}
+    for record in records:
+        if record.type_id != GROUP_TYPE_ID and record.value is not None:
+            rule_counts[record.rule_type] = rule_counts.get(record.rule_type, 0) + 1
+    return rule_counts
+
+
+def rule_sort_key(record):
     """
-    existing_value = existing_value.lower()
-    new_value = new_value.lower()
-    if new_value == existing_value:
-        return True
-    if new_value.endswith('.' + existing_value):
-        return True
-    return False
+    规则的排序键：先按 RULE_TYPES 中的顺序，域名类规则再按层级和文本，
+    IP 类规则按地址数值，其余按文本
+    """
+    type_id = record.type_id
+    value = record.value or ''
+    if type_id in DOMAIN_TYPE_IDS:
+        return (type_id, value.count('.') + 1, value)
+    elif type_id in IP_TYPE_IDS:
+        return (type_id, record.ip_key)
+    else:
+        return (type_id, value)
 
 
-def is_ip_subset(sub_cidr, parent_cidr):
+def sort_rules(records):
     """
-    检查 sub_cidr 是否是 parent_cidr 的子集
+    对规则进行排序，每个 [group] 内部单独排序
 
     参数:
-    sub_cidr (str): 子网CIDR
-    parent_cidr (str): 父网CIDR
+    records (list): 要排序的 RuleRecord 列表
 
     返回:
-    bool: sub_cidr 是否是 parent_cidr 的子集
+    list: 排序后的 RuleRecord 列表
     """
-    try:
-        sub_network = ipaddress.ip_network(sub_cidr, strict=False)
-        parent_network = ipaddress.ip_network(parent_cidr, strict=False)
-        return sub_network.subnet_of(parent_network)
-    except ValueError:
-        return False
+    sorted_sections = []
+    current_section = []
+
+    for record in records:
+        if record.type_id == GROUP_TYPE_ID:
+            # 对当前部分进行排序并添加到结果中，再添加分组标头
+            sorted_sections.extend(sorted(current_section, key=rule_sort_key))
+            sorted_sections.append(record)
+            current_section = []
+        else:
+            current_section.append(record)
+
+    # 处理最后一组
+    sorted_sections.extend(sorted(current_section, key=rule_sort_key))
+
+    return sorted_sections
 
 
-def count_rule_types(lines):
+def valid_rule_records(records):
     """
-    统计各类规则的数量
+    生成最终的规则行，并删除无效类型的规则
 
     参数:
-    lines (list): 规则列表
+    records (list): RuleRecord 列表
 
     返回:
-    dict: 各类规则的数量统计
+    list: (RuleRecord, 规则行) 列表，不含分组标头
     """
-    rule_counts = {}
-    for line in lines:
-        if ',' in line:
-            rule_type = line.split(',')[0]
-            rule_counts[rule_type] = rule_counts.get(rule_type, 0) + 1
-    return rule_counts
+    group_names = group_names_of(records)
+    valid = []
+    for record in records:
+        if record.type_id == GROUP_TYPE_ID:
+            continue
+        line = render_rule(record, group_names)
+        if line.endswith(']'):
+            continue
+        if record.type_id == UNKNOWN_TYPE_ID:
+            print(f"警告: 删除了无效的规则类型: {line}")
+            continue
+        valid.append((record, line))
+    return valid
 
 
-def sort_rules(lines):
+def render_rules(records):
     """
-    对规则进行排序
+    生成最终的规则行，并删除无效类型的规则
 
     参数:
-    lines (list): 要排序的规则列表
+    records (list): RuleRecord 列表
 
     返回:
-    list: 排序后的规则列表
-    """
-    rule_order = [
-        "DOMAIN-SUFFIX", "DOMAIN-KEYWORD", "DOMAIN-REGEX", "DOMAIN",
-        "IP-CIDR", "IP-CIDR6", "GEOIP", "GEOSITE",
-        "DST-PORT", "SRC-PORT",
-        "PROCESS-PATH", "PROCESS-PATH-REGEX",
-        "PROCESS-NAME", "PROCESS-NAME-REGEX"
-    ]
-
-    def get_rule_type(line):
-        return line.split(',')[0] if ',' in line else ''
-
-    def get_domain_or_ip(line):
-        parts = line.split(',')
-        return parts[1] if len(parts) > 1 else ''
+    tuple: (规则行列表, 各类规则的数量统计)
+    """
+    valid = valid_rule_records(records)
+    # 统计规则数量（仅计算有效规则）
+    return [line for _, line in valid], count_rule_types(record for record, _ in valid)
 
-    def domain_level(domain):
-        return len(domain.split('.'))
 
-    def ip_to_int(ip):
-        try:
-            return int(ipaddress.ip_address(ip.split('/')[0]))
-        except ValueError:
-            return 0  # 对于无效IP返回0
-
-    def sort_key(line):
-        rule_type = get_rule_type(line)
-        try:
-            rule_index = rule_order.index(rule_type)
-        except ValueError:
-            rule_index = len(rule_order)  # 将未知类型放到最后
+def render_rule_set_line(record):
+    """
+    生成规则列表中的一行：规则列表中的规则不带策略，策略由引用它的 RULE-SET 行指定
+    """
+    if record.type_id in NO_RESOLVE_TYPE_IDS:
+        return f"{record.body},no-resolve"
+    return record.body
 
-        domain_or_ip = get_domain_or_ip(line)
 
-        if rule_type in ["DOMAIN-SUFFIX", "DOMAIN", "DOMAIN-KEYWORD", "DOMAIN-REGEX"]:
-            return (rule_index, domain_level(domain_or_ip), domain_or_ip)
-        elif rule_type in ["IP-CIDR", "IP-CIDR6"]:
-            return (rule_index, ip_to_int(domain_or_ip))
-        else:
-            return (rule_index, domain_or_ip)
+def write_rule_sets(valid, group_names, base_url=RULESET_BASE_URL, folder=RULESET_FOLDER):
+    """
+    将每个 [group] 的规则写入单独的规则列表文件，文件名包含内容的哈希，
+    内容不变的分组地址也不变，客户端只需重新下载变化的分组
 
-    sorted_sections = []
-    current_section = []
+    参数:
+    valid (list): valid_rule_records 的结果
+    group_names (dict): 分组序号到分组名称的映射
+    base_url (str): 规则列表发布后的地址前缀
+    folder (str): 规则列表的输出目录
 
-    for line in lines:
-        if line.startswith('[') and line.endswith(']'):
-            if current_section:
-                # 对当前部分进行排序并添加到结果中
-                sorted_sections.extend(sorted(current_section, key=sort_key))
-                sorted_sections.append(line)  # 添加分组标头
-                current_section = []
-            else:
-                sorted_sections.append(line)
+    返回:
+    list: 写入主配置 [Rule] 段的行，每个分组一条 RULE-SET，不属于任何分组的规则原样保留
+    """
+    os.makedirs(folder, exist_ok=True)
+
+    # 按分组切分，保持原有顺序，先匹配先生效的语义不变
+    sections = []
+    for record, line in valid:
+        group_name = group_names.get(record.group)
+        if not group_name:
+            sections.append((None, [line]))
+        elif sections and sections[-1][0] == record.group:
+            sections[-1][1].append(render_rule_set_line(record))
         else:
-            current_section.append(line)
-
-    # 处理最后一组
-    if current_section:
-        sorted_sections.extend(sorted(current_section, key=sort_key))
+            sections.append((record.group, [render_rule_set_line(record)]))
 
-    return sorted_sections
+    rule_lines = []
+    for group, lines in sections:
+        if group is None:
+            rule_lines.extend(lines)
+            continue
+        group_name = group_names[group]
+        text = '\n'.join(lines) + '\n'
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+        slug = re.sub(r'[^0-9A-Za-z_-]+', '_', group_name).strip('_') or 'group'
+        filename = f"{slug}-{digest}.list"
+        with open(os.path.join(folder, filename), 'w', encoding='utf-8') as f:
+            f.write(text)
+        rule_lines.append(f"RULE-SET,{base_url}{filename},{group_name}")
+    return rule_lines
 
 
-def generate_conf_file(lines):
+def render_conf(rule_lines, rule_counts):
     """
-    生成 conf 文件，并在最终生成前进行合法性检查
+    生成 conf 文件内容
 
     参数:
-    lines (list): 规则列表
-    """
-    # 确保 conf 目录存在
-    os.makedirs('conf', exist_ok=True)
-
-    # 清空 conf 目录
-    for file in os.listdir('conf'):
-        os.remove(os.path.join('conf', file))
-
-    # 定义有效的规则类型
-    valid_rule_types = [
-        "DOMAIN-SUFFIX", "DOMAIN-KEYWORD", "DOMAIN-REGEX", "DOMAIN",
-        "IP-CIDR", "IP-CIDR6", "GEOIP", "GEOSITE",
-        "DST-PORT", "SRC-PORT",
-        "PROCESS-PATH", "PROCESS-PATH-REGEX",
-        "PROCESS-NAME", "PROCESS-NAME-REGEX"
-    ]
+    rule_lines (list): [Rule] 段中的规则行
+    rule_counts (dict): 各类规则的数量统计
 
-    # 最终的合法性检查和过滤
-    valid_rules = []
-    for line in lines:
-        if line.startswith('[') or line.endswith(']'):
-            continue
-        else:
-            rule_type = line.split(',')[0]
-            if rule_type in valid_rule_types:
-                valid_rules.append(line)
-            else:
-                print(f"警告: 删除了无效的规则类型: {line}")
-
-    # 统计规则数量（仅计算有效规则）
-    rule_counts = count_rule_types(valid_rules)
+    返回:
+    str: 文件内容
+    """
     rule_count_str = ' '.join(
         [f"{k}:{v}" for k, v in rule_counts.items() if v > 0])
 
@@ -591,7 +859,7 @@ def generate_conf_file(lines):
     ]
 
     # 添加有效规则
-    content.extend(valid_rules)
+    content.extend(rule_lines)
 
     # 添加 [Host] 部分
     content.extend([
@@ -610,27 +878,64 @@ def generate_conf_file(lines):
         '^https?://(www.)?google.cn https://www.google.com 302'
     ])
 
+    return '\n'.join(content)
+
+
+def generate_conf_file(records, split=False, ruleset_base_url=RULESET_BASE_URL):
+    """
+    生成 conf 文件，并在最终生成前进行合法性检查
+
+    参数:
+    records (list): RuleRecord 列表
+    split (bool): 是否同时生成按分组拆分的规则列表，以及通过 RULE-SET 引用它们的配置
+    ruleset_base_url (str): 规则列表发布后的地址前缀
+    """
+    # 确保 conf 目录存在
+    os.makedirs('conf', exist_ok=True)
+
+    # 清空 conf 目录
+    for file in os.listdir('conf'):
+        path = os.path.join('conf', file)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    # 最终的合法性检查和过滤，规则行只在这里生成
+    valid = valid_rule_records(records)
+    valid_rules = [line for _, line in valid]
+    # 统计规则数量（仅计算有效规则）
+    rule_counts = count_rule_types(record for record, _ in valid)
+
     # 写入文件
-    with open('conf/和好可以吗.conf', 'w', encoding='utf-8') as f:
-        f.write('\n'.join(content))
+    with open(CONF_PATH, 'w', encoding='utf-8') as f:
+        f.write(render_conf(valid_rules, rule_counts))
 
+    if split:
+        rule_lines = write_rule_sets(valid, group_names_of(records), ruleset_base_url)
+        with open(RULESET_CONF_PATH, 'w', encoding='utf-8') as f:
+            f.write(render_conf(rule_lines, rule_counts))
+        print(f"生成的规则列表数: {sum(line.startswith('RULE-SET,') for line in rule_lines)}")
+
+    rule_count_str = ' '.join(
+        [f"{k}:{v}" for k, v in rule_counts.items() if v > 0])
     print(f"生成的规则总数: {sum(rule_counts.values())}")
     print(f"规则类型统计: {rule_count_str}")
 
 
-def main():
+def build_conf(raw_lines, sources=None, split=False, ruleset_base_url=RULESET_BASE_URL):
     """
-    主函数：执行整个处理流程
-    """
-    # 从URL获取配置
-    url = 'https://raw.githubusercontent.com/angwz/DomainRouter/refs/heads/main/config/my.shadowrocket'
-    print("正在从URL获取配置...")
-    raw_lines = fetch_url_content_with_retries(url)
-    print(f"成功获取 {len(raw_lines)} 行配置。")
+    由配置行生成 conf 文件
 
+    参数:
+    raw_lines (list): 配置行列表
+    sources (dict): 可选的 URL 到 domain_router.py 解析结果的映射，缺少的URL单独请求
+    split (bool): 是否同时生成规则列表和引用它们的配置
+    ruleset_base_url (str): 规则列表发布后的地址前缀
+    """
     # 对列表内容进行预处理
     print("正在预处理配置内容...")
-    preprocessed_lines = preprocess_lines(raw_lines)
+    preprocessed_lines = preprocess_lines(raw_lines, sources)
     print(f"预处理后剩余 {len(preprocessed_lines)} 行。")
 
     # 对处理后的列表进行IP地址、域名和通配符域名判断和处理
@@ -638,31 +943,63 @@ def main():
     processed_lines = process_ip_and_domains(preprocessed_lines)
     print(f"处理后共有 {len(processed_lines)} 行。")
 
-    # 对列表进行合法性检查，保留有效元素，并处理 current_group 和 no-resolve 的拼接
+    # 对列表进行合法性检查，保留有效元素，并将每一行解析为规则记录
     print("正在进行合法性检查和规则处理...")
-    valid_filtered_lines = filter_elements_by_valid_prefix(processed_lines)
-    print(f"合法性检查和规则处理后剩余 {len(valid_filtered_lines)} 行。")
+    valid_records = filter_elements_by_valid_prefix(processed_lines)
+    print(f"合法性检查和规则处理后剩余 {len(valid_records)} 行。")
 
     # 对规则进行排序
     print("正在对规则进行排序...")
-    sorted_lines = sort_rules(valid_filtered_lines)
+    sorted_records = sort_rules(valid_records)
     print("排序完成。")
 
     # 进行优化：去重和覆盖范围优化
     print("正在优化规则...")
-    optimized_lines = optimize_rules(sorted_lines)
-    print(f"优化后剩余 {len(optimized_lines)} 行。")
+    optimized_records = optimize_rules(sorted_records)
+    print(f"优化后剩余 {len(optimized_records)} 行。")
 
     # 优化 DOMAIN 规则
     print("正在优化 DOMAIN 规则...")
-    optimized_domain_lines = optimize_domain_rules(optimized_lines)
-    print(f"DOMAIN 规则优化后剩余 {len(optimized_domain_lines)} 行。")
+    optimized_domain_records = optimize_domain_rules(optimized_records)
+    print(f"DOMAIN 规则优化后剩余 {len(optimized_domain_records)} 行。")
 
     # 生成 conf 文件（包含最终的合法性检查）
     print("正在生成 conf 文件...")
-    generate_conf_file(optimized_domain_lines)
+    generate_conf_file(optimized_domain_records, split=split, ruleset_base_url=ruleset_base_url)
     print("conf 文件生成完成。")
 
+
+def main(argv=None):
+    """
+    主函数：执行整个处理流程
+
+    与 Clash 规则文件一起构建时使用 domain_router.py --shadowrocket，规则源只请求和解析一次
+    """
+    parser = argparse.ArgumentParser(description="生成 Shadowrocket 配置")
+    parser.add_argument(
+        "--config", default=CONFIG_URL,
+        help="my.shadowrocket 的本地路径或URL",
+    )
+    parser.add_argument(
+        "--split", action="store_true",
+        help=f"同时将每个分组写入单独的规则列表，并生成通过 RULE-SET 引用它们的 {RULESET_CONF_PATH}",
+    )
+    parser.add_argument(
+        "--ruleset-base-url", default=RULESET_BASE_URL,
+        help=f"规则列表发布后的地址前缀，默认为 {RULESET_BASE_URL}",
+    )
+    args = parser.parse_args(argv)
+
+    # 获取配置
+    print("正在获取配置...")
+    raw_lines = load_config(args.config)
+    print(f"成功获取 {len(raw_lines)} 行配置。")
+
+    build_conf(raw_lines, split=args.split, ruleset_base_url=args.ruleset_base_url)
+
+    # 按大小和时长清理缓存
+    HTTP_CACHE.prune()
+
     print("处理完成，conf 文件已生成。")
 
 
@@ -0,0 +1,369 @@
+# 上游规则源的磁盘 HTTP 缓存
+#
+# 以 URL 为键保存响应内容及其 ETag / Last-Modified，再次请求时发送条件请求，
+# 上游返回 304 时直接使用磁盘中的副本；上游超时或不可用时可以回退到旧副本。
+import os
+import json
+import gzip
+import time
+import hashlib
+import logging
+import threading
+import requests
+from contextlib import contextmanager, nullcontext
+
+# 缓存目录，可通过环境变量覆盖，GitHub Actions 中由 actions/cache 在多次运行之间保留
+CACHE_DIR = os.environ.get("DOMAINROUTER_CACHE_DIR", os.path.join(".cache", "http"))
+CACHE_COMPRESS = True  # 是否以 gzip 压缩保存内容
+CACHE_MAX_BYTES = 256 * 1024 * 1024  # 缓存总大小上限（字节）
+CACHE_MAX_AGE = 30 * 24 * 3600  # 超过此时长未被使用的条目会被清理（秒）
+CACHE_TEMP_GRACE = 3600  # 临时文件超过此时长未修改视为中断的下载遗留，予以清理（秒）
+CHUNK_SIZE = 64 * 1024  # 流式读取时每块的字节数
+
+class RequestCancelled(requests.exceptions.RequestException):
+    """
+    请求所属的获取已被取消，例如超过了整体截止时间。
+    """
+
+def close_response(response):
+    """
+    关闭响应的底层连接。urllib3 2.3 起的 shutdown 可以让其他线程中阻塞的读取立即返回。
+    """
+    shutdown = getattr(response.raw, "shutdown", None)
+    try:
+        if shutdown is not None:
+            shutdown()
+        response.close()
+    except OSError:
+        pass
+
+class CancelToken:
+    """
+    一组请求共用的取消标记。cancel 可以从其他线程调用：正在读取的响应立即关闭连接，
+    之后的请求和读取抛出 RequestCancelled，被放弃的下载不会写入缓存。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._responses = set()
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        取消全部请求并关闭已打开的响应。
+        """
+        with self._lock:
+            self.cancelled = True
+            responses = list(self._responses)
+        for response in responses:
+            close_response(response)
+
+    def check(self):
+        """
+        已取消时抛出 RequestCancelled。
+        """
+        if self.cancelled:
+            raise RequestCancelled("请求已取消")
+
+    @contextmanager
+    def track(self, response):
+        """
+        在 with 块内登记响应，取消时关闭它；已经取消时直接抛出 RequestCancelled。
+        """
+        with self._lock:
+            self._responses.add(response)
+        try:
+            self.check()
+            yield response
+        finally:
+            with self._lock:
+                self._responses.discard(response)
+
+def tracked(response, cancel=None):
+    """
+    返回在取消时关闭响应的上下文，没有取消标记时不做处理。
+    """
+    return cancel.track(response) if cancel is not None else nullcontext(response)
+
+class HttpCache:
+    """
+    以 URL 为键的条件请求缓存，每个条目由一个元数据 JSON 文件和一个内容文件组成。
+    """
+
+    def __init__(self, directory=CACHE_DIR, compress=CACHE_COMPRESS,
+                 max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE, temp_grace=CACHE_TEMP_GRACE):
+        self.directory = directory
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.temp_grace = temp_grace
+
+    def _paths(self, url):
+        """
+        返回 URL 对应的 (元数据路径, 内容路径)。
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.json"), os.path.join(self.directory, f"{key}.body")
+
+    def _write_atomic(self, path, data):
+        """
+        先写入临时文件再替换，避免并发请求或中断留下半个文件。
+        """
+        temp_path = f"{path}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    def _load(self, url):
+        """
+        读取 URL 的缓存条目。
+
+        返回：
+            tuple: (元数据字典, 内容文本)，没有缓存或缓存损坏时返回 (None, None)。
+        """
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as file:
+                meta = json.load(file)
+            with open(body_path, "rb") as file:
+                body = file.read()
+            if meta.get("compressed"):
+                body = gzip.decompress(body)
+            return meta, body.decode("utf-8")
+        except (OSError, ValueError, EOFError):
+            return None, None
+
+    def _load_meta(self, url):
+        """
+        只读取 URL 的元数据，内容文件不存在时视为没有缓存。
+
+        返回：
+            dict: 元数据字典，没有缓存或缓存损坏时返回 None。
+        """
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return meta if os.path.isfile(body_path) else None
+
+    def _read_chunks(self, url, meta, chunk_size):
+        """
+        逐块读取缓存的内容（已解压）。
+        """
+        _, body_path = self._paths(url)
+        with (gzip.open(body_path, "rb") if meta.get("compressed") else open(body_path, "rb")) as file:
+            yield from iter(lambda: file.read(chunk_size), b"")
+
+    def _store(self, url, text, headers, meta=None):
+        """
+        保存响应内容及其校验信息。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path, body_path = self._paths(url)
+        now = time.time()
+        if text is not None:
+            body = text.encode("utf-8")
+            if self.compress:
+                body = gzip.compress(body, compresslevel=6)
+            self._write_atomic(body_path, body)
+            meta = {
+                "url": url,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "compressed": self.compress,
+                "size": len(body),
+                "stored_at": now,
+            }
+        meta["checked_at"] = now
+        self._write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+    def fetch(self, url, session=None, timeout=None, cancel=None):
+        """
+        获取 URL 的内容：已有缓存时发送条件请求，上游返回 304 则直接使用缓存。
+
+        参数：
+            url (str): 要请求的 URL。
+            session (requests.Session): 可选的复用会话。
+            timeout (float): 单次请求的超时时间（秒）。
+            cancel (CancelToken): 可选的取消标记，取消后中断读取且不写入缓存。
+
+        返回：
+            str: 响应内容。
+
+        异常：
+            requests.exceptions.RequestException: 请求失败时抛出，由调用方决定是否重试或回退到旧副本。
+        """
+        meta, text = self._load(url)
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with (session or requests).get(url, headers=headers, timeout=timeout, stream=True) as response, \
+                tracked(response, cancel):
+            if response.status_code == 304 and meta is not None:
+                logging.info(f"未修改，使用缓存: {url}")
+                self._store(url, None, response.headers, meta)
+                return text
+            response.raise_for_status()
+            text = response.text
+            if cancel is not None:
+                cancel.check()  # 连接被关闭时读到的内容可能不完整
+            self._store(url, text, response.headers)
+            return text
+
+    def stream(self, url, session=None, timeout=None, chunk_size=CHUNK_SIZE, cancel=None):
+        """
+        以字节块的形式流式获取 URL 的内容，行为与 fetch 相同，但不在内存中保留完整的响应。
+
+        新内容边读取边写入缓存的临时文件，完整读取后才替换旧副本；中途失败或调用方提前停止时
+        旧副本保持不变。
+
+        参数：
+            url (str): 要请求的 URL。
+            session (requests.Session): 可选的复用会话。
+            timeout (float): 单次请求的超时时间（秒）。
+            chunk_size (int): 每块的字节数。
+            cancel (CancelToken): 可选的取消标记，取消后中断读取，旧副本保持不变。
+
+        生成：
+            bytes: 响应内容的字节块。
+
+        异常：
+            requests.exceptions.RequestException: 请求失败时抛出，由调用方决定是否重试或回退到旧副本。
+        """
+        meta = self._load_meta(url)
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with (session or requests).get(url, headers=headers, timeout=timeout, stream=True) as response, \
+                tracked(response, cancel):
+            if response.status_code == 304 and meta is not None:
+                logging.info(f"未修改，使用缓存: {url}")
+                self._store(url, None, response.headers, meta)
+                yield from self._read_chunks(url, meta, chunk_size)
+                return
+            response.raise_for_status()
+
+            os.makedirs(self.directory, exist_ok=True)
+            meta_path, body_path = self._paths(url)
+            temp_path = f"{body_path}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+            try:
+                with (gzip.open(temp_path, "wb", compresslevel=6) if self.compress else open(temp_path, "wb")) as file:
+                    for chunk in response.iter_content(chunk_size):
+                        if cancel is not None:
+                            cancel.check()
+                        file.write(chunk)
+                        yield chunk
+                if cancel is not None:
+                    cancel.check()  # 连接被关闭时读到的内容可能不完整，不替换旧副本
+                os.replace(temp_path, body_path)
+            except BaseException:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
+
+            now = time.time()
+            meta = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "compressed": self.compress,
+                "size": os.path.getsize(body_path),
+                "stored_at": now,
+                "checked_at": now,
+            }
+            self._write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+    def stale_stream(self, url, chunk_size=CHUNK_SIZE):
+        """
+        以字节块的形式返回 URL 的旧副本，用于上游超时或不可用时回退。
+
+        参数：
+            url (str): 要请求的 URL。
+            chunk_size (int): 每块的字节数。
+
+        返回：
+            iterator: 旧副本的字节块，没有缓存时返回 None。
+        """
+        meta = self._load_meta(url)
+        if meta is None:
+            return None
+        age = (time.time() - meta.get("stored_at", 0)) / 3600
+        logging.warning(f"上游不可用，使用 {age:.1f} 小时前的缓存副本: {url}")
+        return self._read_chunks(url, meta, chunk_size)
+
+    def stale(self, url):
+        """
+        返回 URL 的旧副本，用于上游超时或不可用时回退。
+
+        参数：
+            url (str): 要请求的 URL。
+
+        返回：
+            str: 缓存的内容，没有缓存时返回 None。
+        """
+        meta, text = self._load(url)
+        if meta is not None:
+            age = (time.time() - meta.get("stored_at", 0)) / 3600
+            logging.warning(f"上游不可用，使用 {age:.1f} 小时前的缓存副本: {url}")
+        return text
+
+    def prune(self):
+        """
+        清理缓存：先删除超过 max_age 未被使用的条目，再从最久未使用的条目开始删除，
+        直到总大小不超过 max_bytes。
+
+        进程中断时遗留的 .tmp 文件超过 temp_grace 未修改即删除；仍可能在写入的临时文件
+        计入总大小，但不会被删除。
+        """
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        temp_size = 0
+        now = time.time()
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".tmp"):
+                temp_path = os.path.join(self.directory, filename)
+                try:
+                    stat = os.stat(temp_path)
+                    if now - stat.st_mtime > self.temp_grace:
+                        os.remove(temp_path)
+                    else:
+                        temp_size += stat.st_size
+                except OSError:
+                    pass
+                continue
+            if not filename.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.directory, filename)
+            body_path = meta_path[:-len(".json")] + ".body"
+            try:
+                with open(meta_path, "r", encoding="utf-8") as file:
+                    meta = json.load(file)
+                size = os.path.getsize(body_path)
+            except (OSError, ValueError):
+                meta, size = {}, 0
+            entries.append((meta.get("checked_at", 0), size, meta_path, body_path))
+
+        entries.sort()
+        total = temp_size + sum(size for _, size, _, _ in entries)
+        for checked_at, size, meta_path, body_path in entries:
+            if now - checked_at <= self.max_age and total <= self.max_bytes:
+                break
+            for path in (meta_path, body_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
@@ -0,0 +1,52 @@
+# IP 与 CIDR 的解析
+#
+# domain_router.py 与 generate_shadowrocket_conf.py 共用的 IP/CIDR 解析，把条目转换为整数区间。
+import re
+import socket
+import ipaddress
+
+# 常见 IPv4 / CIDR 写法的快速匹配，八位组不允许前导零，与 ipaddress 的校验保持一致
+IPV4_CIDR_PATTERN = re.compile(
+    r"(0|[1-9]\d{0,2})\.(0|[1-9]\d{0,2})\.(0|[1-9]\d{0,2})\.(0|[1-9]\d{0,2})(?:/(\d{1,2}))?", re.ASCII
+)
+
+def parse_cidr(item):
+    """
+    将 IP 或 CIDR 字符串解析为整数区间，整个流程中每个条目只解析一次。
+
+    常见的 IPv4 写法直接用正则拆分计算，IPv6 地址交给 socket.inet_pton，
+    其他写法交给 ipaddress 处理。主机位会被清零，与 ip_network(strict=False) 的行为一致。
+
+    参数：
+        item (str): IP 或 CIDR 字符串。
+
+    返回：
+        tuple: (版本, 起始地址, 结束地址)，无法解析时返回 None。
+    """
+    match = IPV4_CIDR_PATTERN.fullmatch(item)
+    if match:
+        a, b, c, d, prefix = match.groups()
+        prefixlen = int(prefix) if prefix else 32
+        a, b, c, d = int(a), int(b), int(c), int(d)
+        if a <= 255 and b <= 255 and c <= 255 and d <= 255 and prefixlen <= 32:
+            bits = 32 - prefixlen
+            start = ((a << 24) | (b << 16) | (c << 8) | d) >> bits << bits
+            return 4, start, start | ((1 << bits) - 1)
+        return None
+
+    address, _, prefix = item.partition("/")
+    if ":" in address and (not prefix or (prefix.isascii() and prefix.isdigit() and int(prefix) <= 128)):
+        try:
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big")
+        except (OSError, ValueError):
+            pass
+        else:
+            bits = 128 - (int(prefix) if prefix else 128)
+            start = value >> bits << bits
+            return 6, start, start | ((1 << bits) - 1)
+
+    try:
+        network = ipaddress.ip_network(item, strict=False)
+    except ValueError:
+        return None
+    return network.version, int(network.network_address), int(network.broadcast_address)
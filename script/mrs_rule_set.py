@@ -0,0 +1,282 @@
+# mihomo 二进制规则集（.mrs）的生成与校验
+#
+# .mrs 是 mihomo 的 rule-provider 可直接加载的二进制格式（format: mrs），客户端无需逐行解析 YAML：
+# zstd 压缩的数据流，依次为 'MRS' 与版本号 1、行为（0 为 domain，1 为 ipcidr）、
+# 大端 int64 的规则数、大端 int64 的附加数据长度（目前为 0），之后是规则集本身。
+#
+# domain：域名反转后按字节排序构建的 LOUDS 简洁字典树（见 succinct_set.py），
+#     依次写入版本号 1、leaves 位图、labelBitmap 位图（均为 int64 长度加大端 uint64 数组）
+#     以及 int64 长度加 labels 字节串。
+# ipcidr：合并后的地址区间（mihomo component/cidr.IpCidrSet），依次写入版本号 1、
+#     int64 区间数以及每个区间 16 字节的起始、结束地址，IPv4 使用 IPv4 映射地址，IPv4 区间排在前面。
+import io
+import struct
+import ipaddress
+from succinct_set import build_succinct_set, succinct_set_keys
+
+try:
+    import zstandard
+except ImportError:  # 只有生成或读取 .mrs 文件时才需要
+    zstandard = None
+
+MRS_MAGIC = b"MRS\x01"  # 文件头与格式版本
+BEHAVIOR_DOMAIN = 0  # domain 规则集
+BEHAVIOR_IPCIDR = 1  # ipcidr 规则集
+SET_VERSION = 1  # DomainSet、IpCidrSet 的序列化版本
+IPV4_MAPPED_PREFIX = 0xFFFF << 32  # IPv4 映射地址 ::ffff:0:0/96 的前缀
+
+def require_zstandard():
+    """
+    检查是否安装了 zstandard。
+
+    异常：
+        RuntimeError: 未安装 zstandard。
+    """
+    if zstandard is None:
+        raise RuntimeError("生成或读取 .mrs 文件需要安装 zstandard：pip install zstandard")
+
+def domain_set_keys(entries):
+    """
+    把 Clash domain 规则集中的条目转换为 mihomo 域名字典树中的键。
+
+    与 mihomo 的 DomainTrie 一致：'+.a.com' 同时插入 'a.com' 和表示全部子域名的 '+.a.com'，
+    '.a.com' 只插入 '+.a.com'，'*' 通配符和普通域名原样保留；含空标签的条目在 mihomo 中无效，予以跳过。
+
+    参数：
+        entries (iterable): 规则集 payload 中的条目。
+
+    返回：
+        set: 字典树中的键。
+    """
+    keys = set()
+    for entry in entries:
+        entry = entry.strip().lower()
+        if entry.startswith("+."):
+            domain = entry[2:]
+        elif entry.startswith("."):
+            domain = entry[1:]
+        else:
+            domain = entry
+        if not domain or "" in domain.split("."):
+            continue
+        if entry[0] == "+":
+            keys.add(domain)
+            keys.add(f"+.{domain}")
+        elif entry[0] == ".":
+            keys.add(f"+.{domain}")
+        else:
+            keys.add(domain)
+    return keys
+
+def build_domain_set(keys):
+    """
+    按 mihomo 的 NewDomainSet 构建字典树：键按字符反转后以字节排序。
+
+    参数：
+        keys (iterable): domain_set_keys 返回的键。
+
+    返回：
+        tuple: (leaves 位图, labelBitmap 位图, labels 字节串)。
+    """
+    return build_succinct_set(sorted({key[::-1].encode("utf-8") for key in keys}))
+
+def write_words(stream, words):
+    """
+    写入 int64 长度和大端 uint64 数组。
+    """
+    stream.write(struct.pack(f">q{len(words)}Q", len(words), *words))
+
+def read_words(stream):
+    """
+    读取 write_words 写入的数组。
+    """
+    length = read_length(stream)
+    return list(struct.unpack(f">{length}Q", read_exact(stream, 8 * length)))
+
+def read_exact(stream, size):
+    """
+    读取固定长度的字节，数据不足时抛出 ValueError。
+    """
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("mrs 数据不完整")
+    return data
+
+def read_length(stream):
+    """
+    读取大端 int64 长度，长度为负时抛出 ValueError。
+    """
+    (length,) = struct.unpack(">q", read_exact(stream, 8))
+    if length < 0:
+        raise ValueError("mrs 中的长度无效")
+    return length
+
+def ip_set_ranges(cidrs):
+    """
+    与 Go 的 netipx.IPSet 一致，把 IP/CIDR 合并为有序区间：同一地址族内重叠或相邻的网段合并，
+    IPv4 区间排在 IPv6 区间之前。
+
+    参数：
+        cidrs (iterable): IP/CIDR 条目。
+
+    返回：
+        list: (版本, 起始地址, 结束地址) 列表，地址为整数。
+    """
+    networks = []
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr.strip(), strict=False)
+        networks.append((network.version, int(network.network_address), int(network.broadcast_address)))
+    networks.sort()
+
+    ranges = []
+    for version, start, end in networks:
+        if ranges and version == ranges[-1][0] and start <= ranges[-1][2] + 1:
+            if end > ranges[-1][2]:
+                ranges[-1][2] = end
+        else:
+            ranges.append([version, start, end])
+    return [tuple(item) for item in ranges]
+
+def ip_ranges(cidrs):
+    """
+    mihomo IpCidrSet 中的区间：ip_set_ranges 的结果中 IPv4 地址转换为 IPv4 映射地址。
+
+    参数：
+        cidrs (iterable): IP/CIDR 条目。
+
+    返回：
+        list: (起始地址, 结束地址) 列表，地址为 128 位整数。
+    """
+    return [
+        (start | IPV4_MAPPED_PREFIX, end | IPV4_MAPPED_PREFIX) if version == 4 else (start, end)
+        for version, start, end in ip_set_ranges(cidrs)
+    ]
+
+def encode_domain_set(keys):
+    """
+    序列化 domain 规则集。
+    """
+    leaves, label_bitmap, labels = build_domain_set(keys)
+    stream = io.BytesIO()
+    stream.write(bytes([SET_VERSION]))
+    write_words(stream, leaves)
+    write_words(stream, label_bitmap)
+    stream.write(struct.pack(">q", len(labels)))
+    stream.write(labels)
+    return stream.getvalue()
+
+def encode_ip_ranges(ranges):
+    """
+    序列化 ipcidr 规则集。
+    """
+    stream = io.BytesIO()
+    stream.write(bytes([SET_VERSION]))
+    stream.write(struct.pack(">q", len(ranges)))
+    for start, end in ranges:
+        stream.write(start.to_bytes(16, "big"))
+        stream.write(end.to_bytes(16, "big"))
+    return stream.getvalue()
+
+def encode_mrs(entries, behavior):
+    """
+    由规则集 payload 生成 .mrs 文件内容。
+
+    参数：
+        entries (list): 规则集 payload 中的条目。
+        behavior (int): BEHAVIOR_DOMAIN 或 BEHAVIOR_IPCIDR。
+
+    返回：
+        bytes: .mrs 文件内容，没有有效条目时返回 None（mihomo 拒绝空规则集）。
+
+    异常：
+        RuntimeError: 未安装 zstandard。
+    """
+    require_zstandard()
+    if behavior == BEHAVIOR_DOMAIN:
+        keys = domain_set_keys(entries)
+        if not keys:
+            return None
+        body = encode_domain_set(keys)
+    else:
+        ranges = ip_ranges(entries)
+        if not ranges:
+            return None
+        body = encode_ip_ranges(ranges)
+    header = MRS_MAGIC + bytes([behavior]) + struct.pack(">qq", len(entries), 0)
+    return zstandard.ZstdCompressor().compress(header + body)
+
+def read_mrs(data):
+    """
+    解压并解析 .mrs 文件，与 mihomo 加载时的步骤相同，不构建查询索引。
+
+    参数：
+        data (bytes): .mrs 文件内容。
+
+    返回：
+        tuple: (行为, 规则数, 规则集)。domain 规则集为 (leaves, labelBitmap, labels)，
+        ipcidr 规则集为 (起始地址, 结束地址) 列表。
+
+    异常：
+        RuntimeError: 未安装 zstandard。
+        ValueError: 文件格式不正确。
+    """
+    require_zstandard()
+    with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+        stream = io.BytesIO(reader.read())
+    if read_exact(stream, 4) != MRS_MAGIC:
+        raise ValueError("不是 mrs 文件")
+    behavior = read_exact(stream, 1)[0]
+    (count,) = struct.unpack(">q", read_exact(stream, 8))
+    read_exact(stream, read_length(stream))  # 附加数据
+    if read_exact(stream, 1)[0] != SET_VERSION:
+        raise ValueError("规则集版本无效")
+
+    if behavior == BEHAVIOR_DOMAIN:
+        leaves = read_words(stream)
+        label_bitmap = read_words(stream)
+        labels = read_exact(stream, read_length(stream))
+        if not leaves or not label_bitmap or not labels:
+            raise ValueError("domain 规则集为空")
+        return behavior, count, (leaves, label_bitmap, labels)
+    if behavior == BEHAVIOR_IPCIDR:
+        ranges = []
+        for _ in range(read_length(stream)):
+            start = int.from_bytes(read_exact(stream, 16), "big")
+            end = int.from_bytes(read_exact(stream, 16), "big")
+            ranges.append((start, end))
+        return behavior, count, ranges
+    raise ValueError(f"不支持的行为: {behavior}")
+
+def decode_domain_set(domain_set):
+    """
+    从字典树还原全部键。
+
+    参数：
+        domain_set (tuple): read_mrs 返回的 (leaves, labelBitmap, labels)。
+
+    返回：
+        set: 字典树中的键。
+    """
+    return {key.decode("utf-8")[::-1] for key in succinct_set_keys(*domain_set)}
+
+def verify_mrs(data, entries, behavior):
+    """
+    往返校验：解析生成的 .mrs 文件，确认其中的规则集与由 payload 直接计算的结果一致。
+    读取使用本模块的解析函数，只能发现写出的数据不完整或与输入不符；与 mihomo 的兼容性由 tests/ 中的 golden 文件校验。
+
+    参数：
+        data (bytes): .mrs 文件内容。
+        entries (list): 规则集 payload 中的条目。
+        behavior (int): BEHAVIOR_DOMAIN 或 BEHAVIOR_IPCIDR。
+
+    异常：
+        ValueError: 文件无法解析或内容不一致。
+    """
+    file_behavior, count, rule_set = read_mrs(data)
+    if file_behavior != behavior or count != len(entries):
+        raise ValueError("mrs 的行为或规则数与 payload 不一致")
+    if behavior == BEHAVIOR_DOMAIN:
+        if decode_domain_set(rule_set) != domain_set_keys(entries):
+            raise ValueError("mrs 中的域名与 payload 不一致")
+    elif rule_set != ip_ranges(entries):
+        raise ValueError("mrs 中的地址区间与 payload 不一致")
@@ -0,0 +1,371 @@
+# sing-box 规则集（source JSON 与二进制 .srs）的生成与校验
+#
+# 每个分类生成一个 headless 规则集，规则之间为“或”。同一条规则中 domain、domain_suffix、domain_keyword、
+# domain_regex、ip_cidr 之间为“或”，与 port、process_name 等其他字段之间为“与”，因此端口和进程规则各自单独成一条。
+#
+# .srs 为 'SRS' 和版本号之后接 zlib 压缩的数据：uvarint 规则数，每条规则以类型 0 开头，
+# 之后依次为各字段（1 字节字段编号加字段内容），以 0xFF 和 1 字节的 invert 结束。
+# domain 与 domain_suffix 合并为一个 LOUDS 简洁字典树（见 succinct_set.py），ip_cidr 保存合并后的地址区间。
+import io
+import re
+import zlib
+import struct
+from mrs_rule_set import ip_set_ranges
+from succinct_set import build_succinct_set, succinct_set_keys
+
+SRS_MAGIC = b"SRS"  # 文件头
+SRS_VERSION = 2  # 规则集版本，sing-box 1.10 起支持，domain_suffix 的编码比版本 1 更紧凑
+MATCHER_VERSION = 1  # 域名字典树和地址区间的序列化版本
+RULE_TYPE_DEFAULT = 0  # 普通规则，另有逻辑规则 1
+RULE_ITEM_FINAL = 0xFF  # 规则字段结束
+PREFIX_LABEL = "\r"  # 以 '.' 开头的 domain_suffix，只匹配子域名
+ROOT_LABEL = "\n"  # 不以 '.' 开头的 domain_suffix，匹配域名本身及其子域名
+
+# .srs 中的字段编号，以及字段内容的编码方式
+RULE_ITEMS = {
+    "network": (1, "string"),
+    "domain": (2, "domain"),
+    "domain_keyword": (3, "string"),
+    "domain_regex": (4, "string"),
+    "ip_cidr": (6, "cidr"),
+    "source_port": (7, "uint16"),
+    "source_port_range": (8, "string"),
+    "port": (9, "uint16"),
+    "port_range": (10, "string"),
+    "process_name": (11, "string"),
+    "process_path": (12, "string"),
+}
+RULE_ITEM_FIELDS = {number: (field, kind) for field, (number, kind) in RULE_ITEMS.items()}
+
+# 可以转换的经典规则类型与对应字段，端口规则单独处理
+CLASSIC_FIELDS = {
+    "DOMAIN-KEYWORD": "domain_keyword",
+    "DOMAIN-REGEX": "domain_regex",
+    "PROCESS-NAME": "process_name",
+    "PROCESS-PATH": "process_path",
+    "NETWORK": "network",
+}
+PORT_FIELDS = {"DST-PORT": ("port", "port_range"), "SRC-PORT": ("source_port", "source_port_range")}
+
+# 字段之间为“或”的分组，每组生成一条规则
+RULE_GROUPS = (
+    ("domain", "domain_suffix", "domain_keyword", "domain_regex", "ip_cidr"),
+    ("port", "port_range"),
+    ("source_port", "source_port_range"),
+    ("process_name",),
+    ("process_path",),
+    ("network",),
+)
+
+def wildcard_regex(entry):
+    """
+    把 Clash 的 '*' 通配符域名转换为 domain_regex，'*' 只匹配一个标签。
+
+    参数：
+        entry (str): 含 '*' 的域名，如 '*.example.com'。
+
+    返回：
+        str: 正则表达式。
+    """
+    return "^" + r"\.".join("[^.]+" if label == "*" else re.escape(label) for label in entry.split(".")) + "$"
+
+def add_ports(fields, names, value):
+    """
+    解析 Clash 端口规则的值（'443'、'1000-2000' 或以 '/' 分隔的多个端口），写入端口字段。
+
+    返回：
+        bool: 值是否有效。
+    """
+    port_field, range_field = names
+    ports = []
+    ranges = []
+    for part in value.split("/"):
+        start, separator, end = part.partition("-")
+        if not start.isdigit() or (separator and not end.isdigit()):
+            return False
+        if separator:
+            if not int(start) <= int(end) <= 65535:
+                return False
+            ranges.append(f"{int(start)}:{int(end)}")
+        elif int(start) <= 65535:
+            ports.append(int(start))
+        else:
+            return False
+    fields.setdefault(port_field, []).extend(ports)
+    fields.setdefault(range_field, []).extend(ranges)
+    return True
+
+def category_rule_set(domain_entries, ipcidr_entries, classic_entries):
+    """
+    由一个分类的 domain、ipcidr 和 classic 规则文件 payload 生成 sing-box 规则集。
+
+    '+.' 后缀转换为 domain_suffix，'.' 后缀保留前导点（只匹配子域名），'*' 通配符转换为 domain_regex，
+    其余为 domain；经典规则中 DOMAIN-KEYWORD、DOMAIN-REGEX、DST-PORT、SRC-PORT、PROCESS-NAME、
+    PROCESS-PATH 和 NETWORK 可以转换，其他类型予以跳过。
+
+    参数：
+        domain_entries (iterable): domain 规则文件中的条目。
+        ipcidr_entries (iterable): ipcidr 规则文件中的条目。
+        classic_entries (iterable): classic 规则文件中的条目。
+
+    返回：
+        tuple: (规则集，没有可转换的条目时为 None, 跳过的经典规则数)。
+    """
+    fields = {}
+    for entry in domain_entries:
+        entry = entry.strip().lower()
+        if "*" in entry:
+            fields.setdefault("domain_regex", []).append(wildcard_regex(entry))
+        elif entry.startswith("+."):
+            if entry[2:]:
+                fields.setdefault("domain_suffix", []).append(entry[2:])
+        elif entry.startswith("."):
+            if entry[1:]:
+                fields.setdefault("domain_suffix", []).append(entry)
+        elif entry:
+            fields.setdefault("domain", []).append(entry)
+    fields["ip_cidr"] = [entry.strip() for entry in ipcidr_entries if entry.strip()]
+
+    skipped = 0
+    for entry in classic_entries:
+        parts = entry.split(",")
+        rule_type = parts[0].strip().upper()
+        value = parts[1].strip() if len(parts) > 1 else ""
+        if not value:
+            skipped += 1
+        elif rule_type in CLASSIC_FIELDS:
+            field = CLASSIC_FIELDS[rule_type]
+            fields.setdefault(field, []).append(value.lower() if field == "network" else value)
+        elif not (rule_type in PORT_FIELDS and add_ports(fields, PORT_FIELDS[rule_type], value)):
+            skipped += 1
+
+    rules = []
+    for group in RULE_GROUPS:
+        rule = {}
+        for field in group:
+            values = list(dict.fromkeys(fields.get(field, ())))
+            if values:
+                rule[field] = values
+        if rule:
+            rules.append(rule)
+    if not rules:
+        return None, skipped
+    return {"version": SRS_VERSION, "rules": rules}, skipped
+
+def reverse_domain(domain):
+    """
+    与 sing-box 的 reverseDomain 一致，按字符反转后编码为字节。
+    """
+    return domain[::-1].encode("utf-8")
+
+def domain_matcher_keys(domains, domain_suffixes):
+    """
+    与 sing-box 的 domain.NewMatcher 一致，生成 domain 与 domain_suffix 合并后字典树中的键。
+
+    参数：
+        domains (list): domain 字段。
+        domain_suffixes (list): domain_suffix 字段。
+
+    返回：
+        list: 按字节排序的键。
+    """
+    keys = set()
+    seen = set()
+    for suffix in domain_suffixes:
+        if suffix in seen:
+            continue
+        seen.add(suffix)
+        label = PREFIX_LABEL if suffix[0] == "." else ROOT_LABEL
+        keys.add(reverse_domain(label + suffix))
+    for domain in domains:
+        if domain not in seen:
+            seen.add(domain)
+            keys.add(reverse_domain(domain))
+    return sorted(keys)
+
+def write_uvarint(stream, value):
+    """
+    写入无符号 LEB128 变长整数。
+    """
+    while value >= 0x80:
+        stream.write(bytes([value & 0x7F | 0x80]))
+        value >>= 7
+    stream.write(bytes([value]))
+
+def read_uvarint(stream):
+    """
+    读取 write_uvarint 写入的整数。
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = read_exact(stream, 1)[0]
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value
+        shift += 7
+
+def read_exact(stream, size):
+    """
+    读取固定长度的字节，数据不足时抛出 ValueError。
+    """
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("srs 数据不完整")
+    return data
+
+def write_words(stream, words):
+    """
+    写入 uvarint 长度和大端 uint64 数组。
+    """
+    write_uvarint(stream, len(words))
+    stream.write(struct.pack(f">{len(words)}Q", *words))
+
+def read_words(stream):
+    """
+    读取 write_words 写入的数组。
+    """
+    length = read_uvarint(stream)
+    return list(struct.unpack(f">{length}Q", read_exact(stream, 8 * length)))
+
+def write_item(stream, kind, values):
+    """
+    按字段的编码方式写入字段内容。
+    """
+    if kind == "string":
+        write_uvarint(stream, len(values))
+        for value in values:
+            data = value.encode("utf-8")
+            write_uvarint(stream, len(data))
+            stream.write(data)
+    elif kind == "uint16":
+        write_uvarint(stream, len(values))
+        stream.write(struct.pack(f">{len(values)}H", *values))
+    elif kind == "domain":
+        leaves, label_bitmap, labels = build_succinct_set(domain_matcher_keys(*values))
+        stream.write(bytes([MATCHER_VERSION]))
+        write_words(stream, leaves)
+        write_words(stream, label_bitmap)
+        write_uvarint(stream, len(labels))
+        stream.write(labels)
+    else:
+        ranges = ip_set_ranges(values)
+        stream.write(bytes([MATCHER_VERSION]))
+        stream.write(struct.pack(">Q", len(ranges)))
+        for version, start, end in ranges:
+            size = 4 if version == 4 else 16
+            for address in (start, end):
+                write_uvarint(stream, size)
+                stream.write(address.to_bytes(size, "big"))
+
+def read_item(stream, kind):
+    """
+    write_item 的逆操作。domain 字段返回字典树的 (leaves, labelBitmap, labels)，ip_cidr 字段返回地址区间。
+    """
+    if kind == "string":
+        return [read_exact(stream, read_uvarint(stream)).decode("utf-8") for _ in range(read_uvarint(stream))]
+    if kind == "uint16":
+        length = read_uvarint(stream)
+        return list(struct.unpack(f">{length}H", read_exact(stream, 2 * length)))
+    if read_exact(stream, 1)[0] != MATCHER_VERSION:
+        raise ValueError("srs 字段版本无效")
+    if kind == "domain":
+        leaves = read_words(stream)
+        label_bitmap = read_words(stream)
+        labels = read_exact(stream, read_uvarint(stream))
+        return leaves, label_bitmap, labels
+    (length,) = struct.unpack(">Q", read_exact(stream, 8))
+    ranges = []
+    for _ in range(length):
+        start = read_exact(stream, read_uvarint(stream))
+        end = read_exact(stream, read_uvarint(stream))
+        ranges.append((4 if len(start) == 4 else 6, int.from_bytes(start, "big"), int.from_bytes(end, "big")))
+    return ranges
+
+def encode_srs(rule_set):
+    """
+    把 source JSON 规则集编译为 .srs，与 sing-box rule-set compile 的输出格式相同。
+
+    参数：
+        rule_set (dict): category_rule_set 返回的规则集。
+
+    返回：
+        bytes: .srs 文件内容。
+    """
+    stream = io.BytesIO()
+    write_uvarint(stream, len(rule_set["rules"]))
+    for rule in rule_set["rules"]:
+        stream.write(bytes([RULE_TYPE_DEFAULT]))
+        if rule.get("domain") or rule.get("domain_suffix"):
+            stream.write(bytes([RULE_ITEMS["domain"][0]]))
+            write_item(stream, "domain", (rule.get("domain", []), rule.get("domain_suffix", [])))
+        for field, (number, kind) in RULE_ITEMS.items():
+            if field != "domain" and rule.get(field):
+                stream.write(bytes([number]))
+                write_item(stream, kind, rule[field])
+        stream.write(bytes([RULE_ITEM_FINAL, 0]))  # 字段结束，invert 为 false
+    return SRS_MAGIC + bytes([rule_set["version"]]) + zlib.compress(stream.getvalue(), 9)
+
+def read_srs(data):
+    """
+    解压并解析 .srs 文件，与 sing-box 加载时的步骤相同，不构建查询索引。
+
+    参数：
+        data (bytes): .srs 文件内容。
+
+    返回：
+        tuple: (版本, 规则列表)，每条规则为字段到内容的映射，见 read_item。
+
+    异常：
+        ValueError: 文件格式不正确。
+    """
+    if data[:3] != SRS_MAGIC:
+        raise ValueError("不是 srs 文件")
+    try:
+        stream = io.BytesIO(zlib.decompress(data[4:]))
+    except zlib.error as e:
+        raise ValueError(f"srs 数据无法解压: {e}")
+    rules = []
+    for _ in range(read_uvarint(stream)):
+        if read_exact(stream, 1)[0] != RULE_TYPE_DEFAULT:
+            raise ValueError("不支持的规则类型")
+        rule = {}
+        while True:
+            number = read_exact(stream, 1)[0]
+            if number == RULE_ITEM_FINAL:
+                read_exact(stream, 1)  # invert
+                break
+            if number not in RULE_ITEM_FIELDS:
+                raise ValueError(f"不支持的字段: {number}")
+            field, kind = RULE_ITEM_FIELDS[number]
+            rule[field] = read_item(stream, kind)
+        rules.append(rule)
+    return data[3], rules
+
+def verify_srs(data, rule_set):
+    """
+    往返校验：解析生成的 .srs 文件，确认每条规则的字段与 source JSON 一致。
+    读取使用本模块的解析函数，只能发现写出的数据不完整或与输入不符；与 sing-box 的兼容性由 tests/ 中的 golden 文件校验。
+
+    参数：
+        data (bytes): .srs 文件内容。
+        rule_set (dict): 生成 .srs 的规则集。
+
+    异常：
+        ValueError: 文件无法解析或内容不一致。
+    """
+    version, rules = read_srs(data)
+    if version != rule_set["version"] or len(rules) != len(rule_set["rules"]):
+        raise ValueError("srs 的版本或规则数与 source JSON 不一致")
+    for rule, expected in zip(rules, rule_set["rules"]):
+        if "domain" in rule:
+            rule["domain"] = sorted(succinct_set_keys(*rule["domain"]))
+        for field, (_, kind) in RULE_ITEMS.items():
+            if kind == "domain":
+                value = domain_matcher_keys(expected.get("domain", []), expected.get("domain_suffix", []))
+            elif kind == "cidr":
+                value = ip_set_ranges(expected.get(field, []))
+            else:
+                value = expected.get(field, [])
+            if rule.get(field, []) != value:
+                raise ValueError(f"srs 的 {field} 字段与 source JSON 不一致")
@@ -0,0 +1,90 @@
+# LOUDS 简洁字典树
+#
+# sing-box 的 .srs（sing/common/domain.succinctSet）和 mihomo 的 .mrs（component/trie.DomainSet）
+# 使用同一种结构保存域名集合：键按字节排序后按层遍历字典树，每个节点的子节点标签依次写入 labels，
+# 并在 labelBitmap 中记为 0，节点结束记为 1；以某个键结尾的节点在 leaves 中记为 1。
+# 两个位图都以 uint64 数组保存，第 i 位位于第 i // 64 个字的第 i % 64 位。
+
+def pack_bits(bits):
+    """
+    把 0/1 序列打包为 uint64 位图。与 Go 实现中的 setBit 一致，只保留到最高的置位所在的字。
+
+    参数：
+        bits (bytearray): 每个字节为 0 或 1。
+
+    返回：
+        list: uint64 列表。
+    """
+    text = bytes(bits).translate(bytes.maketrans(b"\x00\x01", b"01")).decode("ascii").rstrip("0")
+    return [int(text[i:i + 64][::-1], 2) for i in range(0, len(text), 64)]
+
+def unpack_bits(words):
+    """
+    pack_bits 的逆操作。
+
+    参数：
+        words (list): uint64 列表。
+
+    返回：
+        str: 由 '0'、'1' 组成的位串，长度为 64 的倍数。
+    """
+    return "".join(format(word, "064b")[::-1] for word in words)
+
+def build_succinct_set(keys):
+    """
+    由已排序、无重复的键构建字典树。
+
+    参数：
+        keys (list): 按字节排序的 bytes 键，不能为空。
+
+    返回：
+        tuple: (leaves 位图, labelBitmap 位图, labels 字节串)，位图为 uint64 列表。
+    """
+    leaves = bytearray()
+    label_bitmap = bytearray()
+    labels = bytearray()
+    queue = [(0, len(keys), 0)]
+    for start, end, column in queue:
+        if column == len(keys[start]):
+            start += 1
+            leaves.append(1)
+        else:
+            leaves.append(0)
+        index = start
+        while index < end:
+            label = keys[index][column]
+            first = index
+            while index < end and keys[index][column] == label:
+                index += 1
+            queue.append((first, index, column + 1))
+            labels.append(label)
+            label_bitmap.append(0)
+        label_bitmap.append(1)
+    return pack_bits(leaves), pack_bits(label_bitmap), bytes(labels)
+
+def succinct_set_keys(leaves, label_bitmap, labels):
+    """
+    从字典树还原全部键：labelBitmap 中第 k 个 0 对应的标签生成第 k + 1 个节点，
+    每个 1 表示当前节点的子节点结束。
+
+    参数：
+        leaves (list): leaves 位图。
+        label_bitmap (list): labelBitmap 位图。
+        labels (bytes): 标签。
+
+    返回：
+        list: 按层遍历顺序排列的 bytes 键。
+    """
+    leaf_bits = unpack_bits(leaves)
+    prefixes = [b""]
+    node = 0
+    label_index = 0
+    for bit in unpack_bits(label_bitmap):
+        if bit == "1":
+            node += 1
+            if node == len(prefixes):
+                break
+        else:
+            prefixes.append(prefixes[node] + labels[label_index:label_index + 1])
+            label_index += 1
+    return [prefix for node, prefix in enumerate(prefixes) if node < len(leaf_bits) and leaf_bits[node] == "1"]
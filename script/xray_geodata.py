@@ -0,0 +1,294 @@
+# Xray 资源文件（geosite.dat 与 geoip.dat）的生成与校验
+#
+# 两个文件都是 protobuf 编码的列表（Xray app/router/config.proto），每个分类为一项，分类代码为 my.wei 中的分组名：
+# GeoSiteList { repeated GeoSite entry = 1 }，GeoSite { string country_code = 1; repeated Domain domain = 2 }，
+# Domain { Type type = 1; string value = 2 }；
+# GeoIPList { repeated GeoIP entry = 1 }，GeoIP { string country_code = 1; repeated CIDR cidr = 2 }，
+# CIDR { bytes ip = 1; uint32 prefix = 2 }。
+# 文件名与 Xray 自带的 geosite.dat、geoip.dat 区分开，两者可以放在同一资源目录中，配置中以
+# 'ext:geosite-domainrouter.dat:AI' 的形式引用；Xray 查找前会把代码转换为大写，因此与官方数据一致，分类代码以大写写入。
+import io
+import re
+import ipaddress
+from sing_box_rule_set import read_uvarint, wildcard_regex, write_uvarint
+
+GEOSITE_FILE = "geosite-domainrouter.dat"  # 域名规则文件名
+GEOIP_FILE = "geoip-domainrouter.dat"  # 网段规则文件名
+
+# Domain.Type
+DOMAIN_PLAIN = 0  # 关键字，对应 'keyword:'
+DOMAIN_REGEX = 1  # 正则表达式，对应 'regexp:'
+DOMAIN_ROOT = 2  # 域名及其子域名，对应 'domain:'
+DOMAIN_FULL = 3  # 完整匹配，对应 'full:'
+
+WIRE_VARINT = 0  # protobuf 的 varint 字段
+WIRE_BYTES = 2  # protobuf 的长度前缀字段
+
+# 可以转换的经典规则类型与对应的 Domain.Type
+CLASSIC_DOMAIN_TYPES = {
+    "DOMAIN": DOMAIN_FULL,
+    "DOMAIN-SUFFIX": DOMAIN_ROOT,
+    "DOMAIN-KEYWORD": DOMAIN_PLAIN,
+    "DOMAIN-REGEX": DOMAIN_REGEX,
+}
+CLASSIC_IP_TYPES = frozenset(["IP-CIDR", "IP-CIDR6"])
+
+def category_code(key):
+    """
+    返回分类在资源文件中的代码。
+    """
+    return key.upper()
+
+def site_domains(domain_entries, classic_entries=()):
+    """
+    把一个分类的 domain 和 classic 规则文件 payload 转换为 geosite 中的域名规则。
+
+    '+.' 后缀转换为 domain:，普通域名转换为 full:，'*' 通配符和只匹配子域名的 '.' 后缀转换为 regexp:；
+    经典规则中 DOMAIN、DOMAIN-SUFFIX、DOMAIN-KEYWORD、DOMAIN-REGEX 和 DOMAIN-WILDCARD 可以转换，
+    IP-CIDR 由 site_cidrs 处理，其他类型予以跳过。
+
+    参数：
+        domain_entries (iterable): domain 规则文件中的条目。
+        classic_entries (iterable): classic 规则文件中的条目。
+
+    返回：
+        tuple: ((类型, 值) 列表, 跳过的经典规则数)。
+    """
+    domains = []
+    for entry in domain_entries:
+        entry = entry.strip().lower()
+        if "*" in entry:
+            domains.append((DOMAIN_REGEX, wildcard_regex(entry)))
+        elif entry.startswith("+."):
+            if entry[2:]:
+                domains.append((DOMAIN_ROOT, entry[2:]))
+        elif entry.startswith("."):
+            if entry[1:]:
+                domains.append((DOMAIN_REGEX, r"^.+\." + re.escape(entry[1:]) + "$"))
+        elif entry:
+            domains.append((DOMAIN_FULL, entry))
+
+    skipped = 0
+    for entry in classic_entries:
+        parts = entry.split(",")
+        rule_type = parts[0].strip().upper()
+        value = parts[1].strip() if len(parts) > 1 else ""
+        if not value:
+            skipped += 1
+        elif rule_type in CLASSIC_DOMAIN_TYPES:
+            domain_type = CLASSIC_DOMAIN_TYPES[rule_type]
+            domains.append((domain_type, value if domain_type == DOMAIN_REGEX else value.lower()))
+        elif rule_type == "DOMAIN-WILDCARD":
+            domains.append((DOMAIN_REGEX, wildcard_regex(value.lower())))
+        elif rule_type not in CLASSIC_IP_TYPES:
+            skipped += 1
+    return list(dict.fromkeys(domains)), skipped
+
+def site_cidrs(ipcidr_entries, classic_entries=()):
+    """
+    把一个分类的 ipcidr 规则文件 payload 和经典规则中的 IP-CIDR、IP-CIDR6 转换为 geoip 中的网段。
+
+    参数：
+        ipcidr_entries (iterable): ipcidr 规则文件中的条目。
+        classic_entries (iterable): classic 规则文件中的条目。
+
+    返回：
+        list: (网络地址字节串, 前缀长度) 列表，无效条目予以跳过。
+    """
+    values = [entry.strip() for entry in ipcidr_entries]
+    for entry in classic_entries:
+        parts = entry.split(",")
+        if parts[0].strip().upper() in CLASSIC_IP_TYPES and len(parts) > 1:
+            values.append(parts[1].strip())
+
+    cidrs = []
+    for value in values:
+        try:
+            network = ipaddress.ip_network(value, strict=False)
+        except ValueError:
+            continue
+        cidrs.append((network.network_address.packed, network.prefixlen))
+    return list(dict.fromkeys(cidrs))
+
+def read_exact(stream, size):
+    """
+    读取固定长度的字节，数据不足时抛出 ValueError。
+    """
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("dat 数据不完整")
+    return data
+
+def write_field(stream, number, wire_type, value):
+    """
+    写入一个 protobuf 字段：varint 字段写整数，长度前缀字段写字节串。
+    """
+    write_uvarint(stream, number << 3 | wire_type)
+    if wire_type == WIRE_VARINT:
+        write_uvarint(stream, value)
+    else:
+        write_uvarint(stream, len(value))
+        stream.write(value)
+
+def read_fields(data):
+    """
+    依次读取消息中的 protobuf 字段。
+
+    参数：
+        data (bytes): 消息内容。
+
+    返回：
+        list: (字段编号, 值) 列表，varint 字段的值为整数，长度前缀字段的值为字节串。
+
+    异常：
+        ValueError: 数据不完整或含有不支持的字段类型。
+    """
+    stream = io.BytesIO(data)
+    fields = []
+    while stream.tell() < len(data):
+        key = read_uvarint(stream)
+        if key & 7 == WIRE_VARINT:
+            fields.append((key >> 3, read_uvarint(stream)))
+        elif key & 7 == WIRE_BYTES:
+            fields.append((key >> 3, read_exact(stream, read_uvarint(stream))))
+        else:
+            raise ValueError(f"不支持的 protobuf 字段类型: {key & 7}")
+    return fields
+
+def encode_list(entries, encode_item):
+    """
+    生成 GeoSiteList 或 GeoIPList：每个分类写为一项，其中的规则由 encode_item 编码为子消息。
+
+    参数：
+        entries (dict): 分类代码到规则列表的映射。
+        encode_item (callable): 把一条规则编码为消息内容的函数。
+
+    返回：
+        bytes: 文件内容。
+    """
+    stream = io.BytesIO()
+    for code, items in entries.items():
+        entry = io.BytesIO()
+        write_field(entry, 1, WIRE_BYTES, code.encode("utf-8"))
+        for item in items:
+            write_field(entry, 2, WIRE_BYTES, encode_item(item))
+        write_field(stream, 1, WIRE_BYTES, entry.getvalue())
+    return stream.getvalue()
+
+def encode_domain(domain):
+    """
+    编码 Domain 消息，与 protobuf 一致，省略值为 0 的类型字段。
+    """
+    domain_type, value = domain
+    stream = io.BytesIO()
+    if domain_type:
+        write_field(stream, 1, WIRE_VARINT, domain_type)
+    write_field(stream, 2, WIRE_BYTES, value.encode("utf-8"))
+    return stream.getvalue()
+
+def encode_cidr(cidr):
+    """
+    编码 CIDR 消息，省略值为 0 的前缀长度。
+    """
+    address, prefix = cidr
+    stream = io.BytesIO()
+    write_field(stream, 1, WIRE_BYTES, address)
+    if prefix:
+        write_field(stream, 2, WIRE_VARINT, prefix)
+    return stream.getvalue()
+
+def encode_geosite(sites):
+    """
+    生成 geosite.dat。
+
+    参数：
+        sites (dict): 分类代码到 site_domains 返回的域名规则的映射。
+
+    返回：
+        bytes: 文件内容。
+    """
+    return encode_list(sites, encode_domain)
+
+def encode_geoip(sites):
+    """
+    生成 geoip.dat。
+
+    参数：
+        sites (dict): 分类代码到 site_cidrs 返回的网段的映射。
+
+    返回：
+        bytes: 文件内容。
+    """
+    return encode_list(sites, encode_cidr)
+
+def read_list(data, decode_item):
+    """
+    encode_list 的逆操作。
+
+    返回：
+        dict: 分类代码到规则列表的映射。
+
+    异常：
+        ValueError: 文件格式不正确。
+    """
+    entries = {}
+    for number, entry in read_fields(data):
+        if number != 1 or isinstance(entry, int):
+            raise ValueError("列表中含有无效的字段")
+        code = None
+        items = []
+        for field, value in read_fields(entry):
+            if field == 1 and isinstance(value, bytes):
+                code = value.decode("utf-8")
+            elif field == 2 and isinstance(value, bytes):
+                items.append(decode_item(value))
+        if code is None:
+            raise ValueError("列表项缺少分类代码")
+        entries[code] = items
+    return entries
+
+def decode_domain(data):
+    """
+    解析 Domain 消息，忽略属性字段。
+    """
+    fields = dict(read_fields(data))
+    return fields.get(1, DOMAIN_PLAIN), fields.get(2, b"").decode("utf-8")
+
+def decode_cidr(data):
+    """
+    解析 CIDR 消息。
+    """
+    fields = dict(read_fields(data))
+    return fields.get(1, b""), fields.get(2, 0)
+
+def read_geosite(data):
+    """
+    解析 geosite.dat，返回分类代码到 (类型, 值) 列表的映射。
+    """
+    return read_list(data, decode_domain)
+
+def read_geoip(data):
+    """
+    解析 geoip.dat，返回分类代码到 (网络地址字节串, 前缀长度) 列表的映射。
+    """
+    return read_list(data, decode_cidr)
+
+def verify_geodata(data, sites, read):
+    """
+    往返校验：解析生成的文件，确认其中的分类和规则与生成时的输入一致。
+    读取使用本模块的解析函数，只能发现写出的数据不完整或与输入不符；与 Xray 的兼容性由 tests/ 中的 golden 文件校验。
+
+    参数：
+        data (bytes): 文件内容。
+        sites (dict): 生成文件时的输入。
+        read (callable): read_geosite 或 read_geoip。
+
+    异常：
+        ValueError: 文件无法解析或内容不一致。
+    """
+    entries = read(data)
+    if list(entries) != list(sites):
+        raise ValueError("文件中的分类与输入不一致")
+    for code, items in sites.items():
+        if entries[code] != list(items):
+            raise ValueError(f"分类 {code} 的规则与输入不一致")
@@ -0,0 +1,158 @@
+# Xray 路由规则的生成
+#
+# 按 my.wei 中 [Rules] 段落的顺序生成 Xray routing.rules，Xray 与 Clash 一样按顺序取第一条匹配的规则。
+# 同一条 Xray 规则中不同字段之间为“与”，因此分类的域名和网段各自生成一条规则，域名规则在前。
+# 规则较多的分类引用 xray_geodata.py 生成的资源文件，较少的直接内联，减少 Xray 启动时加载的资源文件条目。
+# 生成的文件只含 routing，可以与节点配置一起放入 Xray 的 -confdir，由 Xray 合并。
+import ipaddress
+from xray_geodata import (
+    DOMAIN_FULL, DOMAIN_PLAIN, DOMAIN_REGEX, DOMAIN_ROOT, GEOIP_FILE, GEOSITE_FILE, category_code,
+)
+
+INLINE_LIMIT = 64  # 分类的域名或网段不超过该数量时直接内联，否则引用资源文件
+DOMAIN_STRATEGY = "IPIfNonMatch"  # 域名没有匹配时才解析 IP 再匹配网段规则，与 Clash 的网段规则一致
+
+# Domain.Type 对应的匹配前缀
+DOMAIN_PREFIXES = {
+    DOMAIN_PLAIN: "keyword:",
+    DOMAIN_REGEX: "regexp:",
+    DOMAIN_ROOT: "domain:",
+    DOMAIN_FULL: "full:",
+}
+
+# [Rules] 中可以转换的单条规则类型，以及对应的字段和匹配前缀；port 字段在 Xray 中为逗号分隔的字符串，不是数组
+RULE_MATCHERS = {
+    "DOMAIN": ("domain", "full:"),
+    "DOMAIN-SUFFIX": ("domain", "domain:"),
+    "DOMAIN-KEYWORD": ("domain", "keyword:"),
+    "DOMAIN-REGEX": ("domain", "regexp:"),
+    "GEOSITE": ("domain", "geosite:"),
+    "GEOIP": ("ip", "geoip:"),
+    "IP-CIDR": ("ip", ""),
+    "IP-CIDR6": ("ip", ""),
+    "DST-PORT": ("port", ""),
+}
+
+# 内置策略默认对应的出站标签，其余策略名直接作为出站标签
+DEFAULT_OUTBOUNDS = {"DIRECT": "direct", "REJECT": "blocked"}
+
+def outbound_tag(policy, outbounds=None):
+    """
+    返回策略对应的出站标签，outbounds 中的映射优先。
+    """
+    outbounds = outbounds or {}
+    if policy in outbounds:
+        return outbounds[policy]
+    return DEFAULT_OUTBOUNDS.get(policy.upper(), policy)
+
+def category_matchers(code, items, inline, external):
+    """
+    返回分类某一字段的匹配条件：条目不超过 INLINE_LIMIT 时内联，否则引用资源文件中的分类。
+
+    参数：
+        code (str): 分类代码。
+        items (list): 分类的域名规则或网段，没有时为空。
+        inline (callable): 把一条规则转换为内联匹配条件的函数。
+        external (str): 资源文件名。
+
+    返回：
+        list: 匹配条件，没有规则时为空列表。
+    """
+    if len(items) > INLINE_LIMIT:
+        return [f"ext:{external}:{code}"]
+    return [inline(item) for item in items]
+
+def inline_domain(domain):
+    """
+    把 (类型, 值) 形式的域名规则转换为 Xray 的域名匹配条件。
+    """
+    domain_type, value = domain
+    return DOMAIN_PREFIXES[domain_type] + value
+
+def inline_cidr(cidr):
+    """
+    把 (网络地址字节串, 前缀长度) 形式的网段转换为 CIDR 文本。
+    """
+    address, prefix = cidr
+    return f"{ipaddress.ip_address(address)}/{prefix}"
+
+def single_rule_matcher(key):
+    """
+    转换 [Rules] 中 'GEOIP,CN' 这样的单条规则。
+
+    返回：
+        tuple: (字段, 匹配条件)，无法转换时返回 None。
+    """
+    rule_type, _, value = key.partition(",")
+    rule_type = rule_type.strip().upper()
+    value = value.strip()
+    if rule_type not in RULE_MATCHERS or not value:
+        return None
+    field, prefix = RULE_MATCHERS[rule_type]
+    if prefix in ("geosite:", "geoip:"):
+        value = value.lower()
+    if field == "port":
+        value = value.replace("/", ",")  # Clash 以 '/' 分隔多个端口
+    return field, prefix + value
+
+def append_rule(rules, field, matchers, tag):
+    """
+    追加一条规则。与上一条规则的出站标签和字段都相同时直接合并，两者之间没有其他规则，匹配顺序不变。
+    port 字段写为逗号分隔的字符串，其余字段为数组。
+    """
+    previous = rules[-1] if rules else None
+    if previous and previous["outboundTag"] == tag and field in previous and len(previous) == 3:
+        if field == "port":
+            ports = previous[field].split(",")
+            previous[field] = ",".join(ports + [port for port in ",".join(matchers).split(",") if port not in ports])
+        else:
+            previous[field].extend(matcher for matcher in matchers if matcher not in previous[field])
+    elif field == "port":
+        rules.append({"type": "field", field: ",".join(matchers), "outboundTag": tag})
+    else:
+        rules.append({"type": "field", field: list(matchers), "outboundTag": tag})
+
+def build_routing(rules, matches, geosite, geoip, outbounds=None):
+    """
+    由 [Rules] 段落生成 Xray 的 routing 配置。
+
+    分类生成域名和网段两条规则，没有内容的分类予以跳过；'GEOIP,CN' 等单条规则转换为对应的匹配条件，
+    无法转换的规则（如规则集 URL）予以跳过；MATCH 转换为匹配全部 TCP 和 UDP 连接的最后一条规则。
+    Xray 中没有 no-resolve，网段规则是否解析域名由 domainStrategy 统一决定。
+
+    参数：
+        rules (list): generate_rulesets.parse_rules 返回的 (键, 策略, 是否含逗号) 列表。
+        matches (list): generate_rulesets.parse_rules 返回的 MATCH 规则。
+        geosite (dict): 分类代码到域名规则的映射，与 geosite 资源文件的内容一致。
+        geoip (dict): 分类代码到网段的映射，与 geoip 资源文件的内容一致。
+        outbounds (dict): 可选的策略名到出站标签的映射。
+
+    返回：
+        tuple: (routing 配置, 跳过的规则列表)。
+    """
+    routing_rules = []
+    skipped = []
+    for key, value, has_comma in rules:
+        if has_comma:
+            tag = outbound_tag(value.split(",", 1)[0].strip(), outbounds)
+            matcher = single_rule_matcher(key)
+            if matcher is None:
+                skipped.append(key)
+            else:
+                append_rule(routing_rules, matcher[0], [matcher[1]], tag)
+            continue
+
+        tag = outbound_tag(value, outbounds)
+        code = category_code(key)
+        domains = category_matchers(code, geosite.get(code, []), inline_domain, GEOSITE_FILE)
+        cidrs = category_matchers(code, geoip.get(code, []), inline_cidr, GEOIP_FILE)
+        if not domains and not cidrs:
+            skipped.append(key)
+        if domains:
+            append_rule(routing_rules, "domain", domains, tag)
+        if cidrs:
+            append_rule(routing_rules, "ip", cidrs, tag)
+
+    for _, match_value in matches[:1]:
+        routing_rules.append({"type": "field", "network": "tcp,udp", "outboundTag": outbound_tag(match_value, outbounds)})
+    return {"routing": {"domainStrategy": DOMAIN_STRATEGY, "rules": routing_rules}}, skipped
@@ -0,0 +1,157 @@
+# Clash 规则集 YAML 的流式 payload 读取
+#
+# 规则集文件只有一个 payload: 列表，列表项都是单行的字符串。逐行解析即可得到与
+# yaml.safe_load(...)["payload"] 相同的结果，无需构建完整的 YAML 文档树。
+# 遇到多行字符串、流式列表、锚点等不常见的写法时抛出 PayloadFormatError，
+# 由调用方回退到完整的 YAML 解析。
+import re
+import codecs
+
+# 双引号字符串中支持的转义
+DOUBLE_QUOTED_ESCAPES = {
+    "0": "\0", "a": "\a", "b": "\b", "t": "\t", "\t": "\t", "n": "\n", "v": "\v", "f": "\f",
+    "r": "\r", "e": "\x1b", " ": " ", '"': '"', "/": "/", "\\": "\\",
+}
+DOUBLE_QUOTED_ESCAPE_PATTERN = re.compile(r"\\(x[0-9A-Fa-f]{2}|u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)")
+
+# 可以安全按字符串读取的普通标量：带 '.' 的域名写法，最后一个标签含字母，
+# 因此不会被 YAML 解析为数字、布尔值、空值或时间戳；其余普通标量交给完整的 YAML 解析
+PLAIN_STRING_PATTERN = re.compile(r"(?:\+\.)?[A-Za-z0-9_-]+(?:\.[A-Za-z0-9_-]+)*\.[A-Za-z0-9_-]*[A-Za-z][A-Za-z0-9_-]*")
+
+class PayloadFormatError(ValueError):
+    """
+    文件使用了流式读取不支持的 YAML 写法。
+    """
+
+def iter_raw_lines(chunks):
+    """
+    将字节块流式解码为行，保留行首缩进，只去除行尾空白。
+
+    参数：
+        chunks (iterable): 字节块。
+
+    生成：
+        str: 每一行。
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip()
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip()
+
+def strip_comment(text, line):
+    """
+    去掉标量之后的空白和注释，其余内容视为不支持的写法。
+    """
+    text = text.strip()
+    if text and not text.startswith("#"):
+        raise PayloadFormatError(f"标量之后存在多余内容: {line}")
+
+def parse_scalar(text, line):
+    """
+    解析列表项中的单行标量。
+
+    参数：
+        text (str): '- ' 之后的内容。
+        line (str): 原始行，用于错误信息。
+
+    返回：
+        str: 标量的值。
+    """
+    if text.startswith("'"):
+        # 单引号字符串中只有 '' 一种转义
+        index = 1
+        while True:
+            end = text.find("'", index)
+            if end == -1:
+                raise PayloadFormatError(f"单引号字符串未在行内结束: {line}")
+            if text[end + 1:end + 2] == "'":
+                index = end + 2
+                continue
+            strip_comment(text[end + 1:], line)
+            return text[1:end].replace("''", "'")
+
+    if text.startswith('"'):
+        index = 1
+        while True:
+            end = text.find('"', index)
+            if end == -1:
+                raise PayloadFormatError(f"双引号字符串未在行内结束: {line}")
+            backslashes = len(text[index:end]) - len(text[index:end].rstrip("\\"))
+            if backslashes % 2:
+                index = end + 1
+                continue
+            strip_comment(text[end + 1:], line)
+            return DOUBLE_QUOTED_ESCAPE_PATTERN.sub(lambda match: unescape(match, line), text[1:end])
+
+    value, _, _ = text.partition(" #")
+    value = value.strip()
+    if not PLAIN_STRING_PATTERN.fullmatch(value):
+        raise PayloadFormatError(f"不支持的列表项: {line}")
+    return value
+
+def unescape(match, line):
+    """
+    还原双引号字符串中的一个转义序列。
+    """
+    escape = match.group(1)
+    if escape[0] in "xuU" and len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    if escape in DOUBLE_QUOTED_ESCAPES:
+        return DOUBLE_QUOTED_ESCAPES[escape]
+    raise PayloadFormatError(f"不支持的转义序列 \\{escape}: {line}")
+
+def iter_payload(lines):
+    """
+    逐行读取顶层 payload: 列表中的字符串。
+
+    参数：
+        lines (iterable): 保留缩进的行，可来自 iter_raw_lines 或 str.splitlines()。
+
+    生成：
+        str: payload 中的每一项。
+
+    异常：
+        PayloadFormatError: 文件使用了不支持的写法，调用方应回退到 yaml.safe_load。
+    """
+    in_payload = False
+    in_mapping = False
+    seen_payload = False
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if stripped in ("---", "..."):
+            continue
+        if not line[0].isspace() and not stripped.startswith("-"):
+            # 顶层键
+            key, separator, rest = stripped.partition(":")
+            if not separator:
+                raise PayloadFormatError(f"不是顶层映射: {line}")
+            key = key.strip()
+            if key[:1] in ("'", '"', "?"):
+                # 带引号的键可能就是 payload，逐行读取无法可靠还原
+                raise PayloadFormatError(f"不支持的键写法: {line}")
+            rest = rest.strip()
+            in_mapping = True
+            in_payload = key == "payload"
+            if in_payload:
+                if seen_payload:
+                    # YAML 中重复的键只保留最后一个，已经生成的条目无法撤回
+                    raise PayloadFormatError(f"重复的 payload 键: {line}")
+                seen_payload = True
+                if rest and not rest.startswith("#"):
+                    raise PayloadFormatError(f"payload 不是块列表: {line}")
+            continue
+        if not in_mapping:
+            raise PayloadFormatError(f"不是顶层映射: {line}")
+        if not in_payload:
+            continue
+        if not stripped.startswith("- ") and stripped != "-":
+            raise PayloadFormatError(f"payload 中存在非列表项: {line}")
+        yield parse_scalar(stripped[2:].strip(), line)
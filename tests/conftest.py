@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(TESTS_DIR, "fixtures")
+
+# 脚本在 script/ 中直接运行，模块之间按顶层模块导入
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "script"))
+
+from yaml_payload import iter_payload  # noqa: E402
+
+@pytest.fixture
+def payload():
+    """
+    读取 fixtures/rule_sets 中规则文件的 payload。
+    """
+    def read(name):
+        with open(os.path.join(FIXTURES_DIR, "rule_sets", name), encoding="utf-8") as file:
+            return list(iter_payload(line.rstrip("\n") for line in file))
+    return read
+
+@pytest.fixture
+def golden():
+    """
+    读取参考工具生成的 golden 文件，文件不存在时跳过测试。
+    """
+    def read(name):
+        path = os.path.join(FIXTURES_DIR, "golden", name)
+        if not os.path.isfile(path):
+            pytest.skip(f"缺少 golden/{name}，运行 tests/fixtures/generate_golden.sh 生成")
+        with open(path, "rb") as file:
+            return file.read()
+    return read
@@ -0,0 +1,22 @@
+#!/bin/sh
+# 用参考工具生成 golden 文件，测试以这些文件校验 script/ 中的编码器
+#
+# 需要 mihomo、sing-box、git 和 Go，生成后提交 golden/ 目录：
+#     sh tests/fixtures/generate_golden.sh
+set -e
+cd "$(dirname "$0")"
+fixtures=$(pwd)
+mkdir -p golden
+
+# mihomo：domain 与 ipcidr 规则集
+mihomo convert-ruleset domain yaml rule_sets/domain.yaml golden/domain.mrs
+mihomo convert-ruleset ipcidr yaml rule_sets/ipcidr.yaml golden/ipcidr.mrs
+
+# sing-box：source JSON 编译为 .srs
+sing-box rule-set compile --output golden/rule_set.srs rule_sets/rule_set.json
+
+# Xray：geosite.dat 由 v2fly/domain-list-community 生成，geosite/ 中每个文件为一个分类
+work=$(mktemp -d)
+trap 'rm -rf "$work"' EXIT
+git clone --depth 1 https://github.com/v2fly/domain-list-community "$work/dlc"
+(cd "$work/dlc" && go run ./ --datapath="$fixtures/geosite" --outputdir="$fixtures/golden" --outputname=geosite.dat)
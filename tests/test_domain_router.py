@@ -0,0 +1,17 @@
+import pytest
+
+from domain_router import format_item, preprocess_for_sorting
+from yaml_payload import iter_payload
+
+@pytest.mark.parametrize("item, expected", [
+    ("+.example.com", "+.example.com"),
+    ("DOMAIN-SUFFIX,a'b.com", "+.a'b.com"),
+    ("DOMAIN,it''s.com", "it''s.com"),
+])
+def test_format_item_round_trip(item, expected):
+    """
+    写入 payload 的域名条目中的单引号被转义，iter_payload 可以读回原值，排序前的还原也不会重复转义。
+    """
+    line = format_item(item, "domain")
+    assert list(iter_payload(["payload:", line])) == [expected]
+    assert format_item(preprocess_for_sorting(line), "domain") == line
@@ -0,0 +1,29 @@
+import json
+import os
+import time
+
+from http_cache import HttpCache
+
+def write_entry(directory, key, size, checked_at):
+    with open(os.path.join(directory, f"{key}.json"), "w", encoding="utf-8") as file:
+        json.dump({"checked_at": checked_at}, file)
+    with open(os.path.join(directory, f"{key}.body"), "wb") as file:
+        file.write(b"x" * size)
+
+def test_prune_removes_stale_temp_files(tmp_path):
+    """
+    中断的下载遗留的临时文件超过 temp_grace 后被删除，仍在宽限期内的临时文件计入总大小。
+    """
+    directory = str(tmp_path)
+    now = time.time()
+    write_entry(directory, "old", 60, now - 10)
+    write_entry(directory, "new", 60, now - 5)
+    fresh = tmp_path / "pending.body.1.2.tmp"
+    fresh.write_bytes(b"y" * 50)
+    stale = tmp_path / "abandoned.json.1.3.tmp"
+    stale.write_bytes(b"z" * 500)
+    os.utime(stale, (now - 7200, now - 7200))
+
+    HttpCache(directory, max_bytes=150, temp_grace=3600).prune()
+
+    assert sorted(os.listdir(directory)) == ["new.body", "new.json", "pending.body.1.2.tmp"]
@@ -0,0 +1,66 @@
+import pytest
+
+zstandard = pytest.importorskip("zstandard")
+
+import mrs_rule_set  # noqa: E402
+from mrs_rule_set import BEHAVIOR_DOMAIN, BEHAVIOR_IPCIDR, domain_set_keys, encode_mrs  # noqa: E402
+
+def decompress(data):
+    with zstandard.ZstdDecompressor().stream_reader(data) as reader:
+        return reader.read()
+
+@pytest.mark.parametrize("entries, keys", [
+    (["+.example.com"], {"example.com", "+.example.com"}),
+    ([".example.com"], {"+.example.com"}),
+    (["*.example.com"], {"*.example.com"}),
+    (["www.example.com"], {"www.example.com"}),
+    (["+.Example.COM", " www.example.com "], {"example.com", "+.example.com", "www.example.com"}),
+    (["+.", ".", "", "a..com", ".a.com."], set()),
+])
+def test_domain_set_keys(entries, keys):
+    """
+    '+.' 同时匹配域名本身和子域名，'.' 只匹配子域名，'*' 与普通域名原样保留，含空标签的条目予以跳过。
+    """
+    assert domain_set_keys(entries) == keys
+
+def test_empty_rule_set_is_skipped():
+    """
+    mihomo 拒绝空规则集，没有有效条目时不生成文件。
+    """
+    assert encode_mrs(["+."], BEHAVIOR_DOMAIN) is None
+    assert encode_mrs([], BEHAVIOR_IPCIDR) is None
+
+def test_ipcidr_ranges_merge_adjacent_networks(payload):
+    """
+    相邻的网段合并为一个区间，IPv4 使用 IPv4 映射地址并排在 IPv6 之前。
+    """
+    assert mrs_rule_set.ip_ranges(payload("ipcidr.yaml")) == [
+        (0xFFFF01010100, 0xFFFF010102FF),
+        (0xFFFF08080808, 0xFFFF08080808),
+        (0x20010DB8 << 96, (0x20010DB8 << 96) | ((1 << 96) - 1)),
+    ]
+
+@pytest.mark.parametrize("name, behavior", [
+    ("domain", BEHAVIOR_DOMAIN),
+    ("ipcidr", BEHAVIOR_IPCIDR),
+])
+def test_matches_mihomo(payload, golden, name, behavior):
+    """
+    解压后的内容与 mihomo convert-ruleset 的输出逐字节一致。
+    """
+    expected = golden(f"{name}.mrs")
+    assert decompress(encode_mrs(payload(f"{name}.yaml"), behavior)) == decompress(expected)
+
+@pytest.mark.parametrize("name, behavior", [
+    ("domain", BEHAVIOR_DOMAIN),
+    ("ipcidr", BEHAVIOR_IPCIDR),
+])
+def test_round_trip(payload, name, behavior):
+    """
+    verify_mrs 接受自身生成的文件，内容被改动时报错。
+    """
+    entries = payload(f"{name}.yaml")
+    data = encode_mrs(entries, behavior)
+    mrs_rule_set.verify_mrs(data, entries, behavior)
+    with pytest.raises(ValueError):
+        mrs_rule_set.verify_mrs(data, entries[:-1], behavior)
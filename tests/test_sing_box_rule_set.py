@@ -0,0 +1,64 @@
+import json
+import os
+import zlib
+
+import pytest
+
+from conftest import FIXTURES_DIR
+from sing_box_rule_set import category_rule_set, domain_matcher_keys, encode_srs, verify_srs
+
+def load_source():
+    with open(os.path.join(FIXTURES_DIR, "rule_sets", "rule_set.json"), encoding="utf-8") as file:
+        return json.load(file)
+
+def test_category_rule_set_matches_source(payload):
+    """
+    fixtures 中的 source JSON 由同一组 payload 生成，golden 文件以它为输入编译。
+    """
+    rule_set, skipped = category_rule_set(payload("domain.yaml"), payload("ipcidr.yaml"), [])
+    assert skipped == 0
+    assert rule_set == load_source()
+
+def test_classic_rules_split_by_field():
+    """
+    端口和进程规则与域名规则之间为“与”，各自生成一条规则；无法转换的经典规则计入跳过数。
+    """
+    rule_set, skipped = category_rule_set([], [], [
+        "DOMAIN-KEYWORD,google",
+        "DST-PORT,443/1000-2000",
+        "PROCESS-NAME,curl",
+        "GEOIP,CN",
+    ])
+    assert skipped == 1
+    assert rule_set["rules"] == [
+        {"domain_keyword": ["google"]},
+        {"port": [443], "port_range": ["1000:2000"]},
+        {"process_name": ["curl"]},
+    ]
+
+def test_domain_matcher_keys():
+    """
+    与 sing-box 的 domain.NewMatcher 一致：'.' 开头的后缀只匹配子域名，与后缀重复的 domain 不再单独插入。
+    """
+    keys = domain_matcher_keys(["example.com", "www.example.org"], ["example.com", ".cdn.example.net"])
+    assert keys == sorted([b"moc.elpmaxe\n", b"ten.elpmaxe.ndc.\r", b"gro.elpmaxe.www"])
+
+def test_matches_sing_box(golden):
+    """
+    版本号与解压后的内容与 sing-box rule-set compile 的输出逐字节一致。
+    """
+    expected = golden("rule_set.srs")
+    data = encode_srs(load_source())
+    assert data[:4] == expected[:4]
+    assert zlib.decompress(data[4:]) == zlib.decompress(expected[4:])
+
+def test_round_trip():
+    """
+    verify_srs 接受自身生成的文件，规则被改动时报错。
+    """
+    rule_set = load_source()
+    data = encode_srs(rule_set)
+    verify_srs(data, rule_set)
+    rule_set["rules"][0]["domain_suffix"].append("example.net")
+    with pytest.raises(ValueError):
+        verify_srs(data, rule_set)
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from conftest import FIXTURES_DIR
+from xray_geodata import (
+    DOMAIN_FULL, DOMAIN_PLAIN, DOMAIN_REGEX, DOMAIN_ROOT, encode_geoip, encode_geosite, read_geosite,
+    site_cidrs, site_domains, verify_geodata,
+)
+
+CODE = "DOMAINROUTER-TEST"  # geosite/ 中 fixture 文件名对应的分类代码
+DLC_TYPES = {"keyword": DOMAIN_PLAIN, "regexp": DOMAIN_REGEX, "domain": DOMAIN_ROOT, "full": DOMAIN_FULL}
+
+def load_dlc_domains():
+    """
+    读取 domain-list-community 格式的 fixture，返回 (类型, 值) 列表。
+    """
+    with open(os.path.join(FIXTURES_DIR, "geosite", CODE.lower()), encoding="utf-8") as file:
+        return [(DLC_TYPES[kind], value) for kind, _, value in (line.strip().partition(":") for line in file)]
+
+def geo_messages():
+    """
+    按 Xray app/router/config.proto 定义 GeoSiteList 与 GeoIPList，由 protobuf 库独立编解码。
+    """
+    descriptor_pb2 = pytest.importorskip("google.protobuf.descriptor_pb2")
+    from google.protobuf import descriptor_pool, message_factory
+
+    field = descriptor_pb2.FieldDescriptorProto
+    proto = descriptor_pb2.FileDescriptorProto(
+        name="domainrouter_test_geodata.proto", package="xray.app.router", syntax="proto3"
+    )
+
+    def message(name, *fields):
+        descriptor = proto.message_type.add(name=name)
+        for number, (field_name, field_type, label, type_name) in enumerate(fields, 1):
+            descriptor.field.add(name=field_name, number=number, type=field_type, label=label, type_name=type_name)
+
+    optional, repeated = field.LABEL_OPTIONAL, field.LABEL_REPEATED
+    message("Domain", ("type", field.TYPE_INT32, optional, None), ("value", field.TYPE_STRING, optional, None))
+    message("CIDR", ("ip", field.TYPE_BYTES, optional, None), ("prefix", field.TYPE_UINT32, optional, None))
+    message("GeoSite", ("country_code", field.TYPE_STRING, optional, None),
+            ("domain", field.TYPE_MESSAGE, repeated, ".xray.app.router.Domain"))
+    message("GeoSiteList", ("entry", field.TYPE_MESSAGE, repeated, ".xray.app.router.GeoSite"))
+    message("GeoIP", ("country_code", field.TYPE_STRING, optional, None),
+            ("cidr", field.TYPE_MESSAGE, repeated, ".xray.app.router.CIDR"))
+    message("GeoIPList", ("entry", field.TYPE_MESSAGE, repeated, ".xray.app.router.GeoIP"))
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(proto)
+    return tuple(
+        message_factory.GetMessageClass(pool.FindMessageTypeByName(f"xray.app.router.{name}"))
+        for name in ("GeoSiteList", "GeoIPList")
+    )
+
+def test_site_domains_match_dlc_fixture(payload):
+    """
+    domain 规则文件转换为 geosite 规则的结果与 domain-list-community 格式的 fixture 一致。
+    """
+    domains, skipped = site_domains(payload("domain.yaml"))
+    assert skipped == 0
+    assert domains == load_dlc_domains()
+
+def test_geosite_matches_protobuf():
+    """
+    geosite.dat 与 protobuf 库按 config.proto 编码的结果逐字节一致。
+    """
+    geo_site_list, _ = geo_messages()
+    sites = {CODE: load_dlc_domains(), "EMPTY": []}
+    expected = geo_site_list()
+    for code, domains in sites.items():
+        entry = expected.entry.add(country_code=code)
+        for domain_type, value in domains:
+            entry.domain.add(type=domain_type, value=value)
+    assert encode_geosite(sites) == expected.SerializeToString()
+
+def test_geoip_matches_protobuf(payload):
+    """
+    geoip.dat 与 protobuf 库按 config.proto 编码的结果逐字节一致，包括前缀长度为 0 的网段。
+    """
+    _, geo_ip_list = geo_messages()
+    sites = {CODE: site_cidrs(payload("ipcidr.yaml") + ["0.0.0.0/0"])}
+    expected = geo_ip_list()
+    entry = expected.entry.add(country_code=CODE)
+    for address, prefix in sites[CODE]:
+        entry.cidr.add(ip=address, prefix=prefix)
+    assert encode_geoip(sites) == expected.SerializeToString()
+
+def test_matches_domain_list_community(golden):
+    """
+    domain-list-community 生成的 geosite.dat 中的规则与由同一 fixture 生成的规则一致。
+    """
+    entries = read_geosite(golden("geosite.dat"))
+    assert sorted(entries[CODE]) == sorted(load_dlc_domains())
+
+def test_round_trip():
+    """
+    verify_geodata 接受自身生成的文件，规则被改动时报错。
+    """
+    sites = {CODE: load_dlc_domains()}
+    data = encode_geosite(sites)
+    verify_geodata(data, sites, read_geosite)
+    with pytest.raises(ValueError):
+        verify_geodata(data, {CODE: sites[CODE][:-1]}, read_geosite)
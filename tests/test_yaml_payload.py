@@ -0,0 +1,49 @@
+import pytest
+import yaml
+
+from yaml_payload import PayloadFormatError, iter_payload, iter_raw_lines
+
+def read(text):
+    return list(iter_payload(text.splitlines()))
+
+@pytest.mark.parametrize("text", [
+    "payload:\n  - '+.example.com'\n  - 'a''b.com'\n",
+    "# NAME: Test\n---\npayload:\n  - \"x\\u00e9.com\"\n  - '1.1.1.0/24' # comment\n...\n",
+    "other: 1\npayload:\n  - +.plain.example.com\n\n  # comment\n  - 'b.com'\n",
+    "payload: # comment\n- 'no-indent.com'\n",
+    "payload:\n  - \"tab\\there.com\"\n  - 'DOMAIN-SUFFIX,example.com'\n",
+])
+def test_matches_safe_load(text):
+    """
+    支持的写法与 yaml.safe_load 的结果一致。
+    """
+    assert read(text) == yaml.safe_load(text)["payload"]
+
+@pytest.mark.parametrize("text", [
+    "payload: ['a.com']\n",  # 流式列表
+    "payload:\n  - 'a.com\n    b'\n",  # 跨行字符串
+    "payload:\n  - 1.0\n",  # 会被解析为数字的普通标量
+    "payload:\n  - yes\n",  # 会被解析为布尔值的普通标量
+    "payload:\n  - 'a.com' trailing\n",  # 标量之后的多余内容
+    "payload:\n  - \"\\q\"\n",  # 不支持的转义
+    "'payload':\n  - 'a.com'\n",  # 带引号的键
+    "\"payload\":\n  - 'a.com'\n",
+    "? payload\n: - 'a.com'\n",
+    "payload:\n  - 'a.com'\npayload:\n  - 'b.com'\n",  # 重复的 payload 键
+    "- 'a.com'\n",  # 顶层不是映射
+    "payload:\n  key: value\n",  # payload 不是列表
+])
+def test_rejects_unsupported(text):
+    """
+    无法逐行可靠读取的写法抛出 PayloadFormatError，由调用方回退到完整解析。
+    """
+    with pytest.raises(PayloadFormatError):
+        read(text)
+
+def test_raw_lines_across_chunks():
+    """
+    按字节块解码时跨块的多字节字符和行保持完整，并去掉 BOM。
+    """
+    data = "\ufeffpayload:\n  - '例子.com'\n  - 'b.com'".encode("utf-8")
+    chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+    assert list(iter_payload(iter_raw_lines(chunks))) == ["例子.com", "b.com"]